@@ -0,0 +1,454 @@
+# Import libraries
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import resource
+import threading
+import subprocess
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from itertools import islice, product
+from multiprocessing import get_context
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Shared modules live next to the Streamlit app in the deployment folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deployment'))
+
+# Source table of the fake PostgreSQL, written once per scale
+SYNTHETIC_REVIEWS = 'synthetic_reviews.parquet'
+
+# Words of the synthetic reviews, padded with numbered filler words to grow the vocabulary
+REVIEW_WORDS = ['flight', 'seat', 'crew', 'staff', 'food', 'meal', 'delay', 'late', 'comfortable', 'friendly',
+                'rude', 'clean', 'dirty', 'boarding', 'gate', 'luggage', 'lost', 'legroom', 'wifi', 'movie',
+                'entertainment', 'price', 'cheap', 'expensive', 'service', 'great', 'terrible', 'excellent',
+                'poor', 'airport', 'lounge', 'check', 'cabin', 'business', 'economy', 'pilot', 'landing',
+                'smooth', 'bumpy', 'recommend', 'never', 'again', 'always', 'good', 'bad', 'value', 'money']
+FILLER_WORDS = 5000
+
+RATING_COLUMNS = ['seat_comfort', 'cabin_staff_service', 'food_beverages', 'ground_service',
+                  'inflight_entertainment', 'wifi_connectivity', 'value_for_money']
+
+def airline_names(n_airlines):
+    return [f'Airline {number:06d}' for number in range(n_airlines)]
+
+def generate_reviews(n_reviews, n_airlines, seed=0):
+    '''Generates synthetic rows of the airline_reviews table.
+
+    Airline popularity follows a Zipf-like distribution, ratings are missing 10% of the time and 2% of the
+    rows are exact duplicates, like the reposts of the real data.
+
+    Parameters:
+        n_reviews (int): Number of rows.
+        n_airlines (int): Number of distinct airlines.
+        seed (int): Random seed, so runs are reproducible.
+
+    Returns:
+        DataFrame: Rows with the columns of the airline_reviews table.
+
+    Usage example:
+        reviews = generate_reviews(100000, 500)
+    '''
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, n_airlines + 1)
+    airlines = np.array(airline_names(n_airlines), dtype=object)[rng.choice(n_airlines, n_reviews, p=popularity / popularity.sum())]
+
+    # Review texts of 5 to 60 words
+    vocabulary = np.array(REVIEW_WORDS + [f'word{number}' for number in range(FILLER_WORDS)], dtype=object)
+    weights = np.concatenate([np.full(len(REVIEW_WORDS), 50.0), np.ones(FILLER_WORDS)])
+    lengths = rng.integers(5, 61, n_reviews)
+    words = vocabulary[rng.choice(len(vocabulary), lengths.sum(), p=weights / weights.sum())]
+    reviews = [' '.join(words[stop - length:stop]) for length, stop in zip(lengths, np.cumsum(lengths))]
+
+    data = pd.DataFrame({'airline_name': airlines,
+                         'overall_rating': rng.integers(1, 11, n_reviews).astype(str),
+                         'review_title': [review[:40] for review in reviews],
+                         'review_date': '1st January 2024',
+                         'verified': rng.random(n_reviews) < 0.7,
+                         'review': reviews,
+                         'aircraft': rng.choice(['A320', 'A350', 'B737', 'B787', None], n_reviews),
+                         'type_of_traveller': rng.choice(['Solo Leisure', 'Couple Leisure', 'Business', 'Family Leisure'], n_reviews),
+                         'seat_type': rng.choice(['Economy Class', 'Premium Economy', 'Business Class', 'First Class'], n_reviews),
+                         'route': rng.choice([f'City {a} to City {b}' for a in range(20) for b in range(5)], n_reviews),
+                         'date_flown': 'January 2024'})
+    for column in RATING_COLUMNS:
+        ratings = rng.integers(1, 6, n_reviews).astype('float64')
+        ratings[rng.random(n_reviews) < 0.1] = np.nan
+        data[column] = ratings
+    data['recommended'] = rng.choice(['yes', 'no'], n_reviews)
+
+    # Reposted reviews
+    duplicates = rng.choice(n_reviews, n_reviews // 50, replace=False)
+    data.iloc[duplicates, 1:] = data.iloc[rng.choice(n_reviews, len(duplicates)), 1:].to_numpy()
+    data.insert(0, 'id', np.arange(1, n_reviews + 1, dtype='int64'))
+    return data
+
+def generate_ratings(n_airlines, seed=0):
+    '''Generates a synthetic per-airline ratings table and a per-seat-type ratings table.
+
+    Parameters:
+        n_airlines (int): Number of airlines.
+        seed (int): Random seed, so runs are reproducible.
+
+    Returns:
+        tuple: Ratings table with avg_* columns and review_count, and the seat_type table.
+
+    Usage example:
+        ratings, seat_ratings = generate_ratings(100000)
+    '''
+    rng = np.random.default_rng(seed)
+    names = airline_names(n_airlines)
+    ratings = pd.DataFrame({'airline_name': names})
+    for column in RATING_COLUMNS:
+        ratings['avg_' + column] = rng.uniform(1, 5, n_airlines)
+    ratings['review_count'] = rng.integers(1, 500, n_airlines)
+
+    seat_ratings = pd.DataFrame({'seat_type': np.repeat(['Economy Class', 'Business Class'], n_airlines),
+                                 'airline_name': names * 2})
+    for column in RATING_COLUMNS:
+        seat_ratings['avg_' + column] = rng.uniform(1, 5, 2 * n_airlines)
+    seat_ratings['review_count'] = rng.integers(1, 300, 2 * n_airlines)
+    return ratings, seat_ratings
+
+class FakeCursor:
+    # Named-cursor stand-in streaming the synthetic table, honouring the watermark of get_data
+    def __init__(self, path):
+        self.path = path
+        self.rows = iter(())
+        self.description = None
+        self.itersize = 2000
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def execute(self, query, params=None):
+        watermark = (params or {}).get('watermark', 0)
+        source = pq.ParquetFile(self.path)
+        self.description = [(name,) for name in source.schema_arrow.names]
+
+        def rows():
+            for batch in source.iter_batches(batch_size=max(self.itersize, 2000)):
+                for row in zip(*batch.to_pydict().values()):
+                    if row[0] > watermark:
+                        yield row
+        self.rows = rows()
+
+    def fetchmany(self, size):
+        return list(islice(self.rows, size))
+
+    def __iter__(self):
+        return self.rows
+
+    def close(self):
+        self.rows = iter(())
+
+class FakeConnection:
+    '''PostgreSQL stand-in serving the synthetic reviews through fake named cursors.
+
+    Usage example:
+        dag.connect_db = lambda: FakeConnection('synthetic_reviews.parquet')
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    def cursor(self, name=None):
+        return FakeCursor(self.path)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+class FakeElasticsearchHandler(BaseHTTPRequestHandler):
+    # Accepts every bulk action, answering like Elasticsearch 7
+    def _send(self, body):
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self._send({'version': {'number': '7.17.0', 'build_flavor': 'default'}, 'tagline': 'You Know, for Search'})
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._send({'acknowledged': True})
+
+    def do_POST(self):
+        lines = self.rfile.read(int(self.headers.get('Content-Length', 0))).splitlines()
+        actions = [json.loads(line) for line in lines[::2] if line.strip()]
+        items = [{action_type: {'_index': meta.get('_index'), '_id': meta.get('_id'), 'status': 201}}
+                 for action in actions for action_type, meta in action.items()]
+        self._send({'took': 1, 'errors': False, 'items': items})
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_elasticsearch():
+    '''Starts the Elasticsearch stand-in on a free local port.
+
+    Parameters:
+        None
+
+    Returns:
+        str: URL of the stand-in.
+
+    Usage example:
+        es = Elasticsearch(start_fake_elasticsearch())
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeElasticsearchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+def synthetic_model(dim=128, oov_buckets=1000, seed=0):
+    '''Builds a NumPy sentiment model with random weights over the synthetic vocabulary.
+
+    Parameters:
+        dim (int): Embedding size, 128 like the NNLM embedding.
+        oov_buckets (int): Number of rows unknown words are hashed into, like the hub module's buckets.
+        seed (int): Random seed.
+
+    Returns:
+        LiteSentimentModel: Model with the same forward pass as the exported model.
+
+    Usage example:
+        model = synthetic_model()
+    '''
+    from lite_model import LiteSentimentModel
+    rng = np.random.default_rng(seed)
+    tokens = REVIEW_WORDS + [f'word{number}' for number in range(FILLER_WORDS)]
+    return LiteSentimentModel(tokens, rng.normal(size=(len(tokens) + oov_buckets, dim)).astype('float32'),
+                              rng.normal(size=(dim, 2)).astype('float32'), np.zeros(2, dtype='float32'), oov_buckets)
+
+def load_dag():
+    # The DAG module talks to the stand-ins instead of PostgreSQL and Elasticsearch
+    import final_project_DAG as dag
+    from elasticsearch import Elasticsearch
+    url = start_fake_elasticsearch()
+    dag.connect_db = lambda: FakeConnection(SYNTHETIC_REVIEWS)
+    dag.Elasticsearch = lambda *args, **kwargs: Elasticsearch(url)
+    return dag
+
+def time_calls(function, arguments):
+    # Latency of every call in milliseconds
+    latencies = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def dag_stage(*names):
+    # Runs the DAG tasks of a stage one after the other, mapped tasks over every partition
+    def run(config):
+        dag = load_dag()
+        start = time.perf_counter()
+        for name in names:
+            getattr(dag, name)()
+        return {'items': config['reviews'], 'seconds': time.perf_counter() - start}
+    return run
+
+def stage_preprocess_text(config):
+    from text_preprocessing import preprocess_text
+    reviews = pd.read_parquet(SYNTHETIC_REVIEWS, columns=['review'])['review'].head(config['queries']).tolist()
+    latencies = time_calls(preprocess_text, reviews)
+    return {'items': len(reviews), 'seconds': sum(latencies) / 1000, 'latencies_ms': latencies}
+
+def stage_predict(config):
+    from batch_predict import load_sentiment_model
+    model = load_sentiment_model(config['model']) if config['model'] else synthetic_model(seed=config['seed'])
+    texts = pd.read_parquet(SYNTHETIC_REVIEWS, columns=['review'])['review'].to_numpy(dtype=object)
+
+    # Single-review requests, then the whole table in batches
+    latencies = time_calls(lambda text: model.predict(np.array([text], dtype=object), verbose=0), texts[:config['queries']])
+    start = time.perf_counter()
+    for offset in range(0, len(texts), config['batch_size']):
+        model.predict(texts[offset:offset + config['batch_size']], batch_size=config['batch_size'], verbose=0)
+    return {'items': len(texts), 'seconds': time.perf_counter() - start, 'latencies_ms': latencies}
+
+def load_recommenders(config):
+    # Precomputed artifacts are placed in the process-wide cache the app reads them from
+    import resources
+    from recommenders import NeighborIndex, Ranking, scale_ratings, build_ranking
+    ratings, seat_ratings = generate_ratings(config['airlines'], config['seed'])
+    start = time.perf_counter()
+    index = NeighborIndex.build(ratings['airline_name'], scale_ratings(ratings))
+    ranking = Ranking(build_ranking(ratings, {'seat_type': seat_ratings}))
+    seconds = time.perf_counter() - start
+    resources.get_resource('neighbor_index', lambda: index)
+    resources.get_resource('ranking', lambda: ranking)
+    queries = np.random.default_rng(config['seed']).choice(ratings['airline_name'], config['queries'])
+    return seconds, queries
+
+def stage_build_recommenders(config):
+    seconds, queries = load_recommenders(config)
+    return {'items': config['airlines'], 'seconds': seconds}
+
+def stage_recommendation(name):
+    def run(config):
+        _, queries = load_recommenders(config)
+        import predict
+        latencies = time_calls(getattr(predict, name), queries)
+        return {'items': len(queries), 'seconds': sum(latencies) / 1000, 'latencies_ms': latencies}
+    return run
+
+# Stages in run order: the DAG tasks read each other's files like in Airflow
+STAGES = {'get_data': dag_stage('get_data'),
+          'clean_data': dag_stage('partition_data', 'clean_data'),
+          'convert_data': dag_stage('convert_data', 'merge_ratings'),
+          'insert_data': dag_stage('insert_data'),
+          'preprocess_text': stage_preprocess_text,
+          'predict': stage_predict,
+          'build_recommenders': stage_build_recommenders,
+          'recommendation_positive': stage_recommendation('recommendation_positive'),
+          'recommendation_negative': stage_recommendation('recommendation_negative')}
+
+def _run_stage(name, config, workdir):
+    os.chdir(workdir)
+    result = STAGES[name](config)
+    result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+def _write_reviews(config, workdir):
+    generate_reviews(config['reviews'], config['airlines'], config['seed']).to_parquet(
+        os.path.join(workdir, SYNTHETIC_REVIEWS), index=False)
+
+def summarize(name, config, runs):
+    '''Combines the repeated runs of a stage into one result record.
+
+    Parameters:
+        name (str): Stage name.
+        config (dict): Scale and settings of the run.
+        runs (list): Results returned by the stage, one per repeat.
+
+    Returns:
+        dict: Throughput, latency percentiles and peak RSS of the stage.
+
+    Usage example:
+        record = summarize('predict', config, runs)
+    '''
+    seconds = np.array([run['seconds'] for run in runs])
+    items = runs[0]['items']
+    record = {'stage': name,
+              'reviews': config['reviews'],
+              'airlines': config['airlines'],
+              'items': items,
+              'seconds_p50': round(float(np.median(seconds)), 4),
+              'items_per_sec': round(items / float(np.median(seconds)), 1) if seconds.any() else None,
+              'peak_rss_mb': max(run['peak_rss_mb'] for run in runs)}
+    latencies = np.concatenate([run.get('latencies_ms', []) for run in runs])
+    if len(latencies):
+        record['latency_ms'] = {name: round(float(np.percentile(latencies, percentile)), 4)
+                                for name, percentile in [('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)]}
+    return record
+
+def compare(results, baseline, tolerance=0.1):
+    '''Compares throughput and p99 latency with an earlier benchmark file.
+
+    Parameters:
+        results (list): Records of this run.
+        baseline (dict): Contents of an earlier output file.
+        tolerance (float): Relative slowdown reported as a regression.
+
+    Returns:
+        list: One record per stage and scale found in both runs.
+
+    Usage example:
+        compare(records, json.load(open('benchmark_old.json')))
+    '''
+    key = lambda record: (record['stage'], record['reviews'], record['airlines'])
+    previous = {key(record): record for record in baseline['results']}
+    comparison = []
+    for record in results:
+        old = previous.get(key(record))
+        if old is None or not old.get('items_per_sec') or not record.get('items_per_sec'):
+            continue
+        change = {'stage': record['stage'], 'reviews': record['reviews'], 'airlines': record['airlines'],
+                  'throughput_ratio': round(record['items_per_sec'] / old['items_per_sec'], 3)}
+        if 'latency_ms' in record and 'latency_ms' in old and old['latency_ms']['p99']:
+            change['p99_ratio'] = round(record['latency_ms']['p99'] / old['latency_ms']['p99'], 3)
+        change['regression'] = (change['throughput_ratio'] < 1 - tolerance
+                                or change.get('p99_ratio', 1) > 1 + tolerance)
+        comparison.append(change)
+    return comparison
+
+def metadata(args):
+    # Environment of the run, so results are only compared like for like
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'arguments': vars(args)}
+
+# Run the benchmarks, e.g. python benchmark.py --reviews 500 100000 --airlines 500 --output benchmark.json
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the DAG tasks, preprocessing, inference and recommenders.')
+    parser.add_argument('--reviews', type=int, nargs='+', default=[500, 10000], help='Numbers of synthetic reviews.')
+    parser.add_argument('--airlines', type=int, nargs='+', default=[500], help='Numbers of synthetic airlines.')
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=list(STAGES), help='Stages to run.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per stage.')
+    parser.add_argument('--queries', type=int, default=1000, help='Number of single requests timed per latency stage.')
+    parser.add_argument('--batch-size', type=int, default=512, help='Batch size of the predict stage.')
+    parser.add_argument('--model', default=None, help='Saved model for the predict stage. Uses random weights when omitted.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark.json', help='JSON file to write the results to.')
+    parser.add_argument('--baseline', default=None, help='Earlier output file to compare with.')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Relative slowdown reported as a regression.')
+    args = parser.parse_args()
+
+    # Every run of a stage gets a fresh process, so peak RSS is measured per stage
+    context = get_context('spawn')
+    results = []
+    for n_reviews, n_airlines in product(args.reviews, args.airlines):
+        config = {'reviews': n_reviews, 'airlines': n_airlines, 'queries': args.queries,
+                  'batch_size': args.batch_size, 'model': args.model and os.path.abspath(args.model), 'seed': args.seed}
+        workdir = tempfile.mkdtemp(prefix='flightbuddy_benchmark_')
+        try:
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                pool.apply(_write_reviews, (config, workdir))
+            for name in args.stages:
+                runs = []
+                for _ in range(args.repeat):
+                    with context.Pool(1, maxtasksperchild=1) as pool:
+                        runs.append(pool.apply(_run_stage, (name, config, workdir)))
+                record = summarize(name, config, runs)
+                results.append(record)
+                print(json.dumps(record))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'meta': metadata(args), 'results': results}
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['comparison'] = compare(results, json.load(f), args.tolerance)
+        for change in report['comparison']:
+            if change['regression']:
+                print('Regression: ', change)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Written: ', args.output)
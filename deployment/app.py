@@ -1,5 +1,8 @@
-import eda, predict
 import streamlit as st
+import resources
+
+# Expose the metrics of this process once, when a metrics port is configured
+resources.metrics_server()
 
 # Add side bar for navigation
 navigation = st.sidebar.selectbox('Navigation', ['Home', 'Exploratory Data Analysis', 'Review Prediction'])
@@ -79,6 +82,9 @@ def show_home():
 if navigation == 'Home':
     show_home()
 elif navigation == 'Exploratory Data Analysis':
+    # Pages are only imported when opened, so the Home page never loads data or the model
+    import eda
     eda.run()
 elif navigation == 'Review Prediction':
+    import predict
     predict.run()
\ No newline at end of file
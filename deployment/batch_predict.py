@@ -0,0 +1,217 @@
+# Import libraries
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from itertools import islice
+from multiprocessing import get_context
+from storage import iter_table, write_table_chunks
+from text_preprocessing import imap_bounded, preprocess_batch
+from prediction_cache import CACHE_PATH, CachedModel, PredictionCache, model_namespace
+
+# Default location of the pre-trained logistic regression model
+MODEL_PATH = os.path.join('unzipped_model', 'model_logreg')
+
+def load_sentiment_model(model_path=MODEL_PATH):
+    '''Loads the pre-trained sentiment model, or its NumPy export when given a .npz file.
+
+    TensorFlow is only imported here, so importing this module stays cheap for the DAG parser.
+
+    Parameters:
+        model_path (str): Path of the saved Keras model, or of a model exported with lite_model.py.
+
+    Returns:
+        Model: The loaded model.
+
+    Usage example:
+        model = load_sentiment_model()
+    '''
+    if model_path.endswith('.npz'):
+        from lite_model import LiteSentimentModel
+        return LiteSentimentModel.load(model_path)
+
+    from tensorflow.keras.models import load_model
+    return load_model(model_path)
+
+def iter_batches(rows, batch_size):
+    '''Groups an iterable of (id, review) pairs into lists of at most batch_size pairs.
+
+    Parameters:
+        rows (iterable): (id, review) pairs.
+        batch_size (int): Maximum number of pairs per batch.
+
+    Returns:
+        generator: Lists of (id, review) pairs.
+
+    Usage example:
+        for batch in iter_batches(zip(ids, reviews), 512):
+            print(len(batch))
+    '''
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def _preprocess_rows(batch):
+    ids, reviews = zip(*batch)
+    return list(ids), preprocess_batch(reviews)
+
+def iter_preprocessed(rows, batch_size=512, workers=os.cpu_count()):
+    '''Preprocesses (id, review) pairs in batches, in worker processes at most two batches per worker ahead of the consumer.
+
+    Parameters:
+        rows (iterable): (id, review) pairs, e.g. streamed from a table.
+        batch_size (int): Number of reviews per batch.
+        workers (int): Number of preprocessing processes. Preprocesses in-process when 1 or less.
+
+    Returns:
+        generator: (ids, preprocessed texts) per batch, in the order of the rows.
+
+    Usage example:
+        for ids, texts in iter_preprocessed(zip(data['id'], data['review'])):
+            print(len(ids))
+    '''
+    batches = iter_batches(((row_id, '' if review is None else str(review)) for row_id, review in rows), batch_size)
+
+    # Spawned workers only import the preprocessing code, never the TensorFlow state of this process
+    pool = get_context('spawn').Pool(workers) if workers and workers > 1 else None
+    try:
+        yield from imap_bounded(pool, _preprocess_rows, batches, 2 * workers) if pool else map(_preprocess_rows, batches)
+    finally:
+        if pool:
+            pool.terminate()
+
+def score_reviews(model, rows, batch_size=512, workers=os.cpu_count()):
+    '''Scores (id, review) pairs in batches, preprocessing upcoming batches in worker processes while the model runs.
+
+    Parameters:
+        model (Model): Loaded sentiment model.
+        rows (iterable): (id, review) pairs, e.g. streamed from a table.
+        batch_size (int): Number of reviews per model call.
+        workers (int): Number of preprocessing processes. Preprocesses in-process when 1 or less.
+
+    Returns:
+        generator: DataFrame chunks with id, predicted_sentiment (1 positive, 0 negative) and positive_probability.
+
+    Usage example:
+        for chunk in score_reviews(model, zip(data['id'], data['review'])):
+            print(chunk.head())
+    '''
+    start = time.perf_counter()
+    scored = 0
+    try:
+        for ids, texts in iter_preprocessed(rows, batch_size, workers):
+            prediction = model.predict(np.array(texts, dtype=object), batch_size=batch_size, verbose=0)
+            scored += len(ids)
+            yield pd.DataFrame({'id': ids,
+                                'predicted_sentiment': np.argmax(prediction, axis=1).astype('int8'),
+                                'positive_probability': prediction[:, 1]})
+    finally:
+        seconds = time.perf_counter() - start
+        stats = {'reviews': scored,
+                 'seconds': round(seconds, 3),
+                 'reviews_per_sec': round(scored / seconds, 1) if seconds else 0.0}
+        if hasattr(model, 'cache'):
+            stats['cache'] = model.cache.metrics()
+        print('Scoring finished: ', stats)
+
+def embed_reviews(model, rows, batch_size=512, workers=os.cpu_count()):
+    '''Computes the review embeddings of (id, review) pairs in batches.
+
+    Parameters:
+        model (CachedModel): Sentiment model with an embed method, e.g. a CachedModel or LiteSentimentModel.
+        rows (iterable): (id, review) pairs, e.g. streamed from a table.
+        batch_size (int): Number of reviews per embedding call.
+        workers (int): Number of preprocessing processes.
+
+    Returns:
+        generator: (ids, float32 embedding matrix) per batch, in the order of the rows.
+
+    Usage example:
+        for ids, vectors in embed_reviews(model, zip(data['id'], data['review'])):
+            print(vectors.shape)
+    '''
+    for ids, texts in iter_preprocessed(rows, batch_size, workers):
+        yield ids, np.asarray(model.embed(np.array(texts, dtype=object)), dtype='float32')
+
+def iter_table_reviews(name, chunk_rows=10000):
+    '''Streams (id, review) pairs from a stored table.
+
+    Parameters:
+        name (str): Table name without extension, e.g. 'airline_reviews_clean'.
+        chunk_rows (int): Number of rows read into memory at once.
+
+    Returns:
+        generator: (id, review) pairs.
+
+    Usage example:
+        rows = iter_table_reviews('airline_reviews_clean')
+    '''
+    for chunk in iter_table(name, chunk_rows=chunk_rows):
+        yield from zip(chunk['id'].tolist(), chunk['review'].tolist())
+
+def iter_postgres_reviews(connection, min_id=0, fetch_size=10000):
+    '''Streams (id, review) pairs from the airline_reviews table through a server-side cursor.
+
+    Parameters:
+        connection (connection): Open psycopg2 connection.
+        min_id (int): Only reviews with a larger id are returned.
+        fetch_size (int): Number of rows fetched per round-trip.
+
+    Returns:
+        generator: (id, review) pairs.
+
+    Usage example:
+        rows = iter_postgres_reviews(connection)
+    '''
+    with connection.cursor(name='score_reviews') as cursor:
+        cursor.itersize = fetch_size
+        cursor.execute('SELECT id, review FROM airline_reviews WHERE id > %s ORDER BY id', (min_id,))
+        yield from cursor
+
+def write_predictions_postgres(connection, chunks):
+    '''Backfills the predicted_sentiment column of airline_reviews, one UPDATE per chunk.
+
+    Parameters:
+        connection (connection): Open psycopg2 connection, separate from any connection still streaming reviews.
+        chunks (iterable): DataFrame chunks from score_reviews.
+
+    Returns:
+        int: Number of rows updated.
+
+    Usage example:
+        write_predictions_postgres(connection, score_reviews(model, rows))
+    '''
+    from psycopg2.extras import execute_values
+
+    updated = 0
+    with connection.cursor() as cursor:
+        for chunk in chunks:
+            execute_values(cursor,
+                           'UPDATE airline_reviews AS r SET predicted_sentiment = v.label '
+                           'FROM (VALUES %s) AS v(id, label) WHERE r.id = v.id',
+                           list(zip(chunk['id'].tolist(), chunk['predicted_sentiment'].tolist())),
+                           page_size=len(chunk))
+            connection.commit()
+            updated += len(chunk)
+    return updated
+
+# Score a stored table from the command line, e.g. python batch_predict.py airline_reviews_clean review_predictions
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Batch sentiment scoring of airline reviews.')
+    parser.add_argument('input', help="Table to score, with 'id' and 'review' columns.")
+    parser.add_argument('output', help='Table to write the predictions to.')
+    parser.add_argument('--model', default=MODEL_PATH, help='Path of the saved Keras model.')
+    parser.add_argument('--batch-size', type=int, default=512, help='Number of reviews per model call.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of preprocessing processes.')
+    parser.add_argument('--cache', default=CACHE_PATH, help="Prediction cache file, or 'none' to score every review.")
+    args = parser.parse_args()
+
+    model = load_sentiment_model(args.model)
+    if args.cache != 'none':
+        model = CachedModel(model, PredictionCache(args.cache, namespace=model_namespace(args.model)))
+    chunks = score_reviews(model, iter_table_reviews(args.input), args.batch_size, args.workers)
+    print('Written: ', write_table_chunks(chunks, args.output))
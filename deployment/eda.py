@@ -5,14 +5,15 @@ import plotly.express as px
 import seaborn as sns
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud
+import resources
 
 # Define custom color palette
 custom_palette = px.colors.qualitative.Set3
 
-# Function to generate word cloud
-def generate_wordcloud(text, title, ax):
-    if text.strip():
-        wordcloud = WordCloud(width=400, height=200, background_color='white').generate(text)
+# Function to generate word cloud from the token frequencies precomputed by the DAG
+def generate_wordcloud(frequencies, title, ax):
+    if frequencies:
+        wordcloud = WordCloud(width=400, height=200, background_color='white').generate_from_frequencies(frequencies)
         ax.imshow(wordcloud, interpolation='bilinear')
         ax.set_title(title, size=15)
         ax.axis('off')
@@ -23,8 +24,8 @@ def generate_wordcloud(text, title, ax):
 
 # Create the main program
 def run():
-    # Load the dataset
-    data = pd.read_csv('airline_review_cleaned.csv')
+    # Load the precomputed statistics once per process, the page never reads the reviews themselves
+    stats = resources.eda_stats()
     
     # Add title to the app
     st.title('Exploratory Data Analysis')
@@ -32,18 +33,17 @@ def run():
     # Checkbox to display raw data
     if st.checkbox('Show raw data'):
         st.markdown('#### Raw Data')
-        st.write(data)
+        st.write(resources.reviews())
     
     # Dropdown for different analysis options
-    option = st.selectbox('Select Analysis', ('Overview', 'Distribution Plots', 'Categorical Analysis', 'Correlation Heatmap', 'Word Cloud'))
+    option = st.selectbox('Select Analysis', ('Overview', 'Distribution Plots', 'Categorical Analysis', 'Correlation Heatmap', 'Word Cloud', 'Review Search'))
     
     # Overview analysis
     if option == 'Overview':
         st.subheader('Dataset Overview')
         st.write('This dataset contains reviews from airline passengers along with their ratings on various aspects of the flight.')
         st.markdown('###### Summary Statistics')
-        numerical_columns = data[['seat_comfort', 'cabin_staff_service', 'food_and_beverages', 'ground_service', 'inflight_entertainment', 'wifi_and_connectivity', 'value_for_money']]
-        st.write(numerical_columns.describe())
+        st.write(pd.DataFrame({column: summary['describe'] for column, summary in stats['numeric'].items()}))
         st.markdown('''The statistical description of the dataset reveals several insights: The columns `Seat Comfort`, `Cabin Staff Service`, `Food & Beverages`, `Ground Service`, `Inflight Entertainment`, `Wifi & Connectivity`, and `Value For Money` exhibit varying means, indicating differences in satisfaction levels across these aspects. The standard deviations suggest differing degrees of dispersion or variability in ratings across these aspects. The minimum and maximum values reflect the range of ratings given by reviewers, spanning from 0 to 5. Additionally, the quartiles (25th, 50th, and 75th percentiles) provide a snapshot of the distribution of ratings, highlighting median values and the spread of data around these central values.''')
     
     # Distribution plots analysis
@@ -64,7 +64,8 @@ def run():
             }
         
         for idx, col in enumerate(numerical_columns):
-            fig = px.histogram(data, x=col, title=f'Distribution of {col.title().replace("_", " ")}', nbins=30, color_discrete_sequence=[custom_palette[idx]])
+            counts = pd.DataFrame(stats['numeric'][col]['values'], columns=[col, 'count'])
+            fig = px.bar(counts, x=col, y='count', title=f'Distribution of {col.title().replace("_", " ")}', color_discrete_sequence=[custom_palette[idx]])
             st.plotly_chart(fig)
             st.markdown(column_descriptions[col])
     
@@ -82,7 +83,8 @@ def run():
             'recommended': "More reviews do not recommend the airline compared to those that do. This may indicate that there are issues or dissatisfaction among many users with the services provided by the airline."
         }
         for idx, col in enumerate(categorical_columns):
-            fig = px.histogram(data, x=col, title=f'{col.title().replace("_", " ")} Distribution', color_discrete_sequence=[custom_palette[idx]])
+            counts = pd.DataFrame(stats['categorical'][col], columns=[col, 'count'])
+            fig = px.bar(counts, x=col, y='count', title=f'{col.title().replace("_", " ")} Distribution', color_discrete_sequence=[custom_palette[idx]])
             st.plotly_chart(fig)
             st.markdown(column_descriptions[col])
 
@@ -97,31 +99,50 @@ def run():
                 fig, ax = plt.subplots(figsize=(10, 5))
                 
                 if wordcloud_option == 'All Reviews':
-                    all_text = ' '.join(data['review'].dropna())
-                    generate_wordcloud(all_text, 'Word Cloud - All Reviews', ax)
+                    generate_wordcloud(stats['tokens'].get('all'), 'Word Cloud - All Reviews', ax)
                     st.pyplot(fig)
                     st.markdown('''In the word cloud for all reviews, the most prominent words are `flight,` `airline,` `seat,` `time,` `check,` `plane,` and `staff.` These words suggest that passengers commonly discuss aspects of the flight itself, including timing and seating arrangements, as well as interactions with airline staff and the overall airline experience.''')
                 elif wordcloud_option == 'Recommended (Yes)':
-                    recommended_yes_text = ' '.join(data[data['recommended'] == 'yes']['review'].dropna())
-                    generate_wordcloud(recommended_yes_text, 'Word Cloud - Recommended (Yes)', ax)
+                    generate_wordcloud(stats['tokens'].get('yes'), 'Word Cloud - Recommended (Yes)', ax)
                     st.pyplot(fig)
                     st.markdown('''In the word cloud for recommended reviews, the dominant words include `flight,` `seat,` `time,` `good,` `service,` `staff,` and `airline.` Positive reviews emphasize `good` and `service,` indicating that passengers who recommend the airline often appreciate the quality of service, the condition of seats, and the timely operation of flights.''')
                 elif wordcloud_option == 'Recommended (No)':
-                    recommended_no_text = ' '.join(data[data['recommended'] == 'no']['review'].dropna())
-                    generate_wordcloud(recommended_no_text, 'Word Cloud - Recommended (No)', ax)
+                    generate_wordcloud(stats['tokens'].get('no'), 'Word Cloud - Recommended (No)', ax)
                     st.pyplot(fig)
                     st.markdown('''For not recommended reviews, the key words are `flight,` `check,` `time,` `seat,` `service,` `staff,` and `airport.` Negative reviews focus on issues such as the check-in process, waiting times, and customer service problems. The prominence of `check` and `time` indicates dissatisfaction with delays and the efficiency of airline operations.''')
 
     # Correlation heatmap analysis
     elif option == 'Correlation Heatmap':
         st.subheader('Correlation Heatmap')
-        numerical_columns = data[['seat_comfort', 'cabin_staff_service', 'food_and_beverages', 'ground_service', 'inflight_entertainment', 'wifi_and_connectivity', 'value_for_money']]
-        corr = numerical_columns.corr()
+        correlation = stats['correlation']
+        corr = pd.DataFrame(correlation['matrix'], index=correlation['columns'], columns=correlation['columns'], dtype='float64')
         fig, ax = plt.subplots(figsize=(10, 8))
         sns.heatmap(corr, annot=True, cmap='coolwarm', fmt=".2f", vmin=-1, vmax=1, ax=ax)
         st.pyplot(fig)
         st.markdown('''The correlation heatmap reveals key relationships between different aspects of passenger satisfaction: There is a strong positive correlation (0.71) between seat comfort and perceived value for money, indicating that comfortable seating significantly enhances passengers' perception of value. Service categories such as cabin staff service, food and beverages, and ground service show strong correlations (around 0.6 to 0.7) with each other, suggesting that satisfaction in one area tends to align with satisfaction in others. WiFi and connectivity show weaker correlations (around 0.2 to 0.4) with other metrics, indicating they have less impact on overall passenger satisfaction. Inflight entertainment has a moderate influence, with some correlations to other services, suggesting it plays a contributing but not dominant role in overall satisfaction. Overall, the heatmap suggests that focusing on improving seat comfort and integrated service quality could notably enhance overall passenger satisfaction.''')
 
+    # Review search analysis
+    elif option == 'Review Search':
+        st.subheader('Review Search')
+        search = resources.review_search()
+        options = resources.review_options()
+        text = st.text_input('Keywords', placeholder='e.g. legroom delay')
+        seat_type = st.selectbox('Seat Type', ['All'] + options['seat_type'])
+        type_of_traveller = st.selectbox('Type of Traveller', ['All'] + options['type_of_traveller'])
+        recommended = st.selectbox('Recommended', ['All', 'yes', 'no'])
+        filters = {'seat_type': None if seat_type == 'All' else seat_type,
+                   'type_of_traveller': None if type_of_traveller == 'All' else type_of_traveller,
+                   'recommended': None if recommended == 'All' else recommended}
+
+        # Airlines with the most matching reviews, aggregated by the search backend
+        st.markdown('###### Airlines')
+        st.write(search.airline_summary(text or None, **filters))
+
+        # Best matching reviews
+        reviews, total = search.search(text or None, size=20, **filters)
+        st.markdown(f'###### Reviews ({total} matches)')
+        st.write(reviews)
+
 # Run the app
 if __name__ == '__main__':
     run()
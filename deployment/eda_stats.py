@@ -0,0 +1,238 @@
+# Import libraries
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+from collections import Counter
+
+# Default location of the artifact rendered by the Exploratory Data Analysis page
+EDA_STATS_PATH = 'eda_stats.json'
+
+# Columns summarised for the page, named like the notebook's cleaned dataset
+NUMERIC_COLUMNS = ['seat_comfort', 'cabin_staff_service', 'food_and_beverages', 'ground_service',
+                   'inflight_entertainment', 'wifi_and_connectivity', 'value_for_money']
+CATEGORICAL_COLUMNS = ['verified', 'type_of_traveller', 'seat_type', 'recommended']
+
+# DAG column names mapped to the names of the page
+COLUMN_ALIASES = {'food_beverages': 'food_and_beverages', 'wifi_connectivity': 'wifi_and_connectivity'}
+
+# Words as split by WordCloud
+token_pattern = re.compile(r"\w[\w']+")
+
+class EdaStats:
+    '''Accumulates the statistics of the Exploratory Data Analysis page over chunks of reviews in a single pass.
+
+    Summary statistics and histograms come from exact value counts, the correlation matrix from pairwise
+    sums of products, and the word clouds from token counts per recommended class, so the page never
+    touches the reviews themselves.
+
+    Usage example:
+        stats = EdaStats()
+        for chunk in iter_table('airline_reviews_clean'):
+            stats.partial_fit(chunk)
+        stats.write('eda_stats.json')
+    '''
+
+    def __init__(self, max_values=1000, max_tokens=20000):
+        self.max_values = max_values
+        self.max_tokens = max_tokens
+        self.rows = 0
+
+        # Value counts per numerical and categorical column, moments per numerical column
+        self.value_counts = {column: Counter() for column in NUMERIC_COLUMNS + CATEGORICAL_COLUMNS}
+        self.moments = {column: [0, 0.0, 0.0] for column in NUMERIC_COLUMNS}
+
+        # Pairwise-complete counts and sums for the correlation matrix
+        size = len(NUMERIC_COLUMNS)
+        self.pair_count = np.zeros((size, size))
+        self.pair_sum = np.zeros((size, size))
+        self.pair_sumsq = np.zeros((size, size))
+        self.pair_product = np.zeros((size, size))
+
+        # Token counts per recommended class
+        self.tokens = {}
+        self._stopwords = None
+
+    def _stopword_set(self):
+        # The stopwords WordCloud.generate removes, or NLTK's when wordcloud is not installed
+        if self._stopwords is None:
+            try:
+                from wordcloud import STOPWORDS
+                self._stopwords = set(STOPWORDS)
+            except ImportError:
+                from nltk.corpus import stopwords
+                self._stopwords = set(stopwords.words('english'))
+        return self._stopwords
+
+    def partial_fit(self, chunk):
+        '''Updates the statistics with one chunk of reviews.
+
+        Parameters:
+            chunk (DataFrame): Reviews with the DAG or notebook column names.
+
+        Returns:
+            EdaStats: The updated statistics.
+
+        Usage example:
+            stats.partial_fit(data)
+        '''
+        chunk = chunk.rename(columns=COLUMN_ALIASES)
+        self.rows += len(chunk)
+
+        for column in [column for column in CATEGORICAL_COLUMNS if column in chunk.columns]:
+            self.value_counts[column].update({str(value): int(count) for value, count in chunk[column].value_counts().items()})
+
+        numeric = chunk.reindex(columns=NUMERIC_COLUMNS).astype('float64')
+        for column in NUMERIC_COLUMNS:
+            values = numeric[column].dropna()
+            count, total, squares = self.moments[column]
+            self.moments[column] = [count + len(values), total + float(values.sum()), squares + float((values ** 2).sum())]
+            if self.value_counts[column] is not None:
+                self.value_counts[column].update({float(value): int(n) for value, n in values.value_counts().items()})
+                if len(self.value_counts[column]) > self.max_values:
+                    self.value_counts[column] = None
+
+        # Every pair of columns only counts the rows where both are present, like DataFrame.corr
+        present = numeric.notna().to_numpy(dtype='float64')
+        values = numeric.fillna(0).to_numpy()
+        self.pair_count += present.T @ present
+        self.pair_sum += values.T @ present
+        self.pair_sumsq += (values ** 2).T @ present
+        self.pair_product += values.T @ values
+
+        if 'review' in chunk.columns:
+            stopwords = self._stopword_set()
+            classes = chunk['recommended'].astype(str) if 'recommended' in chunk.columns else pd.Series('all', index=chunk.index)
+            for label, reviews in chunk['review'].dropna().astype(str).groupby(classes):
+                counts = self.tokens.setdefault(label, Counter())
+                for review in reviews:
+                    counts.update(token for token in token_pattern.findall(review.lower())
+                                  if token not in stopwords and not token.isdigit())
+
+                # Only the most frequent tokens matter for a word cloud
+                if len(counts) > 2 * self.max_tokens:
+                    self.tokens[label] = Counter(dict(counts.most_common(self.max_tokens)))
+        return self
+
+    @staticmethod
+    def _quantile(value_counts, q):
+        # Linear interpolation between the ranks around q, like Series.quantile
+        values = np.array(sorted(value_counts))
+        cumulative = np.cumsum([value_counts[value] for value in values])
+        position = q * (cumulative[-1] - 1)
+        lower = values[np.searchsorted(cumulative, np.floor(position), side='right')]
+        upper = values[np.searchsorted(cumulative, np.ceil(position), side='right')]
+        return float(lower + (upper - lower) * (position - np.floor(position)))
+
+    def summary(self, top_tokens=500):
+        '''Computes the compact artifact rendered by the page.
+
+        Parameters:
+            top_tokens (int): Number of tokens kept per word cloud.
+
+        Returns:
+            dict: Row count, per-column summaries and value counts, correlation matrix and token frequencies.
+
+        Usage example:
+            summary = stats.summary()
+        '''
+        numeric = {}
+        for column in NUMERIC_COLUMNS:
+            count, total, squares = self.moments[column]
+            value_counts = self.value_counts[column]
+            describe = {'count': count,
+                        'mean': total / count if count else None,
+                        'std': float(np.sqrt(max(squares - total ** 2 / count, 0) / (count - 1))) if count > 1 else None}
+            if value_counts:
+                describe.update({'min': float(min(value_counts)),
+                                 '25%': self._quantile(value_counts, 0.25),
+                                 '50%': self._quantile(value_counts, 0.5),
+                                 '75%': self._quantile(value_counts, 0.75),
+                                 'max': float(max(value_counts))})
+            numeric[column] = {'describe': describe,
+                               'values': sorted(value_counts.items()) if value_counts else []}
+
+        n, sums, squares, products = self.pair_count, self.pair_sum, self.pair_sumsq, self.pair_product
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = (n * products - sums * sums.T) / np.sqrt((n * squares - sums ** 2) * (n * squares.T - sums.T ** 2))
+
+        all_tokens = Counter()
+        for counts in self.tokens.values():
+            all_tokens.update(counts)
+        tokens = {label: dict(counts.most_common(top_tokens)) for label, counts in self.tokens.items()}
+        tokens['all'] = dict(all_tokens.most_common(top_tokens))
+
+        return {'rows': self.rows,
+                'numeric': numeric,
+                'categorical': {column: self.value_counts[column].most_common() for column in CATEGORICAL_COLUMNS},
+                'correlation': {'columns': NUMERIC_COLUMNS,
+                                'matrix': [[None if np.isnan(value) else round(float(value), 6) for value in row]
+                                           for row in correlation]},
+                'tokens': tokens}
+
+    def write(self, path=EDA_STATS_PATH):
+        '''Writes the artifact rendered by the page.
+
+        Parameters:
+            path (str): JSON file to write.
+
+        Returns:
+            None
+
+        Usage example:
+            stats.write('eda_stats.json')
+        '''
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.summary(), f)
+        os.replace(tmp_path, path)
+
+    def save(self, path):
+        '''Persists the accumulated statistics, so later runs only add their new reviews.
+
+        Parameters:
+            path (str): JSON file to write.
+
+        Returns:
+            None
+
+        Usage example:
+            stats.save('eda_state.json')
+        '''
+        state = {'max_values': self.max_values,
+                 'max_tokens': self.max_tokens,
+                 'rows': self.rows,
+                 'value_counts': {column: None if counts is None else list(counts.items())
+                                  for column, counts in self.value_counts.items()},
+                 'moments': self.moments,
+                 'pairs': [self.pair_count.tolist(), self.pair_sum.tolist(), self.pair_sumsq.tolist(), self.pair_product.tolist()],
+                 'tokens': self.tokens}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        '''Loads statistics saved with save.
+
+        Parameters:
+            path (str): JSON file to read.
+
+        Returns:
+            EdaStats: The accumulated statistics.
+
+        Usage example:
+            stats = EdaStats.load('eda_state.json')
+        '''
+        with open(path) as f:
+            state = json.load(f)
+        stats = cls(state['max_values'], state['max_tokens'])
+        stats.rows = state['rows']
+        stats.value_counts = {column: None if counts is None else Counter(dict((value, count) for value, count in counts))
+                              for column, counts in state['value_counts'].items()}
+        stats.moments = state['moments']
+        stats.pair_count, stats.pair_sum, stats.pair_sumsq, stats.pair_product = [np.array(pairs) for pairs in state['pairs']]
+        stats.tokens = {label: Counter(counts) for label, counts in state['tokens'].items()}
+        return stats
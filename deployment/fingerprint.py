@@ -0,0 +1,141 @@
+# Import libraries
+import struct
+
+# FarmHash Fingerprint64 in pure Python, the hash TensorFlow's to_hash_bucket_fast and vocabulary tables use
+# for out-of-vocabulary buckets. It only runs on the few words outside a vocabulary, so speed is secondary
+
+# 64-bit wrapping arithmetic and the constants of FarmHash
+MASK = (1 << 64) - 1
+K0, K1, K2 = 0xc3a5c85c97cb3127, 0xb492b66fbe98f273, 0x9ae16a3b2f90404f
+
+def _fetch64(data, offset):
+    return struct.unpack_from('<Q', data, offset)[0]
+
+def _fetch32(data, offset):
+    return struct.unpack_from('<I', data, offset)[0]
+
+def _rotate(value, shift):
+    return ((value >> shift) | (value << (64 - shift))) & MASK if shift else value
+
+def _shift_mix(value):
+    return value ^ (value >> 47)
+
+def _hash_len16(u, v, mul):
+    a = ((u ^ v) * mul) & MASK
+    a ^= a >> 47
+    b = ((v ^ a) * mul) & MASK
+    b ^= b >> 47
+    return (b * mul) & MASK
+
+def _hash_len0to16(data):
+    length = len(data)
+    if length >= 8:
+        mul = K2 + length * 2
+        a = (_fetch64(data, 0) + K2) & MASK
+        b = _fetch64(data, length - 8)
+        c = (_rotate(b, 37) * mul + a) & MASK
+        d = ((_rotate(a, 25) + b) * mul) & MASK
+        return _hash_len16(c, d, mul)
+    if length >= 4:
+        mul = K2 + length * 2
+        a = _fetch32(data, 0)
+        return _hash_len16((length + (a << 3)) & MASK, _fetch32(data, length - 4), mul)
+    if length > 0:
+        a, b, c = data[0], data[length >> 1], data[length - 1]
+        y = (a + (b << 8)) & 0xffffffff
+        z = (length + (c << 2)) & 0xffffffff
+        return (_shift_mix(((y * K2) ^ (z * K0)) & MASK) * K2) & MASK
+    return K2
+
+def _hash_len17to32(data):
+    length = len(data)
+    mul = K2 + length * 2
+    a = (_fetch64(data, 0) * K1) & MASK
+    b = _fetch64(data, 8)
+    c = (_fetch64(data, length - 8) * mul) & MASK
+    d = (_fetch64(data, length - 16) * K2) & MASK
+    return _hash_len16((_rotate((a + b) & MASK, 43) + _rotate(c, 30) + d) & MASK,
+                       (a + _rotate((b + K2) & MASK, 18) + c) & MASK, mul)
+
+def _hash_len33to64(data):
+    length = len(data)
+    mul = K2 + length * 2
+    a = (_fetch64(data, 0) * K2) & MASK
+    b = _fetch64(data, 8)
+    c = (_fetch64(data, length - 8) * mul) & MASK
+    d = (_fetch64(data, length - 16) * K2) & MASK
+    y = (_rotate((a + b) & MASK, 43) + _rotate(c, 30) + d) & MASK
+    z = _hash_len16(y, (a + _rotate((b + K2) & MASK, 18) + c) & MASK, mul)
+    e = (_fetch64(data, 16) * mul) & MASK
+    f = _fetch64(data, 24)
+    g = ((y + _fetch64(data, length - 32)) * mul) & MASK
+    h = ((z + _fetch64(data, length - 24)) * mul) & MASK
+    return _hash_len16((_rotate((e + f) & MASK, 43) + _rotate(g, 30) + h) & MASK,
+                       (e + _rotate((f + a) & MASK, 18) + g) & MASK, mul)
+
+def _weak_hash_len32_with_seeds(data, offset, a, b):
+    w, x, y, z = (_fetch64(data, offset + 8 * i) for i in range(4))
+    a = (a + w) & MASK
+    b = _rotate((b + a + z) & MASK, 21)
+    c = a
+    a = (a + x + y) & MASK
+    b = (b + _rotate(a, 44)) & MASK
+    return (a + z) & MASK, (b + c) & MASK
+
+def fingerprint64(data):
+    '''Computes the FarmHash Fingerprint64 of bytes, equal to farmhash::Fingerprint64 and TensorFlow's string fingerprint.
+
+    Parameters:
+        data (bytes): Bytes to hash, e.g. a UTF-8 encoded token.
+
+    Returns:
+        int: Unsigned 64-bit fingerprint.
+
+    Usage example:
+        bucket = fingerprint64('halo'.encode()) % oov_buckets
+    '''
+    length = len(data)
+    if length <= 16:
+        return _hash_len0to16(data)
+    if length <= 32:
+        return _hash_len17to32(data)
+    if length <= 64:
+        return _hash_len33to64(data)
+    # Longer inputs are mixed 64 bytes at a time
+    seed = 81
+    x = seed
+    y = (seed * K1 + 113) & MASK
+    z = (_shift_mix((y * K2 + 113) & MASK) * K2) & MASK
+    v = (0, 0)
+    w = (0, 0)
+    x = (x * K2 + _fetch64(data, 0)) & MASK
+    end = ((length - 1) // 64) * 64
+    last64 = end + ((length - 1) & 63) - 63
+    offset = 0
+    while True:
+        x = (_rotate((x + y + v[0] + _fetch64(data, offset + 8)) & MASK, 37) * K1) & MASK
+        y = (_rotate((y + v[1] + _fetch64(data, offset + 48)) & MASK, 42) * K1) & MASK
+        x ^= w[1]
+        y = (y + v[0] + _fetch64(data, offset + 40)) & MASK
+        z = (_rotate((z + w[0]) & MASK, 33) * K1) & MASK
+        v = _weak_hash_len32_with_seeds(data, offset, (v[1] * K1) & MASK, (x + w[0]) & MASK)
+        w = _weak_hash_len32_with_seeds(data, offset + 32, (z + w[1]) & MASK, (y + _fetch64(data, offset + 16)) & MASK)
+        z, x = x, z
+        offset += 64
+        if offset == end:
+            break
+    mul = K1 + ((z & 0xff) << 1)
+    offset = last64
+    w = ((w[0] + ((length - 1) & 63)) & MASK, w[1])
+    v = ((v[0] + w[0]) & MASK, v[1])
+    w = ((w[0] + v[0]) & MASK, w[1])
+    x = (_rotate((x + y + v[0] + _fetch64(data, offset + 8)) & MASK, 37) * mul) & MASK
+    y = (_rotate((y + v[1] + _fetch64(data, offset + 48)) & MASK, 42) * mul) & MASK
+    x ^= (w[1] * 9) & MASK
+    y = (y + v[0] * 9 + _fetch64(data, offset + 40)) & MASK
+    z = (_rotate((z + w[0]) & MASK, 33) * mul) & MASK
+    v = _weak_hash_len32_with_seeds(data, offset, (v[1] * mul) & MASK, (x + w[0]) & MASK)
+    w = _weak_hash_len32_with_seeds(data, offset + 32, (z + w[1]) & MASK, (y + _fetch64(data, offset + 16)) & MASK)
+    z, x = x, z
+    return _hash_len16((_hash_len16(v[0], w[0], mul) + _shift_mix(y) * K0 + z) & MASK,
+                       (_hash_len16(v[1], w[1], mul) + x) & MASK, mul)
@@ -0,0 +1,418 @@
+# Import libraries
+import os
+import sys
+import json
+import time
+import bisect
+import logging
+import functools
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metrics are recorded unless FLIGHTBUDDY_METRICS=0, the profiler only samples when a slow threshold is set
+ENABLED = os.environ.get('FLIGHTBUDDY_METRICS', '1') != '0'
+PROFILE_SLOW_MS = float(os.environ.get('FLIGHTBUDDY_PROFILE_SLOW_MS', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('FLIGHTBUDDY_PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.environ.get('FLIGHTBUDDY_PROFILE_DIR', 'profiles')
+
+# Upper bounds in seconds of the latency histogram buckets, from a single prediction up to a full DAG task
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+# Amounts recorded outside of any stage, e.g. by writer threads
+UNATTRIBUTED = 'other'
+
+# Structured log lines, one JSON object per finished stage
+logger = logging.getLogger('flightbuddy.metrics')
+
+# Process-wide registry: latency histograms per stage and labels, counters per amount, stage and labels
+_lock = threading.Lock()
+_histograms = {}
+_counters = Counter()
+_local = threading.local()
+
+def _key(stage, labels):
+    return (stage,) + tuple(sorted(labels.items()))
+
+def _spans():
+    # Stack of the open stages of the calling thread
+    spans = getattr(_local, 'spans', None)
+    if spans is None:
+        spans = _local.spans = []
+    return spans
+
+class _NullSpan:
+    # Returned by timer when metrics are disabled, so instrumented code pays a single check
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        return False
+    def record(self, **amounts):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class Span:
+    '''Times one execution of a stage and collects the amounts processed within it.
+
+    Created by timer. On exit the duration goes to the latency histogram of the stage, the amounts to its
+    counters, and a structured log line is emitted.
+
+    Usage example:
+        with timer('clean_data', partition=3) as span:
+            span.record(rows=len(data))
+    '''
+
+    __slots__ = ('stage', 'labels', 'amounts', 'start', 'profiled')
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.amounts = Counter()
+        self.profiled = False
+
+    def record(self, **amounts):
+        '''Adds amounts processed within the stage, e.g. rows, bytes_read or bytes_written.
+
+        Parameters:
+            **amounts (int): Amount per counter name.
+
+        Returns:
+            None
+
+        Usage example:
+            span.record(rows=len(chunk), bytes_read=size)
+        '''
+        self.amounts.update(amounts)
+
+    def __enter__(self):
+        spans = _spans()
+
+        # Only the outermost stage of a thread is sampled, its stacks include the nested stages
+        if PROFILE_SLOW_MS > 0 and not spans:
+            profiler().start()
+            self.profiled = True
+        spans.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start
+        _spans().pop()
+        key = _key(self.stage, self.labels)
+        with _lock:
+            histogram = _histograms.get(key)
+            if histogram is None:
+                histogram = _histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+            histogram[0][bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+            histogram[1] += duration
+            for name, amount in self.amounts.items():
+                _counters[(name,) + key] += amount
+            if exc_type is not None:
+                _counters[('errors',) + key] += 1
+
+        profile = None
+        if self.profiled:
+            stacks = profiler().stop()
+            if duration * 1000 >= PROFILE_SLOW_MS:
+                profile = dump_profile(self.stage, stacks)
+        if logger.isEnabledFor(logging.INFO):
+            # The stage's own fields come first, then the amounts, then the labels. A name already taken is prefixed instead
+            fields = {'stage': self.stage, 'duration_ms': round(duration * 1000, 3), 'error': exc_type is not None, 'profile': profile}
+            for prefix, values in [('amount_', self.amounts), ('label_', self.labels)]:
+                for name, value in values.items():
+                    fields[prefix + name if name in fields or name in ('event', 'time') else name] = value
+            log_event('stage', **fields)
+        return False
+
+def timer(stage, **labels):
+    '''Times a stage of the app, the service or the DAG.
+
+    Parameters:
+        stage (str): Name of the stage.
+        **labels (str): Labels told apart in the exported metrics, e.g. the partition of a mapped task.
+
+    Returns:
+        Span: Context manager timing the block, a no-op when metrics are disabled.
+
+    Usage example:
+        with timer('preprocess_text'):
+            processed_text = preprocess_text(review_text)
+    '''
+    if not ENABLED:
+        return _NULL_SPAN
+    return Span(stage, {name: str(value) for name, value in labels.items()})
+
+def timed(stage=None):
+    '''Decorator timing every call of a function as a stage.
+
+    The wrapper keeps the signature of the function, so Airflow still passes only the arguments it accepts.
+
+    Parameters:
+        stage (str): Name of the stage. Defaults to the function name.
+
+    Returns:
+        function: Decorator, returning the function unchanged when metrics are disabled.
+
+    Usage example:
+        @timed('recommendation_positive')
+        def recommendation_positive(airline, n_recommendations=5):
+            ...
+    '''
+    def decorate(function):
+        if not ENABLED:
+            return function
+        name = stage or function.__name__
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Span(name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def record(**amounts):
+    '''Adds amounts to the innermost stage of the calling thread, e.g. from the storage functions.
+
+    Parameters:
+        **amounts (int): Amount per counter name.
+
+    Returns:
+        None
+
+    Usage example:
+        record(rows=len(data), bytes_written=os.path.getsize(path))
+    '''
+    if not ENABLED:
+        return
+    spans = _spans()
+    if spans:
+        spans[-1].amounts.update(amounts)
+        return
+    key = _key(UNATTRIBUTED, {})
+    with _lock:
+        for name, amount in amounts.items():
+            _counters[(name,) + key] += amount
+
+def log_event(event, **fields):
+    '''Emits one structured log line as a JSON object.
+
+    Parameters:
+        event (str): Kind of event.
+        **fields: JSON-serialisable fields of the event.
+
+    Returns:
+        None
+
+    Usage example:
+        log_event('watermark', watermark=1200)
+    '''
+    logger.info(json.dumps({'event': event, 'time': round(time.time(), 3), **fields}, default=str))
+
+def reset():
+    # Forget every recorded metric, e.g. between benchmark runs
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+def _labels(key, **extra):
+    pairs = list(zip(['stage'], key[:1])) + list(key[1:]) + list(extra.items())
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def render_prometheus(prefix='flightbuddy'):
+    '''Renders every recorded metric in the Prometheus text exposition format.
+
+    Exports per stage a latency histogram, the counters of its amounts, and the hit ratio of the prediction cache.
+
+    Parameters:
+        prefix (str): Prefix of the metric names.
+
+    Returns:
+        str: Metrics in the Prometheus text format.
+
+    Usage example:
+        print(render_prometheus())
+    '''
+    with _lock:
+        histograms = {key: (list(buckets), total) for key, (buckets, total) in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = [f'# HELP {prefix}_stage_duration_seconds Latency of every stage.',
+             f'# TYPE {prefix}_stage_duration_seconds histogram']
+    for key, (buckets, total) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+            cumulative += count
+            lines.append(f'{prefix}_stage_duration_seconds_bucket{_labels(key, le=bound)} {cumulative}')
+        lines.append(f'{prefix}_stage_duration_seconds_sum{_labels(key)} {total:.6f}')
+        lines.append(f'{prefix}_stage_duration_seconds_count{_labels(key)} {cumulative}')
+
+    for name in sorted({key[0] for key in counters}):
+        lines += [f'# HELP {prefix}_{name}_total Amount of {name.replace("_", " ")} per stage.',
+                  f'# TYPE {prefix}_{name}_total counter']
+        lines += [f'{prefix}_{name}_total{_labels(key[1:])} {value}'
+                  for key, value in sorted(counters.items()) if key[0] == name]
+
+    # Hit ratio of the prediction cache lookups made within every stage
+    ratios = []
+    for key in sorted({key[1:] for key in counters if key[0].startswith('cache_')}):
+        hits = counters.get(('cache_memory_hits',) + key, 0) + counters.get(('cache_disk_hits',) + key, 0)
+        lookups = hits + counters.get(('cache_misses',) + key, 0)
+        if lookups:
+            ratios.append(f'{prefix}_cache_hit_ratio{_labels(key)} {hits / lookups:.6f}')
+    if ratios:
+        lines += [f'# HELP {prefix}_cache_hit_ratio Share of the prediction cache lookups that hit.',
+                  f'# TYPE {prefix}_cache_hit_ratio gauge'] + ratios
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus(path):
+    '''Writes the recorded metrics to a file for the node exporter textfile collector.
+
+    Parameters:
+        path (str): .prom file to write.
+
+    Returns:
+        str: Path of the written file.
+
+    Usage example:
+        write_prometheus(os.path.join('metrics', 'clean_data.prom'))
+    '''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+def serve_metrics(port, host='0.0.0.0'):
+    '''Serves the recorded metrics on GET /metrics from a daemon thread.
+
+    Parameters:
+        port (int): Port to listen on.
+        host (str): Address to listen on.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+
+    Usage example:
+        serve_metrics(9100)
+    '''
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            payload = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class SamplingProfiler:
+    '''Samples the stacks of the threads running a profiled stage from a background thread.
+
+    Stacks are kept in the folded format, one 'root;...;leaf count' line per distinct stack, ready for
+    flamegraph.pl, speedscope or inferno.
+
+    Usage example:
+        sampler = SamplingProfiler()
+        sampler.start()
+        run_request()
+        stacks = sampler.stop()
+    '''
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.lock = threading.Lock()
+        self.active = {}
+        self.wake = threading.Event()
+        self.thread = None
+
+    def start(self):
+        # Sample the calling thread until stop
+        with self.lock:
+            self.active[threading.get_ident()] = Counter()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        self.wake.set()
+
+    def stop(self):
+        '''Stops sampling the calling thread.
+
+        Returns:
+            Counter: Number of samples per folded stack.
+        '''
+        with self.lock:
+            return self.active.pop(threading.get_ident(), Counter())
+
+    @staticmethod
+    def _fold(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name}@{os.path.basename(code.co_filename)}:{frame.f_lineno}')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        while True:
+            # Sleep until a thread is profiled
+            self.wake.wait()
+            with self.lock:
+                threads = list(self.active)
+                if not threads:
+                    self.wake.clear()
+                    continue
+            frames = sys._current_frames()
+            stacks = {thread: self._fold(frames[thread]) for thread in threads if thread in frames}
+            with self.lock:
+                for thread, stack in stacks.items():
+                    if thread in self.active:
+                        self.active[thread][stack] += 1
+            time.sleep(self.interval)
+
+_profiler = None
+
+def profiler():
+    # The sampler shared by every thread, started on first use
+    global _profiler
+    if _profiler is None:
+        with _lock:
+            if _profiler is None:
+                _profiler = SamplingProfiler()
+    return _profiler
+
+def dump_profile(stage, stacks, directory=None):
+    '''Writes the sampled stacks of a slow stage as a folded stack file.
+
+    Parameters:
+        stage (str): Name of the stage.
+        stacks (Counter): Number of samples per folded stack.
+        directory (str): Directory of the profiles. Defaults to PROFILE_DIR.
+
+    Returns:
+        str: Path of the written file, None without samples.
+
+    Usage example:
+        dump_profile('review_prediction', profiler().stop())
+    '''
+    if not stacks:
+        return None
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{stage}-{time.strftime("%Y%m%dT%H%M%S")}-{threading.get_ident()}.folded')
+    with open(path, 'w') as f:
+        f.writelines(f'{stack} {count}\n' for stack, count in stacks.most_common())
+    return path
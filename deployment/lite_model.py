@@ -0,0 +1,292 @@
+# Import libraries
+import os
+import re
+import argparse
+import unicodedata
+import numpy as np
+from functools import lru_cache
+from itertools import chain
+from fingerprint import fingerprint64
+
+# Default location of the exported model, its embedding matrix is stored next to it
+LITE_MODEL_PATH = 'model_logreg_lite.npz'
+EMBEDDINGS_SUFFIX = '_embeddings.npy'
+
+# Largest accepted difference between the exported and the hub embeddings
+EMBEDDING_TOLERANCE = 1e-4
+
+class _Punctuation(dict):
+    # str.translate table deleting the Unicode punctuation the hub module removes (\pP), filled in as characters come
+    def __missing__(self, code):
+        self[code] = None if unicodedata.category(chr(code)).startswith('P') else code
+        return self[code]
+
+PUNCTUATION = _Punctuation()
+
+@lru_cache(maxsize=100000)
+def _oov_bucket(token, buckets):
+    # Vocabulary tables hash unknown tokens with Fingerprint64 into one of the buckets after the vocabulary
+    return fingerprint64(token.encode('utf-8')) % buckets
+
+def _embeddings_path(path):
+    # The embedding matrix is stored uncompressed next to the model, so it can be memory-mapped
+    return os.path.splitext(path)[0] + EMBEDDINGS_SUFFIX
+
+class LiteSentimentModel:
+    '''NumPy copy of the Keras logistic regression model, served without importing TensorFlow.
+
+    The Keras model embeds a review with the TF-Hub NNLM layer and applies a sigmoid Dense(2) layer. The hub
+    module removes punctuation, splits on spaces, looks the tokens up in its vocabulary, hashes the unknown
+    ones into out-of-vocabulary buckets with Fingerprint64, and divides the sum of their embeddings by the
+    square root of the token count. The export copies the whole token table and embedding matrix, buckets
+    included, so every text is embedded exactly. The matrix is memory-mapped, so only the rows of the words
+    served are read.
+
+    Usage example:
+        model = LiteSentimentModel.load('model_logreg_lite.npz')
+        model.predict(np.array(['great seat friendly crew']))
+    '''
+
+    def __init__(self, tokens, embeddings, kernel, bias, oov_buckets=0, strip_punctuation=False, skip_empty=True):
+        self.tokens = list(tokens)
+        self.embeddings = embeddings
+        self.kernel = kernel
+        self.bias = bias
+        self.oov_buckets = int(oov_buckets)
+        self.strip_punctuation = bool(strip_punctuation)
+        self.skip_empty = bool(skip_empty)
+        self.positions = {token: position for position, token in enumerate(self.tokens)}
+
+    @staticmethod
+    def _checkpoint_embeddings(model_path, dim):
+        # Keras does not expose the weights of a reloaded hub layer, so its embedding partitions are read from the checkpoint
+        import tensorflow as tf
+        reader = tf.train.load_checkpoint(os.path.join(model_path, 'variables', 'variables'))
+        names = [name for name, shape in reader.get_variable_to_shape_map().items()
+                 if name.startswith('layer-0/') and len(shape) == 2 and shape[1] == dim]
+        if not names:
+            raise ValueError(f'No embedding matrix of width {dim} found in the hub layer of {model_path}')
+        names.sort(key=lambda name: [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)])
+        return np.concatenate([reader.get_tensor(name) for name in names]).astype('float32')
+
+    @staticmethod
+    def _asset_tokens(model_path, rows):
+        # The vocabulary table is initialised from a text file of the saved model, one token per line
+        assets = os.path.join(model_path, 'assets')
+        candidates = []
+        for name in sorted(os.listdir(assets)) if os.path.isdir(assets) else []:
+            try:
+                with open(os.path.join(assets, name), encoding='utf-8', newline='') as f:
+                    lines = f.read().split('\n')
+            except (UnicodeDecodeError, IsADirectoryError):
+                continue
+            if lines and lines[-1] == '':
+                lines.pop()
+            if 0 < len(lines) <= rows:
+                candidates.append(lines)
+        if len(candidates) != 1:
+            raise ValueError(f'Expected one vocabulary file in {assets}, found {len(candidates)}')
+        return candidates[0]
+
+    @classmethod
+    def export(cls, keras_model, model_path, texts=()):
+        '''Copies the token table, the embedding matrix and the dense weights out of a saved Keras model.
+
+        The tokenization of the hub module is probed and every probe, and the given texts, are checked
+        against the hub layer, so an export that would not reproduce the model raises instead of serving.
+
+        Parameters:
+            keras_model (Model): Loaded Keras model, a hub embedding layer followed by a Dense layer.
+            model_path (str): Directory of the saved Keras model, holding the vocabulary asset and the checkpoint.
+            texts (list): Preprocessed texts the embeddings are also checked on.
+
+        Returns:
+            LiteSentimentModel: The exported model.
+
+        Usage example:
+            lite = LiteSentimentModel.export(load_sentiment_model(MODEL_PATH), MODEL_PATH, texts[:2000])
+        '''
+        import tensorflow as tf
+
+        hub_layer, dense = keras_model.layers[0], keras_model.layers[-1]
+        kernel, bias = dense.get_weights()
+        embeddings = cls._checkpoint_embeddings(model_path, kernel.shape[0])
+        tokens = cls._asset_tokens(model_path, len(embeddings))
+
+        def hub(batch):
+            return hub_layer(tf.constant(list(batch))).numpy()
+
+        # Whether the module removes punctuation and skips the empty tokens of repeated spaces
+        word = next((token for token in tokens if token.isalpha() and token.islower()), tokens[0])
+        strip_punctuation = np.allclose(hub([word + '.']), hub([word]), atol=EMBEDDING_TOLERANCE)
+        skip_empty = np.allclose(hub([word + '  ' + word]), hub([word + ' ' + word]), atol=EMBEDDING_TOLERANCE)
+        lite = cls(tokens, embeddings, kernel, bias, len(embeddings) - len(tokens), strip_punctuation, skip_empty)
+
+        probes = [word, word.upper(), word + '!', f"{word}'s", '', ' ', f'{word}  {word}', 'qxzjvw', 'penerbangan ünïcödé',
+                  ' '.join(tokens[:50]), ' '.join(tokens[-50:])] + list(texts)
+        for start in range(0, len(probes), 512):
+            batch = probes[start:start + 512]
+            differences = np.abs(hub(batch) - lite.embed(batch)).max(axis=1)
+            if differences.max() > EMBEDDING_TOLERANCE:
+                text = batch[int(differences.argmax())]
+                raise ValueError(f'The exported embedding of {text!r} differs from the hub layer by {differences.max():.3g}')
+        return lite
+
+    def save(self, path):
+        '''Saves the vocabulary and dense weights to a compressed .npz file and the embedding matrix next to it.
+
+        Parameters:
+            path (str): File to write, e.g. 'model_logreg_lite.npz'.
+
+        Returns:
+            None
+
+        Usage example:
+            lite.save('model_logreg_lite.npz')
+        '''
+        # Tokens are stored as one UTF-8 buffer, a fixed-width string array of a large vocabulary is far bigger
+        np.savez_compressed(path, tokens=np.frombuffer('\n'.join(self.tokens).encode('utf-8'), dtype='uint8'),
+                            token_count=len(self.tokens), kernel=self.kernel, bias=self.bias,
+                            oov_buckets=self.oov_buckets, strip_punctuation=self.strip_punctuation,
+                            skip_empty=self.skip_empty)
+        np.save(_embeddings_path(path), np.asarray(self.embeddings, dtype='float32'))
+
+    @classmethod
+    def load(cls, path):
+        '''Loads a model saved with save, memory-mapping the embedding matrix.
+
+        Parameters:
+            path (str): File to read.
+
+        Returns:
+            LiteSentimentModel: The loaded model.
+
+        Usage example:
+            model = LiteSentimentModel.load('model_logreg_lite.npz')
+        '''
+        with np.load(path) as arrays:
+            if 'token_count' in arrays:
+                count = int(arrays['token_count'])
+                tokens = arrays['tokens'].tobytes().decode('utf-8').split('\n')[:count] if count else []
+            else:
+                tokens = arrays['tokens'].tolist()
+            embeddings = arrays['embeddings'] if 'embeddings' in arrays else np.load(_embeddings_path(path), mmap_mode='r')
+            settings = {name: arrays[name].item() for name in ['oov_buckets', 'strip_punctuation', 'skip_empty'] if name in arrays}
+            return cls(tokens, embeddings, arrays['kernel'], arrays['bias'], **settings)
+
+    def tokenize(self, text):
+        '''Splits a text into tokens like the hub module does.
+
+        Parameters:
+            text (str): Preprocessed text.
+
+        Returns:
+            list: Tokens, a single empty token for an empty text.
+
+        Usage example:
+            model.tokenize('great seat, friendly crew')
+        '''
+        if self.strip_punctuation:
+            text = text.translate(PUNCTUATION)
+        tokens = text.split(' ')
+        if self.skip_empty:
+            tokens = [token for token in tokens if token]
+
+        # The module looks an empty text up as one empty token
+        return tokens or ['']
+
+    def _token_id(self, token):
+        position = self.positions.get(token)
+        if position is not None:
+            return position
+        if not self.oov_buckets:
+            raise ValueError(f'{token!r} is outside the exported vocabulary, export the model again with lite_model.py')
+        return len(self.tokens) + _oov_bucket(token, self.oov_buckets)
+
+    def embed(self, texts):
+        '''Computes the sentence embeddings of preprocessed texts.
+
+        Parameters:
+            texts (iterable): Preprocessed texts.
+
+        Returns:
+            ndarray: float32 matrix with one embedding per text.
+
+        Usage example:
+            vectors = model.embed(['great seat friendly crew'])
+        '''
+        rows = [[self._token_id(token) for token in self.tokenize(str(text))] for text in texts]
+        counts = np.array([len(row) for row in rows], dtype='int64')
+        sums = np.zeros((len(rows), self.embeddings.shape[1]), dtype='float32')
+
+        # Sum the word embeddings of every text in one pass over the flattened word positions
+        if len(rows):
+            flat = np.fromiter(chain.from_iterable(rows), dtype='int64', count=int(counts.sum()))
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums[:] = np.add.reduceat(np.asarray(self.embeddings[flat], dtype='float32'), starts, axis=0)
+        return sums / np.sqrt(counts).astype('float32')[:, None]
+
+    def predict(self, texts, batch_size=None, verbose=0):
+        '''Predicts the class probabilities of preprocessed texts, with the same signature as Keras' predict.
+
+        Parameters:
+            texts (iterable): Preprocessed texts.
+            batch_size (int): Ignored, the texts are scored at once.
+            verbose (int): Ignored.
+
+        Returns:
+            ndarray: Sigmoid outputs with the negative and positive probability of every text.
+
+        Usage example:
+            prediction = model.predict(np.array(['great seat friendly crew']))
+        '''
+        logits = self.embed(texts) @ self.kernel + self.bias
+        return (1 / (1 + np.exp(-logits))).astype('float32')
+
+def verify(keras_model, lite_model, texts):
+    '''Compares the predictions of the exported model with the Keras model.
+
+    Parameters:
+        keras_model (Model): Keras model the lite model was exported from.
+        lite_model (LiteSentimentModel): Exported model.
+        texts (list): Preprocessed texts to compare on.
+
+    Returns:
+        dict: Largest absolute probability difference and share of texts with the same predicted label.
+
+    Usage example:
+        print(verify(keras_model, lite_model, texts[:2000]))
+    '''
+    texts = np.array(texts, dtype=object)
+    expected = keras_model.predict(texts, batch_size=512, verbose=0)
+    actual = lite_model.predict(texts)
+    return {'texts': len(texts),
+            'max_abs_diff': float(np.abs(expected - actual).max()) if len(texts) else 0.0,
+            'label_agreement': float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean()) if len(texts) else 1.0}
+
+# Export the model from the command line, e.g. python lite_model.py airline_review_cleaned
+if __name__ == '__main__':
+    from storage import read_table
+    from batch_predict import MODEL_PATH, load_sentiment_model
+    from text_preprocessing import preprocess_texts
+
+    parser = argparse.ArgumentParser(description='Export the Keras sentiment model to a NumPy model.')
+    parser.add_argument('table', help="Table whose 'review' column the predictions are compared on.")
+    parser.add_argument('--model', default=MODEL_PATH, help='Path of the saved Keras model.')
+    parser.add_argument('--output', default=LITE_MODEL_PATH, help='File to write the exported model to.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of preprocessing processes.')
+    parser.add_argument('--verify', type=int, default=2000, help='Number of reviews to compare predictions on.')
+    parser.add_argument('--tolerance', type=float, default=1e-4, help='Largest accepted probability difference.')
+    args = parser.parse_args()
+
+    # The vocabulary comes from the hub module, so every review compared on is held out from the export
+    reviews = read_table(args.table, columns=['review'])['review'].fillna('').astype(str).head(args.verify)
+    texts = list(preprocess_texts(reviews, workers=args.workers))
+    keras_model = load_sentiment_model(args.model)
+    lite_model = LiteSentimentModel.export(keras_model, args.model, texts)
+    lite_model.save(args.output)
+
+    report = verify(keras_model, lite_model, texts)
+    print('Exported: ', {'tokens': len(lite_model.tokens), 'oov_buckets': lite_model.oov_buckets, 'path': args.output, **report})
+    if report['max_abs_diff'] > args.tolerance:
+        raise SystemExit(f"Exported model differs from the Keras model by {report['max_abs_diff']}")
@@ -0,0 +1,306 @@
+# Import libraries
+import os
+import zlib
+import numpy as np
+from functools import lru_cache
+from itertools import chain
+from text_preprocessing import preprocess_text
+
+# MinHash signature length, split into LSH bands of BAND_ROWS values each
+NUM_PERM = 128
+BANDS = 16
+BAND_ROWS = NUM_PERM // BANDS
+
+# Candidates sharing a band are duplicates when their estimated Jaccard similarity reaches the threshold
+THRESHOLD = 0.8
+
+# Word shingles of the preprocessed text, and the shortest text deduplicated, since short reviews often match by chance
+SHINGLE_SIZE = 3
+MIN_TOKENS = 10
+
+# Number of reviews sent to a worker process at once
+BLOCK_ROWS = 1000
+
+# Hash functions of the signatures, fixed so signatures stay comparable across runs and processes
+SEED = 20
+
+# Files of a stored index, after its path prefix
+INDEX_FILES = ['_ids.npy', '_signatures.npy', '_bands.npy']
+
+@lru_cache(maxsize=None)
+def _hash_functions(num_perm, seed):
+    # Odd 64-bit multipliers and offsets of the hash functions, and the multipliers of the band keys
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 2 ** 62, size=num_perm, dtype='int64').astype('uint64') | np.uint64(1)
+    b = rng.randint(0, 2 ** 62, size=num_perm, dtype='int64').astype('uint64')
+    mix = rng.randint(1, 2 ** 62, size=num_perm // BANDS, dtype='int64').astype('uint64') | np.uint64(1)
+    return a, b, mix
+
+def _finalize(values):
+    # SplitMix64 finalizer, so the order of the hashes no longer follows the shingle hashes. Wrapping uint64 arithmetic is intended
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+def shingles(text, size=SHINGLE_SIZE):
+    '''Splits a preprocessed text into its set of word shingles.
+
+    Parameters:
+        text (str): Preprocessed text.
+        size (int): Number of words per shingle.
+
+    Returns:
+        set: Shingles of the text, a single one when the text is shorter than size.
+
+    Usage example:
+        shingles('great seat friendly crew')
+    '''
+    tokens = text.split()
+    return {' '.join(tokens[start:start + size]) for start in range(max(len(tokens) - size + 1, 1))}
+
+def minhash(text, num_perm=NUM_PERM, seed=SEED):
+    '''Computes the MinHash signature of a preprocessed text.
+
+    Parameters:
+        text (str): Preprocessed text.
+        num_perm (int): Signature length.
+        seed (int): Seed of the hash functions.
+
+    Returns:
+        ndarray: uint32 signature, the minimum of every hash function over the shingles.
+
+    Usage example:
+        signature = minhash(preprocess_text(review))
+    '''
+    a, b, _ = _hash_functions(num_perm, seed)
+    # CRC32 is stable across processes, unlike hash(). The top 32 bits of the mixed hashes are kept
+    hashes = np.array([zlib.crc32(shingle.encode()) for shingle in shingles(text)], dtype='uint64')
+    return (_finalize(np.outer(hashes, a) + b) >> np.uint64(32)).min(axis=0).astype('uint32')
+
+def minhash_reviews(reviews, num_perm=NUM_PERM, seed=SEED):
+    '''Preprocesses raw reviews and computes their MinHash signatures, e.g. in a worker process.
+
+    Parameters:
+        reviews (list): Raw review texts.
+        num_perm (int): Signature length.
+        seed (int): Seed of the hash functions.
+
+    Returns:
+        tuple: uint32 signatures, one row per review, and whether every review is long enough to deduplicate.
+
+    Usage example:
+        signatures, eligible = minhash_reviews(data['review'].tolist())
+    '''
+    signatures = np.zeros((len(reviews), num_perm), dtype='uint32')
+    eligible = np.zeros(len(reviews), dtype=bool)
+    for row, review in enumerate(reviews):
+        text = preprocess_text('' if review is None else str(review))
+        if len(text.split()) >= MIN_TOKENS:
+            signatures[row] = minhash(text, num_perm, seed)
+            eligible[row] = True
+    return signatures, eligible
+
+def _save_array(path, array):
+    # Replace the file atomically, so an interrupted save never leaves a truncated index
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, array)
+    os.replace(path + '.tmp', path)
+
+class NearDuplicateIndex:
+    '''Finds near-duplicate reviews of the same airline with MinHash signatures and LSH bands.
+
+    Every review is compared only with the reviews sharing one of its bands, so deduplication runs in roughly
+    linear time. Reviews are deduplicated in order, and the first of a group of near-duplicates is kept. The
+    signatures and bands of the kept reviews are stored, so later batches are only compared against them.
+
+    Usage example:
+        index = NearDuplicateIndex.load('review_minhash') if index_exists('review_minhash') else NearDuplicateIndex()
+        keep, removed = index.deduplicate(chunk)
+        index.save('review_minhash')
+    '''
+
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+        self.ids = np.zeros(0, dtype='int64')
+        self.signatures = np.zeros((0, NUM_PERM), dtype='uint32')
+        self.bands = np.zeros((0, BANDS), dtype='uint64')
+
+        # Sorted band keys of the stored reviews, and the positions of the reviews kept from the current batch by band key
+        self._sorted = None
+        self._new = []
+        self._new_bands = [{} for _ in range(BANDS)]
+
+    @staticmethod
+    def band_keys(signatures, airlines):
+        '''Hashes every band of the signatures, together with the airline, into one 64-bit key.
+
+        Parameters:
+            signatures (ndarray): uint32 signatures, one row per review.
+            airlines (iterable): Airline name of every review.
+
+        Returns:
+            ndarray: uint64 keys, one row per review and one column per band.
+
+        Usage example:
+            keys = NearDuplicateIndex.band_keys(signatures, chunk['airline_name'])
+        '''
+        _, _, mix = _hash_functions(NUM_PERM, SEED)
+        airlines = [str(airline) for airline in airlines]
+        codes = {airline: zlib.crc32(airline.encode()) for airline in set(airlines)}
+        airline_hashes = np.array([codes[airline] for airline in airlines], dtype='uint64')
+
+        # Wrapping uint64 arithmetic is the intended modulo 2**64 here
+        values = signatures.astype('uint64').reshape(len(signatures), BANDS, BAND_ROWS)
+        return (values * mix).sum(axis=2, dtype='uint64') * np.uint64(0x9E3779B97F4A7C15) + airline_hashes[:, None]
+
+    def _stored_candidates(self, keys):
+        # Every stored review sharing a band with each row, through the range of equal keys found by binary search per band
+        if self._sorted is None:
+            orders = np.argsort(self.bands, axis=0, kind='stable')
+            self._sorted = (orders, np.take_along_axis(self.bands, orders, axis=0))
+        orders, sorted_keys = self._sorted
+        candidates = [set() for _ in range(len(keys))]
+        for band in range(BANDS):
+            starts = np.searchsorted(sorted_keys[:, band], keys[:, band], side='left')
+            ends = np.searchsorted(sorted_keys[:, band], keys[:, band], side='right')
+            for row in np.flatnonzero(ends > starts):
+                candidates[row].update(orders[starts[row]:ends[row], band].tolist())
+        return candidates
+
+    def _signature(self, position):
+        stored = len(self.ids)
+        return self.signatures[position] if position < stored else self._new[position - stored][1]
+
+    def _id(self, position):
+        stored = len(self.ids)
+        return int(self.ids[position]) if position < stored else self._new[position - stored][0]
+
+    def signatures_of(self, reviews, pool=None):
+        '''Computes the signatures of raw reviews, split across the pool when given.
+
+        Parameters:
+            reviews (list): Raw review texts.
+            pool (Pool): Worker processes.
+
+        Returns:
+            tuple: uint32 signatures and whether every review is long enough to deduplicate.
+
+        Usage example:
+            signatures, eligible = index.signatures_of(chunk['review'].tolist())
+        '''
+        if pool is None or len(reviews) <= BLOCK_ROWS:
+            return minhash_reviews(reviews)
+        results = pool.map(minhash_reviews, [reviews[start:start + BLOCK_ROWS] for start in range(0, len(reviews), BLOCK_ROWS)])
+        return np.concatenate([signatures for signatures, _ in results]), np.concatenate([eligible for _, eligible in results])
+
+    def deduplicate(self, chunk, pool=None, id_column='id'):
+        '''Finds the near-duplicates in a chunk of reviews and remembers the reviews that are kept.
+
+        Parameters:
+            chunk (DataFrame): Reviews with id, airline_name and review columns.
+            pool (Pool): Worker processes computing the signatures.
+            id_column (str): Column identifying a review.
+
+        Returns:
+            tuple: Boolean mask of the rows to keep, and a list of (id, airline_name, duplicate_of, similarity)
+            for every removed row.
+
+        Usage example:
+            keep, removed = index.deduplicate(chunk)
+            chunk = chunk[keep]
+        '''
+        signatures, eligible = self.signatures_of(chunk['review'].tolist(), pool)
+        airlines = chunk['airline_name'].astype(str).tolist()
+        ids = chunk[id_column].tolist()
+        keys = self.band_keys(signatures, airlines)
+        stored_candidates = self._stored_candidates(keys)
+        band_keys = keys.tolist()
+
+        keep = np.ones(len(chunk), dtype=bool)
+        removed = []
+        for row in np.flatnonzero(eligible):
+            candidates = stored_candidates[row]
+            candidates.update(chain.from_iterable(bands.get(key, ()) for bands, key in zip(self._new_bands, band_keys[row])))
+
+            # Verify the candidates on the whole signature, so an accidental band match is never removed. Ties go to the earliest review
+            best, similarity = None, 0.0
+            for candidate in sorted(candidates):
+                estimate = float(np.mean(self._signature(candidate) == signatures[row]))
+                if estimate > similarity:
+                    best, similarity = candidate, estimate
+            if best is not None and similarity >= self.threshold:
+                keep[row] = False
+                removed.append((ids[row], airlines[row], self._id(best), round(similarity, 4)))
+                continue
+
+            position = len(self.ids) + len(self._new)
+            self._new.append((ids[row], signatures[row], keys[row]))
+            for bands, key in zip(self._new_bands, band_keys[row]):
+                bands.setdefault(key, []).append(position)
+        return keep, removed
+
+    def save(self, prefix):
+        '''Saves the stored and the newly kept reviews as '<prefix>_ids.npy', '<prefix>_signatures.npy' and '<prefix>_bands.npy'.
+
+        Parameters:
+            prefix (str): Path prefix of the index files.
+
+        Returns:
+            None
+
+        Usage example:
+            index.save('review_minhash_pending')
+        '''
+        if self._new:
+            new_ids, new_signatures, new_bands = zip(*self._new)
+            ids = np.concatenate([self.ids, np.array(new_ids, dtype='int64')])
+            signatures = np.concatenate([self.signatures, np.array(new_signatures, dtype='uint32')])
+            bands = np.concatenate([self.bands, np.array(new_bands, dtype='uint64')])
+        else:
+            ids, signatures, bands = self.ids, self.signatures, self.bands
+        for suffix, array in zip(INDEX_FILES, [ids, signatures, bands]):
+            _save_array(prefix + suffix, array)
+
+    @classmethod
+    def load(cls, prefix, threshold=THRESHOLD):
+        '''Loads an index saved with save.
+
+        Parameters:
+            prefix (str): Path prefix of the index files.
+            threshold (float): Estimated Jaccard similarity from which reviews are duplicates.
+
+        Returns:
+            NearDuplicateIndex: The loaded index.
+
+        Usage example:
+            index = NearDuplicateIndex.load('review_minhash')
+        '''
+        index = cls(threshold)
+        index.ids, index.signatures, index.bands = [np.load(prefix + suffix) for suffix in INDEX_FILES]
+        return index
+
+def index_exists(prefix):
+    # Whether every file of a stored index is present
+    return all(os.path.exists(prefix + suffix) for suffix in INDEX_FILES)
+
+def promote_index(source, target):
+    '''Replaces a stored index by another one, e.g. the pending index of a batch once it is committed.
+
+    Parameters:
+        source (str): Path prefix of the index to keep.
+        target (str): Path prefix of the index to replace.
+
+    Returns:
+        None
+
+    Usage example:
+        promote_index('review_minhash_pending', 'review_minhash')
+    '''
+    for suffix in INDEX_FILES:
+        os.replace(source + suffix, target + suffix)
+
+def remove_index(prefix):
+    # Remove every file of a stored index
+    for suffix in INDEX_FILES:
+        if os.path.exists(prefix + suffix):
+            os.remove(prefix + suffix)
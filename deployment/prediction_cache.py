@@ -0,0 +1,258 @@
+# Import libraries
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict, Counter
+from instrumentation import record
+
+# Default location of the cache shared by the DAG, the batch scorer, the app and the service
+CACHE_PATH = 'prediction_cache.sqlite'
+
+def model_namespace(model_path):
+    '''Identifies a saved model, so a retrained or re-exported model never reuses cached values.
+
+    Parameters:
+        model_path (str): Path of the saved model.
+
+    Returns:
+        str: Model path and modification time.
+
+    Usage example:
+        cache = PredictionCache(namespace=model_namespace(MODEL_PATH))
+    '''
+    return f'{os.path.normpath(model_path)}@{int(os.path.getmtime(model_path))}'
+
+class PredictionCache:
+    '''Float vectors keyed by a hash of the preprocessed text, kept in an in-memory LRU in front of SQLite.
+
+    Every row on disk carries the time it was last written or read. Once the table holds more than max_rows
+    rows, the least recently accessed ones are deleted. The table is counted after every max_rows / 100 new
+    rows, so it can briefly run that far over the limit.
+
+    Usage example:
+        cache = PredictionCache('prediction_cache.sqlite', namespace='model_logreg')
+        cache.put_many(['great seat'], [[0.1, 0.9]])
+        cache.get_many(['great seat', 'late flight'])
+    '''
+
+    def __init__(self, path=CACHE_PATH, namespace='', max_entries=100000, max_rows=1000000):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.memory = OrderedDict()
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+        # Rows written since the table was last counted
+        self.unchecked = 0
+
+        # WAL lets the DAG write while the app reads the same file. A lost last write is only a cache miss
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS cache (key BLOB PRIMARY KEY, value BLOB, last_access REAL NOT NULL DEFAULT 0)')
+
+        # Caches written before eviction lack the column, their rows are evicted first
+        if 'last_access' not in [row[1] for row in self.connection.execute('PRAGMA table_info(cache)')]:
+            self.connection.execute('ALTER TABLE cache ADD COLUMN last_access REAL NOT NULL DEFAULT 0')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)')
+        self.connection.commit()
+
+    def key(self, text, kind='prediction'):
+        return hashlib.blake2b(f'{self.namespace}\0{kind}\0{text}'.encode(), digest_size=16).digest()
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get_many(self, texts, kind='prediction'):
+        '''Looks up the cached vectors of preprocessed texts, in memory first and on disk second.
+
+        Parameters:
+            texts (list): Preprocessed texts.
+            kind (str): Kind of vector, e.g. 'prediction' or 'embedding'.
+
+        Returns:
+            list: Cached float32 vector of every text, None when missing.
+
+        Usage example:
+            values = cache.get_many(texts)
+        '''
+        keys = [self.key(text, kind) for text in texts]
+        values = [None] * len(keys)
+        counts = Counter()
+        with self.lock:
+            missing = []
+            for position, key in enumerate(keys):
+                value = self.memory.get(key)
+                if value is None:
+                    missing.append(position)
+                else:
+                    self.memory.move_to_end(key)
+                    values[position] = value
+                    counts['memory_hits'] += 1
+
+            # One query per 500 distinct keys, below SQLite's limit on bound parameters
+            distinct = list(dict.fromkeys(keys[position] for position in missing))
+            found = {}
+            for start in range(0, len(distinct), 500):
+                part = distinct[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({','.join('?' * len(part))})", part)
+                found.update((key, np.frombuffer(value, dtype='float32')) for key, value in rows)
+
+            # Every hit, in memory or on disk, keeps its row from eviction
+            hits = list(dict.fromkeys(key for key, value in zip(keys, values) if value is not None)) + list(found)
+            now = time.time()
+            for start in range(0, len(hits), 500):
+                part = hits[start:start + 500]
+                self.connection.execute(
+                    f"UPDATE cache SET last_access = ? WHERE key IN ({','.join('?' * len(part))})", [now] + part)
+            if hits:
+                self.connection.commit()
+
+            for position in missing:
+                value = found.get(keys[position])
+                if value is None:
+                    counts['misses'] += 1
+                else:
+                    values[position] = value
+                    counts['disk_hits'] += 1
+                    self._remember(keys[position], value)
+            self.counts.update(counts)
+
+        # Lookups also count towards the stage they were made in
+        record(**{f'cache_{name}': count for name, count in counts.items()})
+        return values
+
+    def put_many(self, texts, values, kind='prediction'):
+        '''Stores the vectors of preprocessed texts in memory and on disk.
+
+        Parameters:
+            texts (list): Preprocessed texts.
+            values (iterable): Vector of every text.
+            kind (str): Kind of vector, e.g. 'prediction' or 'embedding'.
+
+        Returns:
+            None
+
+        Usage example:
+            cache.put_many(texts, model.predict(texts))
+        '''
+        rows = [(self.key(text, kind), np.asarray(value, dtype='float32')) for text, value in zip(texts, values)]
+        now = time.time()
+        with self.lock:
+            self.connection.executemany('INSERT OR REPLACE INTO cache (key, value, last_access) VALUES (?, ?, ?)',
+                                        [(key, value.tobytes(), now) for key, value in rows])
+            self.unchecked += len(rows)
+            if self.max_rows is not None and self.unchecked >= max(self.max_rows // 100, 1):
+                self._evict()
+            self.connection.commit()
+            for key, value in rows:
+                self._remember(key, value)
+            self.counts['computed'] += len(rows)
+
+    def _evict(self):
+        # Delete the least recently accessed rows beyond max_rows. DELETE ... LIMIT needs a compile option, hence the subquery
+        self.unchecked = 0
+        excess = self.connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_rows
+        if excess > 0:
+            self.connection.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access LIMIT ?)', (excess,))
+            self.counts['evicted'] += excess
+
+    def metrics(self):
+        '''Summarises the cache lookups since the cache was opened.
+
+        Parameters:
+            None
+
+        Returns:
+            dict: Lookup, hit and miss counts and the hit rate.
+
+        Usage example:
+            print(cache.metrics())
+        '''
+        with self.lock:
+            counts = dict(self.counts)
+            cached = len(self.memory)
+        hits = counts.get('memory_hits', 0) + counts.get('disk_hits', 0)
+        lookups = hits + counts.get('misses', 0)
+        return {'lookups': lookups,
+                'memory_hits': counts.get('memory_hits', 0),
+                'disk_hits': counts.get('disk_hits', 0),
+                'misses': counts.get('misses', 0),
+                'computed': counts.get('computed', 0),
+                'evicted': counts.get('evicted', 0),
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'memory_entries': cached}
+
+class CachedModel:
+    '''Wraps a sentiment model so every distinct preprocessed text is only ever scored once.
+
+    Exposes the same predict as the Keras model, and embed, through the hub layer of a Keras model.
+
+    Usage example:
+        model = CachedModel(load_sentiment_model(), PredictionCache(namespace=model_namespace(MODEL_PATH)))
+        model.predict(np.array(['great seat friendly crew'], dtype=object))
+    '''
+
+    def __init__(self, model, cache):
+        self.model = model
+        self.cache = cache
+
+    def _cached(self, texts, kind, compute):
+        texts = [str(text) for text in texts]
+        values = self.cache.get_many(texts, kind)
+
+        # Compute every distinct missing text once, even when it repeats within the batch
+        missing = list(dict.fromkeys(text for text, value in zip(texts, values) if value is None))
+        if missing:
+            computed = np.asarray(compute(np.array(missing, dtype=object)), dtype='float32')
+            self.cache.put_many(missing, computed, kind)
+            lookup = dict(zip(missing, computed))
+            values = [lookup[text] if value is None else value for text, value in zip(texts, values)]
+        return np.array(values, dtype='float32')
+
+    def predict(self, texts, batch_size=None, verbose=0):
+        '''Predicts the class probabilities of preprocessed texts, scoring only the uncached ones.
+
+        Parameters:
+            texts (iterable): Preprocessed texts.
+            batch_size (int): Batch size passed on to the wrapped model.
+            verbose (int): Verbosity passed on to the wrapped model.
+
+        Returns:
+            ndarray: Class probabilities of every text.
+
+        Usage example:
+            prediction = model.predict(np.array(['great seat friendly crew'], dtype=object))
+        '''
+        return self._cached(texts, 'prediction',
+                            lambda missing: self.model.predict(missing, batch_size=batch_size, verbose=verbose))
+
+    def embed(self, texts):
+        '''Computes the sentence embeddings of preprocessed texts, embedding only the uncached ones.
+
+        Parameters:
+            texts (iterable): Preprocessed texts.
+
+        Returns:
+            ndarray: Embedding of every text.
+
+        Usage example:
+            vectors = model.embed(['great seat friendly crew'])
+        '''
+        if hasattr(self.model, 'embed'):
+            return self._cached(texts, 'embedding', self.model.embed)
+
+        import tensorflow as tf
+        hub_layer = self.model.layers[0]
+        return self._cached(texts, 'embedding', lambda missing: hub_layer(tf.constant(list(missing))).numpy())
+
+    def metrics(self):
+        return self.cache.metrics()
@@ -0,0 +1,591 @@
+# Import libraries
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Rating columns of the per-airline ratings table
+RATING_COLUMNS = ['avg_seat_comfort', 'avg_cabin_staff_service', 'avg_food_beverages', 'avg_ground_service',
+                  'avg_inflight_entertainment', 'avg_wifi_connectivity', 'avg_value_for_money']
+
+def scale_ratings(ratings, mean=None, std=None):
+    '''Standardizes the rating columns and scales every airline to unit length.
+
+    Uses the same mean and population standard deviation as sklearn's StandardScaler, so dot products of
+    the rows are the cosine similarities of the standardized ratings.
+
+    Parameters:
+        ratings (DataFrame): Ratings table with the columns in RATING_COLUMNS.
+        mean (list): Column means to standardize with, e.g. kept from an earlier run. Fitted when None.
+        std (list): Column standard deviations to standardize with. Fitted when None.
+
+    Returns:
+        ndarray: Unit-length float32 matrix with one row per airline.
+
+    Usage example:
+        vectors = scale_ratings(df)
+    '''
+    values = ratings[RATING_COLUMNS].to_numpy(dtype='float64')
+    mean = values.mean(axis=0) if mean is None else np.asarray(mean, dtype='float64')
+    std = values.std(axis=0) if std is None else np.asarray(std, dtype='float64')
+    scaled = (values - mean) / np.where(std == 0, 1.0, std)
+    norms = np.linalg.norm(scaled, axis=1, keepdims=True)
+    return (scaled / np.where(norms == 0, 1.0, norms)).astype('float32')
+
+def _save_array(path, array):
+    # Replace the file atomically, so readers that memory-mapped the previous version keep a valid file
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, array)
+    os.replace(path + '.tmp', path)
+
+class NeighborIndex:
+    '''Top-K most similar airlines per airline, stored as compact integer and float arrays.
+
+    Usage example:
+        index = NeighborIndex.load('rating_neighbors')
+        index.similar('Qatar Airways', 5)
+    '''
+
+    def __init__(self, names, neighbors, scores):
+        self.names = list(names)
+        self.neighbors = neighbors
+        self.scores = scores
+        self.positions = {name: position for position, name in enumerate(self.names)}
+
+    @classmethod
+    def build(cls, names, vectors, k=20, block_size=1024):
+        '''Builds the index from unit-length vectors, never holding more than block_size x N similarities.
+
+        Parameters:
+            names (list): Item name of every row.
+            vectors (ndarray): Unit-length vectors, one row per item.
+            k (int): Number of neighbours kept per item.
+            block_size (int): Number of items scored at once.
+
+        Returns:
+            NeighborIndex: The built index.
+
+        Usage example:
+            index = NeighborIndex.build(df['airline_name'], scale_ratings(df))
+        '''
+        n_items = len(vectors)
+        k = max(min(k, n_items - 1), 0)
+        neighbors = np.empty((n_items, k), dtype='int32')
+        scores = np.empty((n_items, k), dtype='float32')
+        if k > 0:
+            cls._fill_rows(vectors, np.arange(n_items), neighbors, scores, block_size)
+        return cls(names, neighbors, scores)
+
+    @staticmethod
+    def _top_k(candidates, similarity, k):
+        # Select the top k without sorting the whole row, then order only those k. Ties go to the lowest row
+        top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarity, top, axis=1)
+
+        # Rows where a tie crosses the k-th place are sorted in full, so the same neighbours win whatever the candidate order
+        crossing = np.flatnonzero((similarity >= top_scores.min(axis=1, keepdims=True)).sum(axis=1) > k)
+        for row in crossing:
+            top[row] = np.lexsort((candidates[row], -similarity[row]))[:k]
+            top_scores[row] = similarity[row, top[row]]
+
+        top_candidates = np.take_along_axis(candidates, top, axis=1)
+        order = np.lexsort((top_candidates, -top_scores), axis=1)
+        return np.take_along_axis(top_candidates, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    @staticmethod
+    def _similarity(left, right):
+        # Accumulated in float64 and rounded, so equal vectors tie exactly whatever the shape of the product
+        return (np.asarray(left, dtype='float64') @ np.asarray(right, dtype='float64').T).astype('float32')
+
+    @classmethod
+    def _fill_rows(cls, vectors, rows, neighbors, scores, block_size):
+        # Score the given rows against every item, block by block
+        k = neighbors.shape[1]
+        everything = np.arange(len(vectors))[None, :]
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            similarity = cls._similarity(vectors[block], vectors)
+
+            # An item is never its own neighbour
+            similarity[np.arange(len(block)), block] = -np.inf
+            neighbors[block], scores[block] = cls._top_k(np.broadcast_to(everything, similarity.shape), similarity, k)
+
+    def update(self, names, vectors, changed, k=20, block_size=1024):
+        '''Refreshes the index after only some items moved, without rescoring every pair.
+
+        The rows of the changed, added and removed items are rescored against everything. Every other row
+        keeps its still-valid neighbours and only merges in the changed items. A row is rescored in full
+        when dropping a stale neighbour leaves a slot that an item outside its old top k could fill, or tie
+        for, so the result is the same as build's as long as the unchanged items kept their vectors.
+
+        Parameters:
+            names (list): Item name of every row of the new vectors.
+            vectors (ndarray): Unit-length vectors, one row per item.
+            changed (iterable): Names of the items whose vectors changed.
+            k (int): Number of neighbours kept per item.
+            block_size (int): Number of items scored at once.
+
+        Returns:
+            NeighborIndex: The refreshed index.
+
+        Usage example:
+            index = index.update(df['airline_name'], scale_ratings(df, mean, std), batch['airline_name'].unique())
+        '''
+        names = list(names)
+        n_items = len(vectors)
+        k = max(min(k, n_items - 1), 0)
+        if k == 0 or self.neighbors.shape[1] != k:
+            return self.build(names, vectors, k, block_size)
+
+        positions = {name: position for position, name in enumerate(names)}
+        moved = np.array([name not in self.positions for name in names])
+        moved[[positions[name] for name in changed if name in positions]] = True
+        moved_rows = np.flatnonzero(moved)
+
+        # Old neighbour ids mapped to the new rows, -1 for removed items
+        old_to_new = np.array([positions.get(name, -1) for name in self.names], dtype='int64')
+        neighbors = np.empty((n_items, k), dtype='int32')
+        scores = np.empty((n_items, k), dtype='float32')
+        rescore = moved.copy()
+
+        kept_rows = np.flatnonzero(~moved)
+        for start in range(0, len(kept_rows), block_size):
+            block = kept_rows[start:start + block_size]
+            old_rows = np.array([self.positions[names[row]] for row in block])
+            old_neighbors = old_to_new[np.asarray(self.neighbors[old_rows])]
+            old_scores = np.asarray(self.scores[old_rows])
+
+            # Still-valid old neighbours and the fresh scores of every moved item
+            stale = (old_neighbors < 0) | moved[old_neighbors]
+            candidates = np.concatenate([np.where(stale, 0, old_neighbors),
+                                         np.broadcast_to(moved_rows, (len(block), len(moved_rows)))], axis=1)
+            similarity = np.concatenate([np.where(stale, -np.inf, old_scores),
+                                         self._similarity(vectors[block], vectors[moved_rows])], axis=1)
+            neighbors[block], scores[block] = self._top_k(candidates, similarity, k)
+            rescore[block] = stale.any(axis=1) & (scores[block][:, -1] <= old_scores[:, -1])
+
+        self._fill_rows(vectors, np.flatnonzero(rescore), neighbors, scores, block_size)
+        return self.__class__(names, neighbors, scores)
+
+    def save(self, prefix):
+        '''Saves the index as '<prefix>_names.json', '<prefix>_neighbors.npy' and '<prefix>_scores.npy'.
+
+        Parameters:
+            prefix (str): Path prefix of the index files.
+
+        Returns:
+            None
+
+        Usage example:
+            index.save('rating_neighbors')
+        '''
+        with open(prefix + '_names.json', 'w') as f:
+            json.dump(self.names, f)
+        _save_array(prefix + '_neighbors.npy', self.neighbors)
+        _save_array(prefix + '_scores.npy', self.scores)
+
+    @classmethod
+    def load(cls, prefix):
+        '''Loads an index saved with save, memory-mapping the neighbour arrays.
+
+        Parameters:
+            prefix (str): Path prefix of the index files.
+
+        Returns:
+            NeighborIndex: The loaded index.
+
+        Usage example:
+            index = NeighborIndex.load('rating_neighbors')
+        '''
+        with open(prefix + '_names.json') as f:
+            names = json.load(f)
+        return cls(names,
+                   np.load(prefix + '_neighbors.npy', mmap_mode='r'),
+                   np.load(prefix + '_scores.npy', mmap_mode='r'))
+
+    def similar(self, name, n=5):
+        '''Returns the n most similar items to an item in O(n).
+
+        Parameters:
+            name (str): Item to find neighbours for.
+            n (int): Number of neighbours to return, at most the k the index was built with.
+
+        Returns:
+            DataFrame: Neighbour names and similarity scores, most similar first.
+
+        Usage example:
+            index.similar('Qatar Airways', 5)
+        '''
+        position = self.positions[name]
+        neighbors = self.neighbors[position, :n]
+        return pd.DataFrame({'Airline': [self.names[neighbor] for neighbor in neighbors],
+                             'Similarity Score': np.asarray(self.scores[position, :n], dtype='float64')})
+
+class ContentIndex:
+    '''Approximate nearest-neighbour index over unit-length vectors, stored as an inverted file of k-means clusters.
+
+    A query is only compared with the items of the n_probe clusters closest to it, so its cost grows with the
+    square root of the number of items instead of linearly.
+
+    Usage example:
+        index = ContentIndex.load('content_neighbors')
+        index.similar('Qatar Airways', 5)
+    '''
+
+    def __init__(self, names, vectors, centroids, offsets):
+        self.names = list(names)
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.positions = {name: position for position, name in enumerate(self.names)}
+
+    @staticmethod
+    def _assign(vectors, centroids, block_size):
+        return np.concatenate([np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+                               for start in range(0, len(vectors), block_size)])
+
+    @classmethod
+    def build(cls, names, vectors, n_lists=None, iterations=10, seed=0, block_size=4096):
+        '''Clusters unit-length vectors with spherical k-means and groups the items by cluster.
+
+        Parameters:
+            names (list): Item name of every row.
+            vectors (ndarray): Unit-length vectors, one row per item.
+            n_lists (int): Number of clusters. Defaults to the square root of the number of items.
+            iterations (int): Number of k-means iterations.
+            seed (int): Seed of the initial centroid sample.
+            block_size (int): Number of items assigned to clusters at once.
+
+        Returns:
+            ContentIndex: The built index.
+
+        Usage example:
+            index = ContentIndex.build(df['airline_name'], vectors)
+        '''
+        names = list(names)
+        vectors = np.asarray(vectors, dtype='float32')
+        n_items = len(vectors)
+        n_lists = max(min(n_lists or int(np.sqrt(n_items)), n_items), 1)
+        if n_items == 0:
+            return cls(names, vectors, np.zeros((1, vectors.shape[1]), dtype='float32'), np.zeros(2, dtype='int64'))
+
+        centroids = vectors[np.random.default_rng(seed).choice(n_items, n_lists, replace=False)]
+        for _ in range(iterations):
+            assign = cls._assign(vectors, centroids, block_size)
+
+            # Sum the members of every cluster in one pass over the items sorted by cluster
+            order = np.argsort(assign, kind='stable')
+            counts = np.bincount(assign, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(vectors[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[filled], axis=0)
+
+            # Empty clusters keep their previous centroid
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.where(norms > 0, sums / np.where(norms == 0, 1.0, norms), centroids).astype('float32')
+
+        assign = cls._assign(vectors, centroids, block_size)
+        order = np.argsort(assign, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        return cls([names[position] for position in order], vectors[order], centroids, offsets)
+
+    def save(self, prefix):
+        '''Saves the index as '<prefix>_names.json' and '<prefix>_vectors.npy', '_centroids.npy', '_offsets.npy'.
+
+        Parameters:
+            prefix (str): Path prefix of the index files.
+
+        Returns:
+            None
+
+        Usage example:
+            index.save('content_neighbors')
+        '''
+        with open(prefix + '_names.json', 'w') as f:
+            json.dump(self.names, f)
+        _save_array(prefix + '_vectors.npy', self.vectors)
+        _save_array(prefix + '_centroids.npy', self.centroids)
+        _save_array(prefix + '_offsets.npy', self.offsets)
+
+    @classmethod
+    def load(cls, prefix):
+        '''Loads an index saved with save, memory-mapping the item vectors.
+
+        Parameters:
+            prefix (str): Path prefix of the index files.
+
+        Returns:
+            ContentIndex: The loaded index.
+
+        Usage example:
+            index = ContentIndex.load('content_neighbors')
+        '''
+        with open(prefix + '_names.json') as f:
+            names = json.load(f)
+        return cls(names,
+                   np.load(prefix + '_vectors.npy', mmap_mode='r'),
+                   np.load(prefix + '_centroids.npy'),
+                   np.load(prefix + '_offsets.npy'))
+
+    def vector(self, name):
+        return np.asarray(self.vectors[self.positions[name]])
+
+    def search(self, query, n=5, n_probe=8, exclude=None):
+        '''Finds the items most similar to a unit-length query vector.
+
+        Parameters:
+            query (ndarray): Unit-length query vector.
+            n (int): Number of items to return.
+            n_probe (int): Number of closest clusters searched. Searching every cluster is exact.
+            exclude (str): Item left out of the result, e.g. the query item itself.
+
+        Returns:
+            tuple: Item positions and cosine similarities, most similar first.
+
+        Usage example:
+            positions, scores = index.search(index.vector('Qatar Airways'), 5)
+        '''
+        probe = np.argsort(-(self.centroids @ query), kind='stable')[:n_probe]
+        rows = np.sort(np.concatenate([np.arange(self.offsets[cluster], self.offsets[cluster + 1]) for cluster in probe]))
+        if exclude is not None:
+            rows = rows[rows != self.positions.get(exclude, -1)]
+        scores = np.asarray(self.vectors[rows] @ query)
+
+        # Select the top n without sorting every candidate, then order only those n
+        n = min(n, len(rows))
+        top = np.argpartition(-scores, n - 1)[:n] if n else np.empty(0, dtype='int64')
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return rows[top], scores[top]
+
+    def similar(self, name, n=5, n_probe=8):
+        '''Returns the n items most similar to an item.
+
+        Parameters:
+            name (str): Item to find neighbours for.
+            n (int): Number of neighbours to return.
+            n_probe (int): Number of closest clusters searched.
+
+        Returns:
+            DataFrame: Neighbour names and similarity scores, most similar first.
+
+        Usage example:
+            index.similar('Qatar Airways', 5)
+        '''
+        rows, scores = self.search(self.vector(name), n, n_probe, exclude=name)
+        return pd.DataFrame({'Airline': [self.names[row] for row in rows],
+                             'Similarity Score': scores.astype('float64')})
+
+def segment_item(airline, segment):
+    # Name of an airline within a segment in the per-segment content indexes, e.g. 'Qatar Airways | Business Class'
+    return f'{airline} | {segment}'
+
+def blend_similarity(content_index, rating_vectors, name, n=5, weight=0.5, candidates=50, n_probe=8):
+    '''Ranks airlines by a weighted mix of review-content similarity and rating similarity.
+
+    Candidates come from the content index, then both similarities are computed exactly for them.
+
+    Parameters:
+        content_index (ContentIndex): Per-airline content index.
+        rating_vectors (dict): Unit-length scaled rating vector per airline name, see scale_ratings.
+        name (str): Airline to find similar airlines for.
+        n (int): Number of airlines to return.
+        weight (float): Weight of the rating similarity, 0 for content only and 1 for ratings only.
+        candidates (int): Number of content neighbours re-scored.
+        n_probe (int): Number of closest clusters searched.
+
+    Returns:
+        DataFrame: Airline names and blended similarity scores, most similar first.
+
+    Usage example:
+        blend_similarity(index, dict(zip(df['airline_name'], scale_ratings(df))), 'Qatar Airways', weight=0.3)
+    '''
+    rows, content_scores = content_index.search(content_index.vector(name), max(candidates, n), n_probe, exclude=name)
+    names = [content_index.names[row] for row in rows]
+
+    # Airlines without ratings only score on their content
+    query = rating_vectors.get(name)
+    rating_scores = np.array([float(rating_vectors[other] @ query) if query is not None and other in rating_vectors
+                              else 0.0 for other in names])
+    scores = (1 - weight) * content_scores + weight * rating_scores
+    order = np.argsort(-scores, kind='stable')[:n]
+    return pd.DataFrame({'Airline': [names[position] for position in order],
+                         'Similarity Score': scores[order].astype('float64')})
+
+class RatingMatcher:
+    '''Scores every airline against aspect-rating queries, such as the sliders of the review form, with one matrix product.
+
+    In 'similar' mode a query is standardized like the airline ratings and airlines are ranked by cosine
+    similarity, so they share the strengths the user rated highly. In 'improve' mode every aspect is weighted
+    by how far the user's rating fell short of MAX_RATING, so airlines strong on the disappointing aspects win.
+
+    Usage example:
+        matcher = RatingMatcher(df['airline_name'], scaler.mean_, scaler.scale_, scaler.transform(df[RATING_COLUMNS]))
+        matcher.top([4, 5, 3, 2, 1, 0, 4], 5, mode='improve', exclude='Qatar Airways')
+    '''
+
+    MAX_RATING = 5
+
+    def __init__(self, names, mean, scale, scaled):
+        self.names = [str(name) for name in names]
+        self.mean = np.asarray(mean, dtype='float64')
+        self.scale = np.asarray(scale, dtype='float64')
+        self.scaled = np.asarray(scaled, dtype='float32')
+        norms = np.linalg.norm(self.scaled, axis=1, keepdims=True)
+        self.unit = self.scaled / np.where(norms == 0, 1.0, norms)
+        self.positions = {name: position for position, name in enumerate(self.names)}
+
+    def top_batch(self, ratings, n=5, mode='similar', exclude=None):
+        '''Finds the n best-matching airlines for many queries at once.
+
+        Parameters:
+            ratings (ndarray): One row of aspect ratings per query, in the order of RATING_COLUMNS.
+            n (int): Number of airlines per query.
+            mode (str): 'similar' or 'improve'.
+            exclude (list): Airline left out of the result of every query, or None.
+
+        Returns:
+            tuple: Airline positions and scores, one row per query, best first.
+
+        Usage example:
+            positions, scores = matcher.top_batch(user_ratings, 10)
+        '''
+        ratings = np.atleast_2d(np.asarray(ratings, dtype='float64'))
+        if mode == 'similar':
+            queries, matrix = (ratings - self.mean) / np.where(self.scale == 0, 1.0, self.scale), self.unit
+        elif mode == 'improve':
+            queries, matrix = self.MAX_RATING - ratings, self.scaled
+        else:
+            raise ValueError(f'Unknown mode {mode!r}')
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        scores = (queries / np.where(norms == 0, 1.0, norms)).astype('float32') @ matrix.T
+
+        if exclude is not None:
+            rows = [row for row, name in enumerate(exclude) if name in self.positions]
+            scores[rows, [self.positions[exclude[row]] for row in rows]] = -np.inf
+
+        # Select the top n without sorting every airline, then order only those n
+        n = min(n, scores.shape[1] - (exclude is not None))
+        if n <= 0:
+            # Nothing to rank, e.g. a single airline once the query airline is left out
+            return np.zeros((len(scores), 0), dtype='int64'), np.zeros((len(scores), 0), dtype='float32')
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def top(self, ratings, n=5, mode='similar', exclude=None):
+        '''Finds the n best-matching airlines for one query.
+
+        Parameters:
+            ratings (list): Aspect ratings in the order of RATING_COLUMNS.
+            n (int): Number of airlines to return.
+            mode (str): 'similar' or 'improve'.
+            exclude (str): Airline left out of the result, e.g. the one the user just rated.
+
+        Returns:
+            DataFrame: Airline names and match scores, best first.
+
+        Usage example:
+            matcher.top([4, 5, 3, 2, 1, 0, 4], 5)
+        '''
+        positions, scores = self.top_batch([ratings], n, mode, None if exclude is None else [exclude])
+        return pd.DataFrame({'Airline': [self.names[position] for position in positions[0]],
+                             'Match Score': scores[0].astype('float64')})
+
+    def recommend(self, users, n=5, mode='similar', exclude_column=None):
+        '''Precomputes recommendations for a table of users, e.g. offline.
+
+        Parameters:
+            users (DataFrame): One row per user with the columns in RATING_COLUMNS.
+            n (int): Number of airlines per user.
+            mode (str): 'similar' or 'improve'.
+            exclude_column (str): Column with the airline to leave out for every user, or None.
+
+        Returns:
+            DataFrame: user (index label), rank, airline_name and score columns.
+
+        Usage example:
+            matcher.recommend(users, 10, mode='improve', exclude_column='airline_name')
+        '''
+        exclude = users[exclude_column].astype(str).tolist() if exclude_column else None
+        positions, scores = self.top_batch(users[RATING_COLUMNS].to_numpy(), n, mode, exclude)
+        return pd.DataFrame({'user': np.repeat(users.index.to_numpy(), positions.shape[1]),
+                             'rank': np.tile(np.arange(1, positions.shape[1] + 1), len(users)),
+                             'airline_name': np.array(self.names, dtype=object)[positions.ravel()],
+                             'score': scores.ravel().astype('float64')})
+
+def build_ranking(ratings, segments=None, top_n=50, min_reviews=5):
+    '''Ranks airlines by their mean rating overall and within every segment.
+
+    Parameters:
+        ratings (DataFrame): Per-airline ratings table with the columns in RATING_COLUMNS.
+        segments (dict): Per-segment ratings tables keyed by segment column, e.g. {'seat_type': table}.
+            Every table needs the segment column, airline_name, RATING_COLUMNS and review_count.
+        top_n (int): Number of airlines kept per ranking.
+        min_reviews (int): Minimum number of reviews for an airline to be ranked within a segment.
+
+    Returns:
+        DataFrame: Rankings with segment_type, segment, rank, airline_name and mean_rating columns.
+
+    Usage example:
+        ranking = build_ranking(df, {'seat_type': seat_ratings}, top_n=20)
+    '''
+    # Overall ranking, with the same tie-breaking as Series.nlargest
+    mean_ratings = ratings[RATING_COLUMNS].mean(axis=1)
+    top = mean_ratings.nlargest(top_n)
+    frames = [pd.DataFrame({'segment_type': 'all',
+                            'segment': '',
+                            'airline_name': ratings.loc[top.index, 'airline_name'].astype(str).values,
+                            'mean_rating': top.values})]
+
+    # Ranking within every value of every segment column
+    for segment_type, table in (segments or {}).items():
+        table = table[table['review_count'] >= min_reviews]
+        table = table.assign(mean_rating=table[RATING_COLUMNS].mean(axis=1))
+        table = table.sort_values('mean_rating', ascending=False, kind='stable').groupby(segment_type).head(top_n)
+        frames.append(pd.DataFrame({'segment_type': segment_type,
+                                    'segment': table[segment_type].astype(str).values,
+                                    'airline_name': table['airline_name'].astype(str).values,
+                                    'mean_rating': table['mean_rating'].values}))
+
+    ranking = pd.concat(frames, ignore_index=True)
+    ranking['rank'] = ranking.groupby(['segment_type', 'segment']).cumcount() + 1
+    return ranking[['segment_type', 'segment', 'rank', 'airline_name', 'mean_rating']]
+
+class Ranking:
+    '''Precomputed top-rated airlines, overall and per segment, served without touching the ratings table.
+
+    Usage example:
+        ranking = Ranking(read_table('airline_ranking'))
+        ranking.top(5, exclude='Qatar Airways')
+    '''
+
+    def __init__(self, ranking):
+        ranking = ranking.astype({'segment_type': str, 'segment': str, 'airline_name': str})
+        self.rankings = {key: group.sort_values('rank').reset_index(drop=True)
+                         for key, group in ranking.groupby(['segment_type', 'segment'])}
+
+    def top(self, n=5, exclude=None, segment_type='all', segment=''):
+        '''Returns the n top-rated airlines of a ranking.
+
+        Falls back to the overall ranking when the segment has fewer than n airlines.
+
+        Parameters:
+            n (int): Number of airlines to return.
+            exclude (str): Airline left out of the result, e.g. the one the user just rated.
+            segment_type (str): 'all', or the segment column such as 'seat_type' or 'type_of_traveller'.
+            segment (str): Segment value, e.g. 'Business Class'. Ignored for 'all'.
+
+        Returns:
+            DataFrame: Airline names and mean ratings, best first.
+
+        Usage example:
+            ranking.top(5, segment_type='seat_type', segment='Economy Class')
+        '''
+        ranking = self.rankings.get((segment_type, segment if segment_type != 'all' else ''))
+        if ranking is None or len(ranking) - (exclude is not None) < n:
+            ranking = self.rankings[('all', '')]
+        if exclude is not None:
+            ranking = ranking[ranking['airline_name'] != exclude]
+        ranking = ranking.head(n)
+        return pd.DataFrame({'Airline': ranking['airline_name'].values, 'Mean Rating': ranking['mean_rating'].values})
@@ -0,0 +1,212 @@
+# Import libraries
+import os
+import time
+import threading
+from storage import read_table
+
+# Locations of the model and of the artifacts precomputed by the DAG
+MODEL_PATH = os.path.join('unzipped_model', 'model_logreg')
+LITE_MODEL_PATH = 'model_logreg_lite.npz'
+RATING_TABLE = 'rating_table'
+RATING_SCALING_PATH = 'rating_scaling.json'
+NEIGHBOR_INDEX_PREFIX = 'rating_neighbors'
+CONTENT_INDEX_PREFIX = 'content_neighbors'
+EDA_STATS_PATH = 'eda_stats.json'
+
+# Ratings exported from the notebook, served until the DAG has written its ratings table
+LEGACY_RATINGS_TABLE = 'avg_ratings_per_airline'
+
+# Process-wide cache of loaded resources, shared by every Streamlit session and rerun
+_resources = {}
+_timings = {}
+_locks = {}
+_locks_guard = threading.Lock()
+
+def get_resource(name, loader):
+    '''Returns a process-wide resource, loading it on first use only.
+
+    Parameters:
+        name (str): Name of the resource.
+        loader (function): Function without arguments that loads the resource.
+
+    Returns:
+        object: The loaded resource.
+
+    Usage example:
+        data = get_resource('reviews', lambda: read_table('airline_review_cleaned'))
+    '''
+    if name in _resources:
+        return _resources[name]
+
+    # One lock per resource, so a slow model load does not block the other pages
+    with _locks_guard:
+        lock = _locks.setdefault(name, threading.Lock())
+    with lock:
+        if name not in _resources:
+            start = time.perf_counter()
+            _resources[name] = loader()
+            _timings[name] = round(time.perf_counter() - start, 3)
+    return _resources[name]
+
+def timings():
+    '''Returns how many seconds every loaded resource took to load.
+
+    Parameters:
+        None
+
+    Returns:
+        dict: Load time in seconds per resource name.
+
+    Usage example:
+        print(timings())
+    '''
+    return dict(_timings)
+
+def model():
+    # The NumPy export is served when present, TensorFlow is only imported when falling back to Keras
+    def load():
+        from batch_predict import load_sentiment_model
+        from prediction_cache import CachedModel, PredictionCache, model_namespace
+        path = LITE_MODEL_PATH if os.path.exists(LITE_MODEL_PATH) else MODEL_PATH
+        return CachedModel(load_sentiment_model(path), PredictionCache(namespace=model_namespace(path)))
+    return get_resource('model', load)
+
+def preprocessor():
+    # Importing the module checks the NLTK corpora and loads the stopwords
+    def load():
+        from text_preprocessing import preprocess_text
+        return preprocess_text
+    return get_resource('preprocessor', load)
+
+def ratings():
+    # Ratings per airline aggregated by the DAG, or the notebook export when the DAG has not run yet
+    def load():
+        try:
+            return read_table(RATING_TABLE)
+        except FileNotFoundError:
+            return read_table(LEGACY_RATINGS_TABLE)
+    return get_resource('ratings', load)
+
+def rating_scaling():
+    # Standardization the DAG built its neighbour index with, empty to fit it on the ratings when missing
+    def load():
+        import json
+        if os.path.exists(RATING_SCALING_PATH):
+            with open(RATING_SCALING_PATH) as f:
+                return json.load(f)
+        return {}
+    return get_resource('rating_scaling', load)
+
+def reviews():
+    return get_resource('reviews', lambda: read_table('airline_review_cleaned'))
+
+def eda_stats():
+    # Compact statistics built by the DAG, or accumulated from the reviews once when missing
+    def load():
+        import json
+        from eda_stats import EdaStats
+        if os.path.exists(EDA_STATS_PATH):
+            with open(EDA_STATS_PATH) as f:
+                return json.load(f)
+        return EdaStats().partial_fit(reviews()).summary()
+    return get_resource('eda_stats', load)
+
+def review_search():
+    # Searches the Elasticsearch index loaded by the DAG, or the reviews in process when it cannot be reached
+    def load():
+        from review_search import ReviewSearch, LocalSearch, ES_URL
+        try:
+            from elasticsearch import Elasticsearch
+            es = Elasticsearch(ES_URL)
+            if es.ping():
+                return ReviewSearch(es)
+        except ImportError:
+            pass
+        return ReviewSearch(LocalSearch(reviews()))
+    return get_resource('review_search', load)
+
+def review_options():
+    # Choices of the review form, read from the two columns they come from
+    def load():
+        options = read_table('airline_review_cleaned', columns=['type_of_traveller', 'seat_type'])
+        return {column: options[column].dropna().unique().tolist() for column in options.columns}
+    return get_resource('review_options', load)
+
+def rating_scaler():
+    # StandardScaler fitted on the airline ratings, with the scaled ratings matrix
+    def load():
+        from sklearn.preprocessing import StandardScaler
+        from recommenders import RATING_COLUMNS
+        scaler = StandardScaler()
+        return scaler, scaler.fit_transform(ratings()[RATING_COLUMNS])
+    return get_resource('rating_scaler', load)
+
+def neighbor_index():
+    # Top-K similar airlines precomputed by the DAG, or built from the ratings when missing
+    def load():
+        from recommenders import NeighborIndex, scale_ratings
+        if os.path.exists(NEIGHBOR_INDEX_PREFIX + '_neighbors.npy'):
+            return NeighborIndex.load(NEIGHBOR_INDEX_PREFIX)
+        return NeighborIndex.build(ratings()['airline_name'].astype(str), scale_ratings(ratings(), **rating_scaling()))
+    return get_resource('neighbor_index', load)
+
+def rating_vectors():
+    # Unit-length scaled ratings per airline, used to blend rating similarity into the content recommendations
+    def load():
+        from recommenders import scale_ratings
+        return dict(zip(ratings()['airline_name'].astype(str), scale_ratings(ratings(), **rating_scaling())))
+    return get_resource('rating_vectors', load)
+
+def rating_matcher():
+    # Matches the sliders of the review form against the scaled airline ratings
+    def load():
+        from recommenders import RatingMatcher
+        scaler, scaled = rating_scaler()
+        return RatingMatcher(ratings()['airline_name'], scaler.mean_, scaler.scale_, scaled)
+    return get_resource('rating_matcher', load)
+
+def content_index(segment_type=None):
+    # Review-content index built by the DAG, per airline or per airline within a segment, None when missing
+    prefix = CONTENT_INDEX_PREFIX if segment_type is None else CONTENT_INDEX_PREFIX + '_' + segment_type
+    def load():
+        from recommenders import ContentIndex
+        return ContentIndex.load(prefix) if os.path.exists(prefix + '_vectors.npy') else None
+    return get_resource(prefix, load)
+
+def ranking():
+    # Top-rated airlines precomputed by the DAG, or ranked from the ratings when missing
+    def load():
+        from recommenders import Ranking, build_ranking
+        try:
+            return Ranking(read_table('airline_ranking'))
+        except FileNotFoundError:
+            return Ranking(build_ranking(ratings()))
+    return get_resource('ranking', load)
+
+def metrics_server():
+    # Prometheus endpoint of the app process, only started when FLIGHTBUDDY_METRICS_PORT is set
+    def load():
+        from instrumentation import serve_metrics
+        port = os.environ.get('FLIGHTBUDDY_METRICS_PORT')
+        return serve_metrics(int(port)) if port else None
+    return get_resource('metrics_server', load)
+
+def warm_up():
+    '''Loads every resource of the Review Prediction page ahead of the first request.
+
+    Parameters:
+        None
+
+    Returns:
+        dict: Load time in seconds per resource name.
+
+    Usage example:
+        warm_up()
+    '''
+    for loader in [preprocessor, model, ratings, review_options, neighbor_index, ranking]:
+        loader()
+    return timings()
+
+# Print the warm-up timings, e.g. python resources.py
+if __name__ == '__main__':
+    print(warm_up())
@@ -0,0 +1,360 @@
+# Import libraries
+import os
+import re
+import numpy as np
+import pandas as pd
+
+# Index loaded by the DAG and the address the app reaches it at
+INDEX = 'finpro'
+ES_URL = os.environ.get('ELASTICSEARCH_URL', 'http://localhost:9200')
+
+# Rating columns of the index, named like the DAG tables
+RATING_FIELDS = ['seat_comfort', 'cabin_staff_service', 'food_beverages', 'ground_service',
+                 'inflight_entertainment', 'wifi_connectivity', 'value_for_money']
+
+# Fields returned with every hit
+SOURCE_FIELDS = ['airline_name', 'review_title', 'review', 'type_of_traveller', 'seat_type', 'route', 'date_flown',
+                 'recommended'] + RATING_FIELDS
+
+# Explicit mapping, so only the fields that are searched are analysed and the ratings are numbers
+REVIEW_MAPPING = {
+    'dynamic': False,
+    'properties': {
+        'id': {'type': 'long'},
+        'airline_name': {'type': 'keyword'},
+        'overall_rating': {'type': 'float', 'ignore_malformed': True},
+        'review_title': {'type': 'text'},
+        'review_date': {'type': 'keyword'},
+        'verified': {'type': 'boolean'},
+
+        # Reviews are matched by terms only, so positions are not indexed
+        'review': {'type': 'text', 'index_options': 'freqs'},
+        'aircraft': {'type': 'keyword', 'ignore_above': 256},
+        'type_of_traveller': {'type': 'keyword'},
+        'seat_type': {'type': 'keyword'},
+        'route': {'type': 'keyword', 'ignore_above': 256},
+        'date_flown': {'type': 'date', 'format': 'MMMM yyyy||yyyy-MM-dd', 'ignore_malformed': True},
+        **{field: {'type': 'float'} for field in RATING_FIELDS},
+        'recommended': {'type': 'keyword'},
+        'predicted_sentiment': {'type': 'byte'}}}
+
+# One shard and no replicas, matching the single-node cluster of airflow_ES.yaml
+REVIEW_SETTINGS = {'number_of_shards': 1, 'number_of_replicas': 0}
+
+# Sets the ID of a copied document from its row ID, so indexes loaded with generated IDs are keyed like the bulk load
+MIGRATION_SCRIPT = 'if (ctx._source.id != null) { ctx._id = ctx._source.id.toString() }'
+
+# Notebook column names mapped to the names of the index
+COLUMN_ALIASES = {'food_and_beverages': 'food_beverages', 'wifi_and_connectivity': 'wifi_connectivity'}
+
+def _normalized(value):
+    # Elasticsearch returns mapping parameters as strings, e.g. 'dynamic': 'false'
+    if isinstance(value, dict):
+        return {key: _normalized(item) for key, item in value.items()}
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+def mapping_matches(es, index=INDEX):
+    '''Checks whether the live mapping of an existing index is the explicit review mapping.
+
+    Parameters:
+        es (Elasticsearch): Connected Elasticsearch client.
+        index (str): Name of the index.
+
+    Returns:
+        bool: Whether the mappings are the same, False for an index loaded with a dynamic mapping.
+
+    Usage example:
+        mapping_matches(Elasticsearch('http://localhost:9200'))
+    '''
+    mappings = es.indices.get_mapping(index=index).get(index, {}).get('mappings', {})
+    return _normalized(mappings) == _normalized(REVIEW_MAPPING)
+
+def _copy_index(es, source, target):
+    # Copy every document server side, keyed by its row ID, and stop before anything is deleted when a copy fails
+    response = es.reindex(body={'source': {'index': source},
+                                'dest': {'index': target},
+                                'script': {'lang': 'painless', 'source': MIGRATION_SCRIPT}},
+                          refresh=True, wait_for_completion=True, request_timeout=3600)
+    if response.get('failures'):
+        raise RuntimeError(f"Copying index '{source}' to '{target}' failed: {response['failures'][:5]}")
+    return response.get('total', 0)
+
+def migrate_review_index(es, index=INDEX):
+    '''Moves the documents of an index onto the explicit mapping and the row ID document keys.
+
+    Elasticsearch cannot change the type of a mapped field, so the documents are copied to a temporary index
+    with the explicit mapping, the index is recreated and the documents are copied back. Documents indexed
+    with generated IDs get their row ID, so the incremental loads overwrite them instead of adding duplicates.
+
+    Parameters:
+        es (Elasticsearch): Connected Elasticsearch client.
+        index (str): Name of the index.
+
+    Returns:
+        int: Number of documents migrated.
+
+    Usage example:
+        migrate_review_index(Elasticsearch('http://localhost:9200'))
+    '''
+    temporary = index + '_migration'
+    body = {'settings': REVIEW_SETTINGS, 'mappings': REVIEW_MAPPING}
+    if es.indices.exists(index=temporary):
+        es.indices.delete(index=temporary)
+    es.indices.create(index=temporary, body=body)
+    _copy_index(es, index, temporary)
+
+    es.indices.delete(index=index)
+    es.indices.create(index=index, body=body)
+    docs = _copy_index(es, temporary, index)
+    es.indices.delete(index=temporary)
+    print('Migrated index: ', {'index': index, 'docs': docs})
+    return docs
+
+def create_review_index(es, index=INDEX, recreate=False):
+    '''Creates the review index with the explicit mapping, migrating an existing index with another mapping.
+
+    Parameters:
+        es (Elasticsearch): Connected Elasticsearch client.
+        index (str): Name of the index.
+        recreate (bool): Whether an existing index is deleted first, e.g. before a full reload.
+
+    Returns:
+        bool: Whether the index was created or migrated.
+
+    Usage example:
+        create_review_index(Elasticsearch('http://localhost:9200'))
+    '''
+    if es.indices.exists(index=index):
+        if not recreate:
+            # An index from before the explicit mapping, e.g. the dynamic one of the first DAG, is migrated once
+            if mapping_matches(es, index):
+                return False
+            migrate_review_index(es, index)
+            return True
+        es.indices.delete(index=index)
+    es.indices.create(index=index, body={'settings': REVIEW_SETTINGS, 'mappings': REVIEW_MAPPING})
+    return True
+
+def build_query(text=None, airline=None, seat_type=None, type_of_traveller=None, recommended=None,
+                flown_from=None, flown_to=None):
+    '''Builds the query of a filtered keyword search, with every filter in a non-scoring filter clause.
+
+    Parameters:
+        text (str): Keywords matched against the review title and text, every review when None.
+        airline (str or list): Airline name or names.
+        seat_type (str or list): Seat type or types.
+        type_of_traveller (str or list): Traveller type or types.
+        recommended (str): 'yes' or 'no'.
+        flown_from (str): First month flown, as yyyy-MM-dd.
+        flown_to (str): Last month flown, as yyyy-MM-dd.
+
+    Returns:
+        dict: Elasticsearch bool query.
+
+    Usage example:
+        query = build_query('legroom', airline='Qatar Airways', seat_type='Economy Class')
+    '''
+    filters = []
+    for field, value in [('airline_name', airline), ('seat_type', seat_type),
+                         ('type_of_traveller', type_of_traveller), ('recommended', recommended)]:
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple)):
+            filters.append({'terms': {field: list(value)}})
+        else:
+            filters.append({'term': {field: value}})
+    if flown_from or flown_to:
+        bounds = {key: value for key, value in [('gte', flown_from), ('lte', flown_to)] if value}
+        filters.append({'range': {'date_flown': bounds}})
+
+    must = [{'multi_match': {'query': text, 'fields': ['review_title^2', 'review']}}] if text else []
+    return {'bool': {'must': must, 'filter': filters}}
+
+class ReviewSearch:
+    '''Filtered keyword search and per-airline aggregations over the review index.
+
+    Works against Elasticsearch or against LocalSearch, which answers the same requests from a DataFrame.
+
+    Usage example:
+        search = ReviewSearch(Elasticsearch('http://localhost:9200'))
+        search.search('legroom', airline='Qatar Airways')
+        search.airline_summary(seat_type='Business Class')
+    '''
+
+    def __init__(self, es, index=INDEX):
+        self.es = es
+        self.index = index
+
+    def search(self, text=None, size=10, offset=0, **filters):
+        '''Finds the reviews matching keywords and filters, best matches first.
+
+        Parameters:
+            text (str): Keywords, every review when None.
+            size (int): Number of reviews returned.
+            offset (int): Number of best matches skipped, for paging.
+            **filters: Filters of build_query, e.g. airline or seat_type.
+
+        Returns:
+            tuple: Matching reviews with their score (DataFrame) and the total number of matches.
+
+        Usage example:
+            reviews, total = search.search('legroom', airline='Qatar Airways')
+        '''
+        body = {'query': build_query(text, **filters),
+                'size': size,
+                'from': offset,
+                '_source': SOURCE_FIELDS}
+        response = self.es.search(index=self.index, body=body)
+        hits = response['hits']['hits']
+        reviews = pd.DataFrame([{**hit['_source'], 'score': hit['_score']} for hit in hits],
+                               columns=SOURCE_FIELDS + ['score'])
+        return reviews, response['hits']['total']['value']
+
+    def airline_summary(self, text=None, n_airlines=20, order='review_count', **filters):
+        '''Aggregates the matching reviews per airline in a single request, without returning any review.
+
+        Parameters:
+            text (str): Keywords, every review when None.
+            n_airlines (int): Number of airlines returned.
+            order (str): 'review_count', or a rating field to rank the airlines by its average.
+            **filters: Filters of build_query, e.g. seat_type or recommended.
+
+        Returns:
+            DataFrame: Review count, recommended share and average ratings per airline.
+
+        Usage example:
+            summary = search.airline_summary(seat_type='Business Class', order='seat_comfort')
+        '''
+        ordering = {'_count': 'desc'} if order == 'review_count' else {'avg_' + order: 'desc'}
+        body = {'query': build_query(text, **filters),
+                'size': 0,
+                'aggs': {'airlines': {'terms': {'field': 'airline_name', 'size': n_airlines, 'order': ordering},
+                                      'aggs': {'recommended': {'filter': {'term': {'recommended': 'yes'}}},
+                                               **{'avg_' + field: {'avg': {'field': field}} for field in RATING_FIELDS}}}}}
+        response = self.es.search(index=self.index, body=body, request_cache=True)
+        rows = [{'airline_name': bucket['key'],
+                 'review_count': bucket['doc_count'],
+                 'recommended_share': bucket['recommended']['doc_count'] / bucket['doc_count'] if bucket['doc_count'] else None,
+                 **{'avg_' + field: bucket['avg_' + field]['value'] for field in RATING_FIELDS}}
+                for bucket in response['aggregations']['airlines']['buckets']]
+        return pd.DataFrame(rows, columns=['airline_name', 'review_count', 'recommended_share']
+                            + ['avg_' + field for field in RATING_FIELDS])
+
+# Words as split by the standard analyzer, closely enough for the local stand-in
+token_pattern = re.compile(r'\w+')
+
+class LocalSearch:
+    '''In-process stand-in for Elasticsearch, answering the requests of ReviewSearch from a DataFrame.
+
+    Scores keyword matches by the number of matching terms, weighted by the field boosts, instead of BM25.
+
+    Usage example:
+        search = ReviewSearch(LocalSearch(read_table('airline_review_cleaned')))
+    '''
+
+    def __init__(self, data):
+        self.data = data.rename(columns=COLUMN_ALIASES).reset_index(drop=True)
+        self.dates = pd.to_datetime(self.data['date_flown'], format='%B %Y', errors='coerce') if 'date_flown' in self.data else None
+        self._tokens = {}
+        self._masks = {}
+
+    def _field_tokens(self, field):
+        # Token sets per review, computed once per field
+        if field not in self._tokens:
+            self._tokens[field] = [set(token_pattern.findall(str(value).lower())) if isinstance(value, str) else set()
+                                   for value in self.data[field]]
+        return self._tokens[field]
+
+    def _filter(self, clause):
+        kind, spec = next(iter(clause.items()))
+        field, value = next(iter(spec.items()))
+        column = self.data[field].astype(object)
+        if kind == 'term':
+            return (column == value).to_numpy()
+        if kind == 'terms':
+            return column.isin(value).to_numpy()
+        if kind == 'range':
+            values = self.dates if field == 'date_flown' else pd.to_numeric(column, errors='coerce')
+            mask = values.notna().to_numpy()
+            for operator, bound in value.items():
+                bound = pd.Timestamp(bound) if field == 'date_flown' else bound
+                mask &= {'gte': values >= bound, 'gt': values > bound, 'lte': values <= bound, 'lt': values < bound}[operator].to_numpy()
+            return mask
+        raise ValueError(f'Unsupported filter: {kind}')
+
+    def _score(self, clause):
+        spec = clause['multi_match']
+        terms = set(token_pattern.findall(spec['query'].lower()))
+        scores = np.zeros(len(self.data))
+        for field in spec['fields']:
+            name, _, boost = field.partition('^')
+            scores += float(boost or 1) * np.array([len(terms & tokens) for tokens in self._field_tokens(name)])
+        return scores
+
+    def _aggregate(self, aggs, rows):
+        result = {}
+        for name, spec in aggs.items():
+            if 'avg' in spec:
+                values = pd.to_numeric(self.data[spec['avg']['field']].iloc[rows], errors='coerce')
+                result[name] = {'value': None if values.isna().all() else float(values.mean())}
+            elif 'filter' in spec:
+                # Aggregation filters are fixed, so their masks are computed once
+                key = repr(spec['filter'])
+                if key not in self._masks:
+                    self._masks[key] = self._filter(spec['filter'])
+                matching = rows[self._masks[key][rows]]
+                result[name] = {'doc_count': len(matching), **self._aggregate(spec.get('aggs', {}), matching)}
+            elif 'terms' in spec:
+                terms = spec['terms']
+                groups = pd.Series(rows).groupby(self.data[terms['field']].astype(object).iloc[rows].to_numpy())
+                buckets = [{'key': key, 'doc_count': len(group), **self._aggregate(spec.get('aggs', {}), group.to_numpy())}
+                           for key, group in groups]
+                (metric, direction), = terms.get('order', {'_count': 'desc'}).items()
+                value = (lambda bucket: bucket['doc_count']) if metric == '_count' else (lambda bucket: bucket[metric]['value'] or 0)
+                buckets.sort(key=value, reverse=direction == 'desc')
+                result[name] = {'buckets': buckets[:terms.get('size', 10)]}
+            else:
+                raise ValueError(f'Unsupported aggregation: {name}')
+        return result
+
+    def search(self, index=None, body=None, **kwargs):
+        '''Answers a search request the way Elasticsearch does.
+
+        Parameters:
+            index (str): Ignored, the stand-in holds one index.
+            body (dict): Search request with a bool query, paging, _source and aggregations.
+            **kwargs: Ignored request parameters, e.g. request_cache.
+
+        Returns:
+            dict: Search response with hits and aggregations.
+
+        Usage example:
+            response = LocalSearch(data).search(body={'query': build_query('legroom')})
+        '''
+        body = body or {}
+        query = body.get('query', {}).get('bool', {})
+        mask = np.ones(len(self.data), dtype=bool)
+        for clause in query.get('filter', []):
+            mask &= self._filter(clause)
+        scores = np.zeros(len(self.data))
+        for clause in query.get('must', []):
+            clause_scores = self._score(clause)
+            mask &= clause_scores > 0
+            scores += clause_scores
+        rows = np.flatnonzero(mask)
+
+        # Best scores first, ties in index order like a single-shard index
+        ranked = rows[np.argsort(-scores[rows], kind='stable')]
+        start = body.get('from', 0)
+        page = ranked[start:start + body.get('size', 10)]
+        fields = [field for field in body.get('_source', self.data.columns) if field in self.data.columns]
+        sources = self.data[fields].iloc[page].astype(object)
+        sources = sources.where(sources.notna(), None).to_dict(orient='records')
+        response = {'hits': {'total': {'value': len(rows), 'relation': 'eq'},
+                             'hits': [{'_index': index, '_score': float(scores[row]), '_source': source}
+                                      for row, source in zip(page, sources)]}}
+        if 'aggs' in body:
+            response['aggregations'] = self._aggregate(body['aggs'], rows)
+        return response
@@ -0,0 +1,229 @@
+# Import libraries
+import json
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+from collections import deque, Counter
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import resources
+from instrumentation import timer, render_prometheus
+
+# Labels of the model outputs
+SENTIMENTS = {0: 'negative', 1: 'positive'}
+
+class Server(ThreadingHTTPServer):
+    # Queue bursts of connections instead of resetting them
+    request_queue_size = 128
+    daemon_threads = True
+
+class MicroBatcher:
+    '''Gathers concurrent prediction requests into batches for a single model call.
+
+    A batch is sent to the model as soon as it holds max_batch_size texts, or max_wait_ms after its first
+    text arrived, so batches grow with the load while a lone request waits at most max_wait_ms.
+
+    Usage example:
+        batcher = MicroBatcher(model.predict)
+        future = batcher.submit('great seats and friendly crew')
+        print(future.result())
+    '''
+
+    def __init__(self, predict, max_batch_size=64, max_wait_ms=5, history=10000):
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+
+        # Metrics over the most recent requests
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=history)
+        self.batch_sizes = Counter()
+        self.requests = 0
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, text):
+        '''Queues one preprocessed text and returns a future resolving to its prediction.
+
+        Parameters:
+            text (str): Preprocessed review text.
+
+        Returns:
+            Future: Resolves to the model output row of the text.
+
+        Usage example:
+            probabilities = batcher.submit(text).result()
+        '''
+        future = Future()
+        self.queue.put((text, future, time.perf_counter()))
+        return future
+
+    def _run(self):
+        while True:
+            # Block for the first text, then fill the batch until it is full or the deadline passes
+            batch = [self.queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts, futures, submitted = zip(*batch)
+            try:
+                with timer('model_predict', path='serve') as span:
+                    predictions = self.predict(np.array(texts, dtype=object))
+                    span.record(rows=len(texts))
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+                continue
+
+            done = time.perf_counter()
+            for future, prediction in zip(futures, predictions):
+                future.set_result(prediction)
+            with self.lock:
+                self.requests += len(batch)
+                self.batch_sizes[len(batch)] += 1
+                self.latencies.extend((done - start) * 1000 for start in submitted)
+
+    def metrics(self):
+        '''Summarises request latency and batch sizes.
+
+        Parameters:
+            None
+
+        Returns:
+            dict: Request count, p50/p99 latency in milliseconds and batch size statistics.
+
+        Usage example:
+            print(batcher.metrics())
+        '''
+        with self.lock:
+            latencies = np.array(self.latencies)
+            batch_sizes = dict(self.batch_sizes)
+            requests = self.requests
+        batches = sum(batch_sizes.values())
+        return {'requests': requests,
+                'batches': batches,
+                'mean_batch_size': round(requests / batches, 2) if batches else 0.0,
+                'batch_size_counts': {str(size): count for size, count in sorted(batch_sizes.items())},
+                'latency_p50_ms': round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+                'latency_p99_ms': round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None}
+
+def format_prediction(prediction):
+    # Turn one model output row into the JSON response of a review
+    label = int(np.argmax(prediction))
+    return {'label': label, 'sentiment': SENTIMENTS[label], 'positive_probability': float(prediction[1])}
+
+def make_handler(batcher, cache=None):
+    '''Creates the HTTP request handler serving the batcher.
+
+    Endpoints:
+        POST /predict        {"review": "..."}           -> one prediction
+        POST /predict/batch  {"reviews": ["...", ...]}   -> {"predictions": [...]}
+        GET  /metrics                                    -> latency and batch size metrics
+        GET  /metrics/prometheus                         -> stage latency histograms and counters, Prometheus text format
+        GET  /health                                     -> {"status": "ok"}
+
+    Parameters:
+        batcher (MicroBatcher): Batcher wrapping the model.
+        cache (PredictionCache): Cache in front of the model, reported under /metrics.
+
+    Returns:
+        class: Request handler class for Server.
+
+    Usage example:
+        server = Server(('0.0.0.0', 8000), make_handler(batcher))
+    '''
+    preprocess_text = resources.preprocessor()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send(200, {'status': 'ok'})
+            elif self.path == '/metrics':
+                metrics = batcher.metrics()
+                if cache is not None:
+                    metrics['cache'] = cache.metrics()
+                self._send(200, metrics)
+            elif self.path == '/metrics/prometheus':
+                payload = render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            else:
+                self._send(404, {'error': 'not found'})
+
+        def do_POST(self):
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if self.path == '/predict':
+                    reviews = [body['review']]
+                elif self.path == '/predict/batch':
+                    reviews = body['reviews']
+
+                    # A string would otherwise be scored character by character
+                    if not isinstance(reviews, list):
+                        raise TypeError('reviews must be a list of strings')
+                else:
+                    self._send(404, {'error': 'not found'})
+                    return
+                if not all(isinstance(review, str) and review.strip() for review in reviews):
+                    raise ValueError('reviews must be non-empty strings')
+            except (ValueError, KeyError, TypeError) as error:
+                self._send(400, {'error': str(error)})
+                return
+
+            # Preprocess in this request thread, then let the batcher merge the model call with other requests.
+            # A failing model call is re-raised by its future, counted as an error of the stage and answered with a 500
+            try:
+                with timer('serve_request', endpoint=self.path) as request:
+                    with timer('preprocess_text', path='serve'):
+                        texts = [preprocess_text(review) for review in reviews]
+                    futures = [batcher.submit(text) for text in texts]
+                    predictions = [format_prediction(future.result()) for future in futures]
+                    request.record(rows=len(reviews))
+            except Exception as error:
+                self._send(500, {'error': f'{type(error).__name__}: {error}'})
+                return
+            self._send(200, predictions[0] if self.path == '/predict' else {'predictions': predictions})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+# Start the service, e.g. python serve.py --port 8000
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sentiment prediction service with dynamic micro-batching.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=64, help='Maximum number of reviews per model call.')
+    parser.add_argument('--max-wait-ms', type=float, default=5, help='Maximum time a review waits for its batch to fill.')
+    args = parser.parse_args()
+
+    model = resources.model()
+    batcher = MicroBatcher(lambda texts: model.predict(texts, batch_size=len(texts), verbose=0),
+                           max_batch_size=args.max_batch_size,
+                           max_wait_ms=args.max_wait_ms)
+    server = Server((args.host, args.port), make_handler(batcher, getattr(model, 'cache', None)))
+    print(f'Serving on {args.host}:{args.port}, warm-up timings: ', resources.timings())
+    server.serve_forever()
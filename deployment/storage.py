@@ -0,0 +1,414 @@
+# Import libraries
+import os
+import sys
+import glob
+import queue
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+from instrumentation import record
+
+# Default on-disk format for tables passed between the DAG tasks and the app
+STORAGE_FORMAT = os.environ.get('FLIGHTBUDDY_STORAGE_FORMAT', 'parquet')
+
+# Low-cardinality text columns stored as categoricals
+CATEGORICAL_COLUMNS = ['airline_name', 'seat_type', 'type_of_traveller', 'recommended']
+
+# Explicit dtypes for the known columns, covering both the DAG and the notebook column names
+RATING_COLUMNS = ['seat_comfort', 'cabin_staff_service', 'food_beverages', 'food_and_beverages', 'ground_service',
+                  'inflight_entertainment', 'wifi_connectivity', 'wifi_and_connectivity', 'value_for_money']
+COLUMN_DTYPES = {'id': 'int64',
+                 'verified': 'boolean',
+                 **{column: 'float64' for column in RATING_COLUMNS},
+                 **{'avg_' + column: 'float64' for column in RATING_COLUMNS},
+                 **{column: 'category' for column in CATEGORICAL_COLUMNS}}
+
+# Boolean spellings found in legacy CSV exports, which the boolean dtype does not parse from text
+BOOLEAN_STRINGS = {'true': True, 'false': False}
+
+def _parse_boolean(value):
+    return BOOLEAN_STRINGS.get(value.strip().lower(), value) if isinstance(value, str) else value
+
+def apply_schema(data):
+    '''Casts the known columns of a table to their explicit dtypes.
+
+    Parameters:
+        data (DataFrame): Table to cast.
+
+    Returns:
+        DataFrame: Table with the known columns cast.
+
+    Usage example:
+        data = apply_schema(data)
+    '''
+    dtypes = {column: dtype for column, dtype in COLUMN_DTYPES.items() if column in data.columns}
+
+    # Boolean columns read back as text hold 'True' and 'False' strings, mapped to booleans before the cast
+    text = [column for column, dtype in dtypes.items() if dtype == 'boolean' and data[column].dtype == object]
+    if text:
+        data = data.assign(**{column: data[column].map(_parse_boolean) for column in text})
+    return data.astype(dtypes)
+
+# Arrow types of the explicit dtypes, categoricals with indices wide enough for the categories of every chunk
+ARROW_TYPES = {'int64': pa.int64(),
+               'boolean': pa.bool_(),
+               'float64': pa.float64(),
+               'category': pa.dictionary(pa.int32(), pa.string())}
+
+def _arrow_field(field):
+    # Known columns get their explicit type, and a column that is all null in the first chunk is free text
+    if field.name in COLUMN_DTYPES:
+        return pa.field(field.name, ARROW_TYPES[COLUMN_DTYPES[field.name]])
+    if pa.types.is_null(field.type):
+        return pa.field(field.name, pa.string())
+    if pa.types.is_dictionary(field.type):
+        return pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type))
+    return field
+
+def _cast_column(column, arrow_type):
+    # An all-null column, or a categorical without categories, has no values to cast
+    if pa.types.is_null(column.type) or (pa.types.is_dictionary(column.type) and pa.types.is_null(column.type.value_type)):
+        return pa.nulls(len(column), arrow_type)
+    return column.cast(arrow_type)
+
+def _arrow_tables(chunks):
+    # The schema comes from the explicit dtypes and the first chunk, every chunk is cast to it column by column
+    schema = None
+    for chunk in chunks:
+        table = pa.Table.from_pandas(apply_schema(chunk), preserve_index=False)
+        if schema is None:
+            schema = pa.schema([_arrow_field(field) for field in table.schema], metadata=table.schema.metadata)
+        yield pa.Table.from_arrays([_cast_column(table.column(field.name), field.type) for field in schema], schema=schema)
+
+def _write_parquet(data, path):
+    data.to_parquet(path, index=False, compression='zstd')
+
+def _write_parquet_chunks(chunks, path):
+    writer = None
+    for table in _arrow_tables(chunks):
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema, compression='zstd')
+        writer.write_table(table)
+    if writer is not None:
+        writer.close()
+
+def _read_parquet(path, columns):
+    return pd.read_parquet(path, columns=columns)
+
+def _iter_parquet(path, chunk_rows):
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+def _write_feather(data, path):
+    data.reset_index(drop=True).to_feather(path, compression='zstd')
+
+def _write_feather_chunks(chunks, path):
+    # IPC files hold a single dictionary per column, so categoricals are stored as strings and cast back on read
+    writer = None
+    for table in _arrow_tables(chunks):
+        table = table.cast(pa.schema([pa.field(field.name, field.type.value_type) if pa.types.is_dictionary(field.type) else field
+                                      for field in table.schema], metadata=table.schema.metadata))
+        if writer is None:
+            writer = pa.ipc.new_file(path, table.schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+        writer.write_table(table)
+    if writer is not None:
+        writer.close()
+
+def _read_feather(path, columns):
+    return apply_schema(pd.read_feather(path, columns=columns))
+
+def _iter_feather(path, chunk_rows):
+    table = feather.read_table(path, memory_map=True)
+    for batch in table.to_batches(max_chunksize=chunk_rows):
+        yield apply_schema(batch.to_pandas())
+
+def _write_csv(data, path):
+    data.to_csv(path, index=False)
+
+def _write_csv_chunks(chunks, path):
+    for number, chunk in enumerate(chunks):
+        chunk.to_csv(path, index=False, mode='w' if number == 0 else 'a', header=number == 0)
+
+def _read_csv(path, columns):
+    return apply_schema(pd.read_csv(path, usecols=columns))
+
+def _iter_csv(path, chunk_rows):
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        yield apply_schema(chunk)
+
+# Registered formats: file extension, writer, reader, chunked reader and chunked writer
+FORMATS = {'parquet': ('.parquet', _write_parquet, _read_parquet, _iter_parquet, _write_parquet_chunks),
+           'feather': ('.feather', _write_feather, _read_feather, _iter_feather, _write_feather_chunks),
+           'csv': ('.csv', _write_csv, _read_csv, _iter_csv, _write_csv_chunks)}
+
+def table_path(name, fmt=None):
+    '''Returns the file path of a table in the given format.
+
+    Parameters:
+        name (str): Table name without extension.
+        fmt (str): Storage format. Defaults to STORAGE_FORMAT.
+
+    Returns:
+        str: Path of the table file.
+
+    Usage example:
+        path = table_path('rating_table')
+    '''
+    return name + FORMATS[fmt or STORAGE_FORMAT][0]
+
+def partition_name(name, partition):
+    '''Returns the table name of one partition of a partitioned table.
+
+    Parameters:
+        name (str): Table name without extension.
+        partition (int): Partition number.
+
+    Returns:
+        str: Table name of the partition.
+
+    Usage example:
+        write_table(data, partition_name('airline_reviews_clean', 3))
+    '''
+    return f'{name}_part{partition}'
+
+def list_partitions(name):
+    '''Lists the stored partitions of a partitioned table, in any registered format.
+
+    Parameters:
+        name (str): Table name without extension.
+
+    Returns:
+        list: Table names of the partitions, in partition order.
+
+    Usage example:
+        partitions = list_partitions('airline_reviews_clean')
+    '''
+    found = set()
+    for extension in [spec[0] for spec in FORMATS.values()]:
+        for path in glob.glob(glob.escape(name) + '_part*' + extension):
+            suffix = path[len(name) + len('_part'):-len(extension)]
+            if suffix.isdigit():
+                found.add(int(suffix))
+    return [partition_name(name, partition) for partition in sorted(found)]
+
+def remove_table(name):
+    '''Removes a table and all of its partitions, in every registered format.
+
+    Parameters:
+        name (str): Table name without extension.
+
+    Returns:
+        None
+
+    Usage example:
+        remove_table('airline_reviews_clean')
+    '''
+    for table in [name] + list_partitions(name):
+        for fmt in FORMATS:
+            if os.path.exists(table_path(table, fmt)):
+                os.remove(table_path(table, fmt))
+
+def find_table(name, fmt=None):
+    '''Finds the stored file of a table, preferring the given format and falling back to any other registered one.
+
+    Parameters:
+        name (str): Table name without extension.
+        fmt (str): Preferred storage format. Defaults to STORAGE_FORMAT.
+
+    Returns:
+        tuple: Storage format and path of the table file.
+
+    Usage example:
+        fmt, path = find_table('airline_review_cleaned')
+    '''
+    preferred = fmt or STORAGE_FORMAT
+    for candidate in [preferred] + [other for other in FORMATS if other != preferred]:
+        path = table_path(name, candidate)
+        if os.path.exists(path):
+            return candidate, path
+    raise FileNotFoundError(f'No stored table named {name!r}')
+
+def write_table(data, name, fmt=None):
+    '''Writes a table with explicit dtypes in the given format.
+
+    Parameters:
+        data (DataFrame): Table to write.
+        name (str): Table name without extension.
+        fmt (str): Storage format. Defaults to STORAGE_FORMAT.
+
+    Returns:
+        str: Path of the written file.
+
+    Usage example:
+        write_table(avg_ratings, 'rating_table')
+    '''
+    fmt = fmt or STORAGE_FORMAT
+    path = table_path(name, fmt)
+    FORMATS[fmt][1](apply_schema(data), path)
+    record(rows_written=len(data), bytes_written=os.path.getsize(path))
+    return path
+
+def write_table_chunks(chunks, name, fmt=None):
+    '''Writes a table chunk by chunk, holding only one chunk in memory at a time.
+
+    Parameters:
+        chunks (iterable): DataFrame chunks sharing the same columns. At least one chunk is required.
+        name (str): Table name without extension.
+        fmt (str): Storage format. Defaults to STORAGE_FORMAT.
+
+    Returns:
+        str: Path of the written file.
+
+    Usage example:
+        write_table_chunks(iter_table('airline_reviews'), 'airline_reviews_copy')
+    '''
+    path, rows = _write_chunks(chunks, name, fmt)
+    record(rows_written=rows, bytes_written=os.path.getsize(path))
+    return path
+
+def _write_chunks(chunks, name, fmt):
+    # Writes the chunks and returns the written path with the number of rows
+    fmt = fmt or STORAGE_FORMAT
+    path = table_path(name, fmt)
+    rows = []
+    def counted():
+        for chunk in chunks:
+            rows.append(len(chunk))
+            yield chunk
+    FORMATS[fmt][4](counted(), path)
+    return path, sum(rows)
+
+def write_table_partitions(chunks, name, partition_of, partitions, fmt=None):
+    '''Splits a table into partition tables while streaming it, every partition written by its own writer.
+
+    Previous partitions of the table are removed first. Every partition is written, empty if none of its rows
+    came along, as long as there is at least one chunk.
+
+    Parameters:
+        chunks (iterable): DataFrame chunks sharing the same columns.
+        name (str): Table name without extension.
+        partition_of (function): Returns the partition number of every row of a chunk.
+        partitions (int): Number of partitions.
+        fmt (str): Storage format. Defaults to STORAGE_FORMAT.
+
+    Returns:
+        list: Table names of the partitions.
+
+    Usage example:
+        write_table_partitions(iter_table('airline_reviews'), 'airline_reviews', lambda chunk: chunk['id'] % 4, 4)
+    '''
+    remove_table(name)
+    names = [partition_name(name, partition) for partition in range(partitions)]
+    queues = [queue.Queue(maxsize=2) for _ in names]
+    errors = []
+    results = []
+
+    # The chunked writers pull from an iterable, so every partition drains its own queue in a thread
+    def drain(partition_queue):
+        while True:
+            chunk = partition_queue.get()
+            if chunk is None:
+                return
+            yield chunk
+    def write(partition_queue, partition):
+        try:
+            results.append(_write_chunks(drain(partition_queue), partition, fmt))
+        except Exception as error:
+            errors.append(error)
+            for _ in drain(partition_queue):
+                pass
+    threads = [threading.Thread(target=write, args=(partition_queue, partition), daemon=True)
+               for partition_queue, partition in zip(queues, names)]
+    for thread in threads:
+        thread.start()
+
+    written = np.zeros(partitions, dtype=bool)
+    try:
+        for chunk in chunks:
+            keys = np.asarray(partition_of(chunk))
+            for partition in np.unique(keys):
+                queues[partition].put(chunk[keys == partition])
+                written[partition] = True
+            empty = chunk.iloc[:0]
+        for partition in np.flatnonzero(~written):
+            if written.any():
+                queues[partition].put(empty)
+    finally:
+        for partition_queue in queues:
+            partition_queue.put(None)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+
+    # The writer threads run outside of the caller's stage, so their amounts are recorded here
+    record(rows_written=sum(rows for _, rows in results),
+           bytes_written=sum(os.path.getsize(path) for path, _ in results))
+    return names
+
+def read_table(name, columns=None, fmt=None):
+    '''Reads a table, or every partition of a partitioned table, loading only the requested columns.
+
+    Parameters:
+        name (str): Table name without extension.
+        columns (list): Columns to read. Reads every column when None.
+        fmt (str): Preferred storage format. Defaults to STORAGE_FORMAT.
+
+    Returns:
+        DataFrame: The stored table.
+
+    Usage example:
+        ratings = read_table('airline_reviews_clean', columns=['airline_name', 'seat_comfort'])
+    '''
+    try:
+        fmt, path = find_table(name, fmt)
+    except FileNotFoundError:
+        # A partitioned table reads as the concatenation of its partitions
+        partitions = list_partitions(name)
+        if not partitions:
+            raise
+        return apply_schema(pd.concat([read_table(partition, columns, fmt) for partition in partitions], ignore_index=True))
+    data = FORMATS[fmt][2](path, columns)
+    record(rows_read=len(data), bytes_read=os.path.getsize(path))
+    return data
+
+def iter_table(name, chunk_rows=10000, fmt=None):
+    '''Reads a table, or every partition of a partitioned table, in chunks of at most chunk_rows rows.
+
+    Parameters:
+        name (str): Table name without extension.
+        chunk_rows (int): Maximum number of rows per chunk.
+        fmt (str): Preferred storage format. Defaults to STORAGE_FORMAT.
+
+    Returns:
+        generator: DataFrame chunks of the table.
+
+    Usage example:
+        for chunk in iter_table('airline_reviews_clean'):
+            print(len(chunk))
+    '''
+    try:
+        fmt, path = find_table(name, fmt)
+    except FileNotFoundError:
+        # A partitioned table is read partition by partition
+        partitions = list_partitions(name)
+        if not partitions:
+            raise
+        return (chunk for partition in partitions for chunk in iter_table(partition, chunk_rows, fmt))
+    return _counted_chunks(FORMATS[fmt][3](path, chunk_rows), path)
+
+def _counted_chunks(chunks, path):
+    # Records the file size once reading starts and the rows of every chunk as they are consumed
+    record(bytes_read=os.path.getsize(path))
+    for chunk in chunks:
+        record(rows_read=len(chunk))
+        yield chunk
+
+# Convert existing CSV tables to the default format, e.g. python storage.py airline_review_cleaned.csv
+if __name__ == '__main__':
+    for csv_path in sys.argv[1:]:
+        name = os.path.splitext(csv_path)[0]
+        print('Written: ', write_table(pd.read_csv(csv_path), name))
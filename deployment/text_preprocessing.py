@@ -0,0 +1,108 @@
+# Import libraries
+import re
+import nltk
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import get_context
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+from nltk.stem import WordNetLemmatizer
+
+# Download necessary NLTK resources for text processing, skipping the ones already installed
+for resource, resource_path in [('stopwords', 'corpora/stopwords'), ('punkt', 'tokenizers/punkt'), ('wordnet', 'corpora/wordnet')]:
+    try:
+        nltk.data.find(resource_path)
+    except LookupError:
+        nltk.download(resource)
+
+# Load English stopwords and extend with custom list for better filtering
+stopwords_eng = set(stopwords.words('english'))
+additional_stopwords = ['the', 'to', 'and', 'I', 'was', 'a', 'in', 'of', 'for', 'on', 'flight', 'with', 'that', 'my', 'is', 'not', 'were', 'they',
+                        'The', 'at', 'we', 'had', 'from', 'but', 'have', 'it', 'this', 'no', 'as', 'me', 'you', 'our', 'be', 'are', 'an', 'very', 'so',
+                        'service', 'their', 'We', 'time', 'airline', 'would', 'or', 'us', 'by', 'only', 'get', 'all', 'which']
+stopwords_eng.update(additional_stopwords)
+
+# Define a WordNet lemmatizer for text normalization
+lemmatizer = WordNetLemmatizer()
+
+# Maximum number of distinct tokens whose lemma is remembered
+LEMMA_CACHE_SIZE = 100000
+
+# Precompiled patterns. Removing hashtags, newlines and digits are independent character deletions, so they run as one pass
+url_pattern = re.compile(r'https?://(?:www\.[^\s\n\r]+|[^\s\n\r]+)')
+deletion_pattern = re.compile(r'[#\n\r\d]+')
+non_letter_pattern = re.compile(r"[^A-Za-z\s']")
+
+# Stopword check and lemmatization of a token, remembered for the most frequent tokens
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def normalize_token(word):
+    if word in stopwords_eng:
+        return None
+    return lemmatizer.lemmatize(word)
+
+# Define a function for preprocessing text for analysis
+def preprocess_text(text):
+    # Lowercasing, removing URLs, hashtags, digits, and non-letter characters
+    text = text.lower()
+    text = url_pattern.sub('', text)
+    text = deletion_pattern.sub('', text)
+    text = non_letter_pattern.sub(' ', text)
+    tokens = [normalize_token(word) for word in word_tokenize(text)]
+    return ' '.join(token for token in tokens if token is not None)
+
+# Define a function for preprocessing a batch of texts, e.g. in a worker process
+def preprocess_batch(texts):
+    return [preprocess_text(text) for text in texts]
+
+# Define a function for mapping a function over an iterable in a pool, with a bounded number of tasks in flight
+def imap_bounded(pool, function, items, window):
+    '''Applies a function to every item in a process pool, in order, submitting at most window items ahead.
+
+    Pool.imap reads its whole input in a background thread, so a long input is queued in memory at once.
+    Submitting with apply_async and waiting for the oldest result keeps only window items in flight.
+
+    Parameters:
+        pool (Pool): Worker processes.
+        function (callable): Picklable function applied to every item.
+        items (iterable): Inputs, read lazily.
+        window (int): Largest number of items submitted but not yet consumed.
+
+    Returns:
+        generator: Results, in the order of the items.
+
+    Usage example:
+        for texts in imap_bounded(pool, preprocess_batch, batches, 2 * workers):
+            print(len(texts))
+    '''
+    items = iter(items)
+    pending = deque(pool.apply_async(function, (item,)) for item in islice(items, max(window, 1)))
+    while pending:
+        result = pending.popleft().get()
+        for item in islice(items, 1):
+            pending.append(pool.apply_async(function, (item,)))
+        yield result
+
+# Define a function for preprocessing an iterable of texts, in a process pool for large corpora
+def preprocess_texts(texts, workers=1, chunksize=256):
+    '''Preprocesses texts lazily, keeping their order and at most two chunks per worker in flight.
+
+    Parameters:
+        texts (iterable): Raw review texts.
+        workers (int): Number of worker processes. Preprocesses in-process when 1 or less.
+        chunksize (int): Number of texts sent to a worker at once.
+
+    Returns:
+        generator: Preprocessed texts.
+
+    Usage example:
+        cleaned = list(preprocess_texts(data['review'], workers=4))
+    '''
+    if not workers or workers <= 1:
+        yield from map(preprocess_text, texts)
+        return
+    texts = iter(texts)
+    chunks = iter(lambda: list(islice(texts, chunksize)), [])
+    with get_context('spawn').Pool(workers) as pool:
+        for chunk in imap_bounded(pool, preprocess_batch, chunks, 2 * workers):
+            yield from chunk
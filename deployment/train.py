@@ -0,0 +1,351 @@
+# Import libraries
+import os
+import json
+import random
+import argparse
+import numpy as np
+from batch_predict import MODEL_PATH, load_sentiment_model, embed_reviews
+
+# Default locations of the embedding store and of the retrained model
+EMBEDDING_STORE = 'train_embeddings'
+TRAINED_MODEL_PATH = 'model_logreg_retrained'
+
+# Files of an embedding store, after its path prefix
+STORE_FILES = ['_ids.npy', '_labels.npy', '_vectors.npy']
+
+# Seed and data splits of the notebook
+SEED = 20
+TEST_SIZE = 0.15
+VAL_SIZE = 0.10
+
+# Default number of epochs per head, as trained in the notebook
+EPOCHS = {'logreg': 100, 'lstm': 50}
+
+def load_embeddings(prefix=EMBEDDING_STORE):
+    '''Opens the stored review embeddings without reading them into memory.
+
+    Parameters:
+        prefix (str): Path prefix of the store files.
+
+    Returns:
+        tuple: Review ids, memory-mapped float32 embedding matrix and labels, empty when nothing is stored.
+
+    Usage example:
+        ids, vectors, labels = load_embeddings('train_embeddings')
+    '''
+    if not os.path.exists(prefix + '_vectors.npy'):
+        return np.zeros(0, dtype='int64'), np.zeros((0, 0), dtype='float32'), np.zeros(0, dtype='int8')
+    return (np.load(prefix + '_ids.npy'),
+            np.load(prefix + '_vectors.npy', mmap_mode='r'),
+            np.load(prefix + '_labels.npy'))
+
+def store_embeddings(model, rows, prefix=EMBEDDING_STORE, batch_size=512, workers=os.cpu_count(), output=None):
+    '''Embeds the reviews that are not stored yet and appends them to the memory-mapped store.
+
+    Parameters:
+        model (CachedModel): Sentiment model with an embed method, e.g. a CachedModel.
+        rows (iterable): (id, review, label) triples, label 1 for recommended and 0 otherwise.
+        prefix (str): Path prefix of the store files.
+        batch_size (int): Number of reviews per embedding call.
+        workers (int): Number of preprocessing processes.
+        output (str): Path prefix the grown store is written to, e.g. a pending store, the prefix when None.
+
+    Returns:
+        int: Number of reviews embedded and added, nothing is written when none.
+
+    Usage example:
+        store_embeddings(model, zip(data['id'], data['review'], data['recommended'] == 'yes'))
+    '''
+    stored_ids, stored, stored_labels = load_embeddings(prefix)
+    known = set(stored_ids.tolist())
+    output = output or prefix
+
+    # Reviews are preprocessed with the deployment's preprocess_text, not the notebook's stemming text_preprocessing,
+    # since the retrained model is served through preprocess_text by predict.py, serve.py and batch_predict.py
+
+    # Only reviews never embedded before, each once
+    labels = {}
+    def new_rows():
+        for review_id, review, label in rows:
+            if review_id not in known and review_id not in labels:
+                labels[review_id] = int(label)
+                yield review_id, review
+    # Every batch is appended to a raw file as it arrives, so only one batch of embeddings is in memory
+    new_path = output + '_vectors.new.tmp'
+    batch_ids, dim = [], None
+    with open(new_path, 'wb') as f:
+        for ids, batch_vectors in embed_reviews(model, new_rows(), batch_size=batch_size, workers=workers):
+            batch_ids.append(np.asarray(ids, dtype='int64'))
+            batch_vectors.astype('float32', copy=False).tofile(f)
+            dim = batch_vectors.shape[1]
+    if not batch_ids:
+        os.remove(new_path)
+        return 0
+    ids = np.concatenate(batch_ids)
+    new = np.memmap(new_path, mode='r', dtype='float32', shape=(len(ids), dim))
+
+    # The stored and the new rows are copied block by block into the larger file, which then replaces the old one
+    total = len(stored_ids) + len(ids)
+    tmp_path = output + '_vectors.tmp.npy'
+    vectors = np.lib.format.open_memmap(tmp_path, mode='w+', dtype='float32', shape=(total, dim))
+    offset = len(stored_ids)
+    for start in range(0, offset, 65536):
+        end = min(start + 65536, offset)
+        vectors[start:end] = stored[start:end]
+    for start in range(0, len(ids), 65536):
+        end = min(start + 65536, len(ids))
+        vectors[offset + start:offset + end] = new[start:end]
+    vectors.flush()
+    del vectors, stored, new
+    os.remove(new_path)
+
+    for name, values in [('_ids', np.concatenate([stored_ids, ids])),
+                         ('_labels', np.concatenate([stored_labels, [labels[review_id] for review_id in ids.tolist()]]).astype('int8'))]:
+        np.save(output + name + '.tmp.npy', values)
+    for suffix in STORE_FILES:
+        os.replace(output + suffix.replace('.npy', '.tmp.npy'), output + suffix)
+    return len(ids)
+
+def embeddings_exist(prefix=EMBEDDING_STORE):
+    # Whether every file of a store is present
+    return all(os.path.exists(prefix + suffix) for suffix in STORE_FILES)
+
+def promote_embeddings(source, target=EMBEDDING_STORE):
+    '''Replaces a store by another one, e.g. the pending store of a batch once it is committed.
+
+    Parameters:
+        source (str): Path prefix of the store to keep.
+        target (str): Path prefix of the store to replace.
+
+    Returns:
+        None
+
+    Usage example:
+        promote_embeddings('train_embeddings_pending', 'train_embeddings')
+    '''
+    for suffix in STORE_FILES:
+        os.replace(source + suffix, target + suffix)
+
+def remove_embeddings(prefix):
+    # Remove every file of a store
+    for suffix in STORE_FILES:
+        if os.path.exists(prefix + suffix):
+            os.remove(prefix + suffix)
+
+def set_seeds(seed=SEED):
+    '''Seeds Python, NumPy and TensorFlow and makes TensorFlow ops deterministic, so reruns train the same weights.
+
+    Parameters:
+        seed (int): Random seed.
+
+    Returns:
+        None
+
+    Usage example:
+        set_seeds(20)
+    '''
+    import tensorflow as tf
+    random.seed(seed)
+    np.random.seed(seed)
+    tf.random.set_seed(seed)
+    if hasattr(tf.config.experimental, 'enable_op_determinism'):
+        tf.config.experimental.enable_op_determinism()
+
+def build_head(kind='logreg', dim=128, seed=SEED):
+    '''Builds the layers of the notebook models that follow the frozen hub embedding.
+
+    Parameters:
+        kind (str): 'logreg' for the sigmoid Dense(2) layer, 'lstm' for the bidirectional LSTM layers.
+        dim (int): Embedding size.
+        seed (int): Seed of the kernel initializers.
+
+    Returns:
+        Sequential: Compiled model taking embeddings as input.
+
+    Usage example:
+        head = build_head('lstm')
+    '''
+    import tensorflow as tf
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, LSTM, Bidirectional, Dropout, Reshape
+
+    head = Sequential()
+    if kind == 'logreg':
+        head.add(Dense(2, activation='sigmoid', input_shape=(dim,)))
+    elif kind == 'lstm':
+        head.add(Reshape((dim, 1), input_shape=(dim,)))
+        head.add(Bidirectional(LSTM(32, return_sequences=True, kernel_initializer=tf.keras.initializers.GlorotUniform(seed))))
+        head.add(Dropout(0.1))
+        head.add(Bidirectional(LSTM(16, kernel_initializer=tf.keras.initializers.GlorotUniform(seed))))
+        head.add(Dropout(0.1))
+        head.add(Dense(2, activation='sigmoid'))
+    else:
+        raise ValueError(f'Unknown model kind: {kind}')
+    head.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
+    return head
+
+def make_dataset(vectors, labels, positions=None, batch_size=32, shuffle=False, cache=False, seed=SEED):
+    '''Builds the input pipeline of precomputed embeddings and one-hot labels, reading the embeddings batch by batch.
+
+    Only the row positions go through tf.data and every batch gathers its rows from the matrix, so a
+    memory-mapped store is never copied into memory as a whole. A cached dataset reads its rows once, in
+    order, and keeps them in memory for the later epochs.
+
+    Parameters:
+        vectors (ndarray): Embedding matrix, e.g. memory-mapped from the store.
+        labels (ndarray): Labels of every row, 1 for recommended and 0 otherwise.
+        positions (ndarray): Rows to use, every row when None.
+        batch_size (int): Number of reviews per training step.
+        shuffle (bool): Whether the reviews are reshuffled every epoch.
+        cache (bool): Whether the rows are kept in memory after the first epoch, before shuffling and batching.
+        seed (int): Shuffling seed.
+
+    Returns:
+        Dataset: Prefetched batches, in the order of the positions unless shuffled.
+
+    Usage example:
+        train_data = make_dataset(vectors, labels, train, shuffle=True, cache=True)
+    '''
+    import tensorflow as tf
+    targets = np.eye(2, dtype='float32')[np.asarray(labels, dtype='int64')]
+    positions = np.arange(len(targets)) if positions is None else np.asarray(positions, dtype='int64')
+    dim = vectors.shape[1]
+
+    # A shuffled batch is read in sorted order, so the memory-mapped matrix is read forward
+    def gather(batch):
+        if shuffle and not cache:
+            batch = np.sort(batch)
+        return np.asarray(vectors[batch], dtype='float32'), targets[batch]
+
+    def load(batch):
+        batch_vectors, batch_targets = tf.numpy_function(gather, [batch], [tf.float32, tf.float32])
+        return tf.ensure_shape(batch_vectors, [None, dim]), tf.ensure_shape(batch_targets, [None, 2])
+
+    dataset = tf.data.Dataset.from_tensor_slices(positions)
+    if cache:
+        dataset = dataset.batch(4096).map(load).unbatch().cache()
+    if shuffle:
+        dataset = dataset.shuffle(len(positions), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    return (dataset if cache else dataset.map(load)).prefetch(tf.data.AUTOTUNE)
+
+def train_head(vectors, labels, kind='logreg', epochs=None, batch_size=32, seed=SEED):
+    '''Trains a model head on precomputed embeddings with the splits, callbacks and seed of the notebook.
+
+    Parameters:
+        vectors (ndarray): Embedding matrix, e.g. memory-mapped from the store.
+        labels (ndarray): Labels, 1 for recommended and 0 otherwise.
+        kind (str): 'logreg' or 'lstm'.
+        epochs (int): Maximum number of epochs, the notebook's when None.
+        batch_size (int): Number of reviews per training step.
+        seed (int): Seed of the splits, the initializers and the shuffling.
+
+    Returns:
+        tuple: Trained head and evaluation report.
+
+    Usage example:
+        head, report = train_head(*load_embeddings()[1:])
+    '''
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import classification_report
+
+    set_seeds(seed)
+    labels = np.asarray(labels, dtype='int64')
+
+    # Same stratified test and validation splits as the notebook, drawn over row positions
+    positions = np.arange(len(labels))
+    train_val, test = train_test_split(positions, test_size=TEST_SIZE, random_state=seed, stratify=labels)
+    train, val = train_test_split(train_val, test_size=VAL_SIZE, random_state=seed, stratify=labels[train_val])
+
+    # Sorted positions read the memory-mapped matrix sequentially
+    train, val, test = np.sort(train), np.sort(val), np.sort(test)
+    train_data = make_dataset(vectors, labels, train, batch_size, shuffle=True, cache=True, seed=seed)
+    val_data = make_dataset(vectors, labels, val, batch_size)
+
+    # Learning rate decays after 10 epochs, and training stops once the validation loss stalls
+    def lr_scheduler(epoch, lr):
+        return lr if epoch < 10 else lr * tf.math.exp(-0.1)
+    callbacks = [tf.keras.callbacks.LearningRateScheduler(lr_scheduler),
+                 EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)]
+
+    head = build_head(kind, dim=vectors.shape[1], seed=seed)
+    history = head.fit(train_data, epochs=epochs or EPOCHS[kind], validation_data=val_data, callbacks=callbacks, verbose=0)
+
+    predicted = head.predict(make_dataset(vectors, labels, test, batch_size=1024), verbose=0).argmax(axis=1)
+    report = {'kind': kind,
+              'reviews': {'train': len(train), 'val': len(val), 'test': len(test)},
+              'epochs': len(history.history['loss']),
+              'val_loss': float(min(history.history['val_loss'])),
+              'test': classification_report(labels[test], predicted, output_dict=True, zero_division=0)}
+    return head, report
+
+def attach_embedding(head, hub_layer):
+    '''Puts the hub embedding back in front of a trained head, so the model takes preprocessed text like the notebook models.
+
+    Parameters:
+        head (Sequential): Head trained on embeddings.
+        hub_layer (Layer): TF-Hub embedding layer, e.g. the first layer of the saved model.
+
+    Returns:
+        Sequential: Model taking preprocessed text, ready for load_sentiment_model and lite_model.py.
+
+    Usage example:
+        model = attach_embedding(head, load_sentiment_model().layers[0])
+    '''
+    from tensorflow.keras.models import Sequential
+    model = Sequential([hub_layer] + head.layers)
+    model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
+    return model
+
+def save_trained_model(head, report, output=TRAINED_MODEL_PATH, embedding_model=MODEL_PATH):
+    '''Saves a trained head with the hub embedding as a TensorFlow model, and its evaluation report next to it.
+
+    Parameters:
+        head (Sequential): Head trained on embeddings.
+        report (dict): Evaluation report of train_head.
+        output (str): Directory of the saved model.
+        embedding_model (str): Saved Keras model whose hub embedding layer the embeddings came from.
+
+    Returns:
+        str: Directory of the saved model.
+
+    Usage example:
+        save_trained_model(head, report, 'model_logreg_retrained')
+    '''
+    model = attach_embedding(head, load_sentiment_model(embedding_model).layers[0])
+    model.save(output, save_format='tf')
+    with open(output + '_report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    return output
+
+# Retrain a sentiment model from the command line, e.g. python train.py airline_review_cleaned --kind lstm
+if __name__ == '__main__':
+    from storage import read_table
+    from prediction_cache import CACHE_PATH, CachedModel, PredictionCache, model_namespace
+
+    parser = argparse.ArgumentParser(description='Train the sentiment model heads on precomputed review embeddings.')
+    parser.add_argument('table', help="Table with 'review' and 'recommended' columns, and optionally 'id'.")
+    parser.add_argument('--kind', default='logreg', choices=list(EPOCHS), help='Model head to train.')
+    parser.add_argument('--model', default=MODEL_PATH, help='Saved Keras model whose hub layer embeds the reviews.')
+    parser.add_argument('--store', default=EMBEDDING_STORE, help='Path prefix of the embedding store.')
+    parser.add_argument('--output', default=TRAINED_MODEL_PATH, help='Directory to save the trained model to.')
+    parser.add_argument('--epochs', type=int, default=None, help="Maximum number of epochs, the notebook's by default.")
+    parser.add_argument('--batch-size', type=int, default=32, help='Number of reviews per training step.')
+    parser.add_argument('--seed', type=int, default=SEED, help='Random seed.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of preprocessing processes.')
+    args = parser.parse_args()
+
+    # Rows without an id are keyed by their position in the table
+    data = read_table(args.table)
+    ids = data['id'] if 'id' in data.columns else data.index
+    model = CachedModel(load_sentiment_model(args.model), PredictionCache(CACHE_PATH, namespace=model_namespace(args.model)))
+    added = store_embeddings(model, zip(ids, data['review'].fillna('').astype(str), data['recommended'].astype(str).str.lower() == 'yes'),
+                             args.store, workers=args.workers)
+    print('Embedded: ', added)
+
+    _, vectors, labels = load_embeddings(args.store)
+    head, report = train_head(vectors, labels, args.kind, args.epochs, args.batch_size, args.seed)
+    print('Written: ', save_trained_model(head, report, args.output, args.model))
+    print(json.dumps({key: report[key] for key in ['kind', 'reviews', 'epochs', 'val_loss']}))
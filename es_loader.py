@@ -0,0 +1,168 @@
+# Import libraries
+import time
+from contextlib import contextmanager
+from elasticsearch.helpers import parallel_bulk
+
+# HTTP statuses worth resending (rejected because the cluster was busy)
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+def pause_refresh(es, index):
+    '''Turns off periodic refreshes of an index ahead of a bulk load.
+
+    Parameters:
+        es (Elasticsearch): Connected Elasticsearch client.
+        index (str): Name of the index being loaded.
+
+    Returns:
+        str: Refresh interval set before, None when the index used the default.
+
+    Usage example:
+        previous = pause_refresh(es, 'finpro')
+    '''
+    settings = es.indices.get_settings(index=index, name='index.refresh_interval')
+    previous = settings.get(index, {}).get('settings', {}).get('index', {}).get('refresh_interval')
+    es.indices.put_settings(index=index, body={'index': {'refresh_interval': '-1'}})
+    return previous
+
+def resume_refresh(es, index, previous=None):
+    '''Restores periodic refreshes of an index after a bulk load and makes the loaded documents searchable.
+
+    Parameters:
+        es (Elasticsearch): Connected Elasticsearch client.
+        index (str): Name of the loaded index.
+        previous (str): Refresh interval to restore, None restores the default.
+
+    Returns:
+        None
+
+    Usage example:
+        resume_refresh(es, 'finpro')
+    '''
+    es.indices.put_settings(index=index, body={'index': {'refresh_interval': previous}})
+    es.indices.refresh(index=index)
+
+@contextmanager
+def refresh_disabled(es, index):
+    '''Turns off periodic refreshes of an index during a bulk load, and refreshes it once at the end.
+
+    Parameters:
+        es (Elasticsearch): Connected Elasticsearch client.
+        index (str): Name of the index being loaded.
+
+    Returns:
+        None
+
+    Usage example:
+        with refresh_disabled(es, 'finpro'):
+            bulk_load(es, chunks, 'finpro')
+    '''
+    previous = pause_refresh(es, index)
+    try:
+        yield
+    finally:
+        resume_refresh(es, index, previous)
+
+def build_actions(chunk, index, id_column=None):
+    '''Converts a chunk of rows into bulk index actions in a single vectorised step.
+
+    Parameters:
+        chunk (DataFrame): Rows to be indexed.
+        index (str): Name of the target Elasticsearch index.
+        id_column (str): Column used as the document ID. Elasticsearch generates IDs when None.
+
+    Returns:
+        list: One bulk action per row.
+
+    Usage example:
+        actions = build_actions(data, 'finpro', id_column='id')
+    '''
+    # Replace NaN with None so every document serialises to valid JSON
+    records = chunk.astype(object).where(chunk.notna(), None).to_dict(orient='records')
+    if id_column is None:
+        return [{'_index': index, '_source': record} for record in records]
+
+    # Deterministic IDs make re-indexing the same row overwrite instead of duplicate
+    ids = chunk[id_column].astype(str).tolist()
+    return [{'_index': index, '_id': doc_id, '_source': record} for doc_id, record in zip(ids, records)]
+
+def send_actions(es, actions, batch_size=500, workers=4):
+    '''Sends actions through the _bulk API and splits them by outcome.
+
+    Parameters:
+        es (Elasticsearch): Connected Elasticsearch client.
+        actions (list): Bulk actions to send.
+        batch_size (int): Number of documents per _bulk request.
+        workers (int): Number of parallel _bulk requests.
+
+    Returns:
+        tuple: Number of indexed documents, actions worth retrying and permanent errors.
+
+    Usage example:
+        indexed, retry, errors = send_actions(es, actions)
+    '''
+    indexed, retry, errors = 0, [], []
+
+    # parallel_bulk yields results in the same order as the actions
+    results = parallel_bulk(es, actions,
+                            thread_count=workers,
+                            chunk_size=batch_size,
+                            raise_on_error=False,
+                            raise_on_exception=False)
+    for action, (ok, item) in zip(actions, results):
+        if ok:
+            indexed += 1
+            continue
+        info = next(iter(item.values()))
+        if info.get('status') in RETRYABLE_STATUSES or 'exception' in info:
+            retry.append(action)
+        else:
+            errors.append(info)
+    return indexed, retry, errors
+
+def bulk_load(es, chunks, index, id_column=None, batch_size=500, workers=4, max_retries=3, backoff=2.0):
+    '''Streams chunks of rows into Elasticsearch using the _bulk API.
+
+    Parameters:
+        es (Elasticsearch): Connected Elasticsearch client.
+        chunks (iterable): DataFrame chunks to load, e.g. from storage.iter_table.
+        index (str): Name of the target Elasticsearch index.
+        id_column (str): Column used as the document ID. Elasticsearch generates IDs when None.
+        batch_size (int): Number of documents per _bulk request.
+        workers (int): Number of parallel _bulk requests.
+        max_retries (int): Number of times failed documents are resent.
+        backoff (float): Seconds to wait before the first retry, doubled on every attempt.
+
+    Returns:
+        dict: Load statistics (docs, failed, seconds, docs_per_sec).
+
+    Usage example:
+        stats = bulk_load(Elasticsearch('http://localhost:9200'), iter_table('airline_reviews_clean'), 'finpro')
+    '''
+    start = time.perf_counter()
+    docs, failed = 0, 0
+
+    for chunk in chunks:
+        actions = build_actions(chunk, index, id_column)
+        indexed, retry, errors = send_actions(es, actions, batch_size, workers)
+
+        # Resend only the documents that were rejected with a retryable status
+        for attempt in range(max_retries):
+            if not retry:
+                break
+            time.sleep(backoff * 2 ** attempt)
+            retried, retry, more_errors = send_actions(es, retry, batch_size, workers)
+            indexed += retried
+            errors.extend(more_errors)
+
+        docs += indexed
+        failed += len(errors) + len(retry)
+        for info in errors[:5]:
+            print('Failed document: ', info.get('error'))
+
+    seconds = time.perf_counter() - start
+    stats = {'docs': docs,
+             'failed': failed,
+             'seconds': round(seconds, 3),
+             'docs_per_sec': round(docs / seconds, 1) if seconds else 0.0}
+    print('Bulk load finished: ', stats)
+    return stats
@@ -0,0 +1,74 @@
+# Import libraries
+import os
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Arrow schema mirroring the airline_reviews table in final_project_query_recsys.sql
+AIRLINE_REVIEWS_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('airline_name', pa.string()),
+    ('overall_rating', pa.string()),
+    ('review_title', pa.string()),
+    ('review_date', pa.string()),
+    ('verified', pa.bool_()),
+    ('review', pa.string()),
+    ('aircraft', pa.string()),
+    ('type_of_traveller', pa.string()),
+    ('seat_type', pa.string()),
+    ('route', pa.string()),
+    ('date_flown', pa.string()),
+    ('seat_comfort', pa.float64()),
+    ('cabin_staff_service', pa.float64()),
+    ('food_beverages', pa.float64()),
+    ('ground_service', pa.float64()),
+    ('inflight_entertainment', pa.float64()),
+    ('wifi_connectivity', pa.float64()),
+    ('value_for_money', pa.float64()),
+    ('recommended', pa.string())])
+
+def stream_query_to_parquet(connection, query, path, params=None, schema=AIRLINE_REVIEWS_SCHEMA, fetch_size=20000, compression='zstd'):
+    '''Streams a query result to a compressed Parquet file through a server-side cursor.
+
+    Only one fetch of rows is held in memory at a time, so peak memory does not grow with the table.
+
+    Parameters:
+        connection (connection): Open psycopg2 connection.
+        query (str): SQL query to run.
+        path (str): Parquet file to write.
+        params (dict): Query parameters.
+        schema (Schema): Arrow schema of the query result.
+        fetch_size (int): Number of rows fetched from the server per round-trip.
+        compression (str): Parquet compression codec.
+
+    Returns:
+        dict: Extraction statistics (rows, bytes, seconds, rows_per_sec).
+
+    Usage example:
+        stats = stream_query_to_parquet(connection, "SELECT * FROM airline_reviews", 'airline_reviews.parquet')
+    '''
+    start = time.perf_counter()
+    rows = 0
+
+    # A named cursor keeps the result set on the server and ships it in fetch_size pieces
+    with connection.cursor(name='stream_extract') as cursor, \
+         pq.ParquetWriter(path, schema, compression=compression) as writer:
+        cursor.itersize = fetch_size
+        cursor.execute(query, params)
+        while True:
+            records = cursor.fetchmany(fetch_size)
+            if not records:
+                break
+            columns = [column[0] for column in cursor.description]
+            chunk = pd.DataFrame.from_records(records, columns=columns)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+
+    seconds = time.perf_counter() - start
+    stats = {'rows': rows,
+             'bytes': os.path.getsize(path),
+             'seconds': round(seconds, 3),
+             'rows_per_sec': round(rows / seconds, 1) if seconds else 0.0}
+    print('Extraction finished: ', stats)
+    return stats
@@ -28,6 +28,13 @@ The main goal of FlightBuddy is to improve the decision-making process for trave
 '''
 
 # Import libraries
+import os
+import sys
+import json
+import zlib
+import shutil
+import functools
+from multiprocessing import get_context
 import pandas as pd
 import numpy as np
 import psycopg2 as db
@@ -35,19 +42,169 @@ from airflow import DAG
 from datetime import datetime, timedelta
 from airflow.operators.python import PythonOperator
 from elasticsearch import Elasticsearch
+from es_loader import bulk_load, pause_refresh, resume_refresh
+from extract import stream_query_to_parquet
+from imputer import Imputer
 
-def get_data():
-    '''Fetches data from PostgreSQL and returns it as a DataFrame.
+# Shared modules live next to the Streamlit app in the deployment folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deployment'))
+from storage import (read_table, write_table, write_table_chunks, iter_table, table_path,
+                     partition_name, write_table_partitions, remove_table)
+from recommenders import NeighborIndex, ContentIndex, scale_ratings, build_ranking, segment_item
+from batch_predict import load_sentiment_model, score_reviews, embed_reviews, iter_table_reviews, write_predictions_postgres
+from prediction_cache import CachedModel, PredictionCache, model_namespace
+from eda_stats import EdaStats
+from review_search import INDEX, create_review_index
+from train import store_embeddings, load_embeddings, embeddings_exist, promote_embeddings, remove_embeddings, train_head, save_trained_model
+from instrumentation import timer, record, log_event, write_prometheus
+from near_duplicates import NearDuplicateIndex, index_exists, promote_index, remove_index
+
+# Number of rows fetched from PostgreSQL per round-trip
+EXTRACT_FETCH_SIZE = 20000
+
+# Batch sentiment scoring settings
+MODEL_PATH = os.path.join('unzipped_model', 'model_logreg')
+SCORE_BATCH_SIZE = 512
+SCORE_WORKERS = os.cpu_count()
+PREDICTION_CACHE_FILE = 'prediction_cache.sqlite'
+
+# Retraining settings: the head trained on the stored review embeddings, where they are stored and the retrained model saved
+TRAIN_KIND = 'logreg'
+TRAIN_MIN_REVIEWS = 100
+EMBEDDING_STORE = 'train_embeddings'
+PENDING_EMBEDDING_STORE = 'train_embeddings_pending'
+TRAINED_MODEL_PATH = 'model_logreg_retrained'
+
+# Bulk loading settings for Elasticsearch
+ES_CHUNK_ROWS = 10000
+ES_BATCH_SIZE = 500
+ES_WORKERS = 4
+
+# Ingestion settings: 'incremental' only pulls rows newer than the committed watermark, 'full' re-extracts the whole table
+LOAD_MODE = 'incremental'
+WATERMARK_COLUMN = 'id'
+STATE_FILE = 'ingest_state.json'
+
+# Number of airline hash buckets cleaned, aggregated and indexed in parallel, one mapped task instance each
+PARTITIONS = 8
+PARTITION_KWARGS = [{'partition': partition} for partition in range(PARTITIONS)]
+
+# Imputation statistics fitted by previous runs and by the current batch
+IMPUTER_FILE = 'imputer.json'
+PENDING_IMPUTER_FILE = 'imputer_pending.json'
+CLEAN_CHUNK_ROWS = 50000
+
+# MinHash signatures of the kept reviews per partition, committed with the watermark, and the processes computing them.
+# The mapped instances already run side by side, so each one takes its share of the cores
+DEDUP_INDEX_PREFIX = 'review_minhash'
+DEDUP_WORKERS = max(1, (os.cpu_count() or 1) // PARTITIONS)
+
+# Number of most similar airlines kept per airline in the neighbour index, and the standardization it was built with
+NEIGHBORS_K = 20
+RATING_SCALING_FILE = 'rating_scaling.json'
+
+# Segments with their own ratings table and top-rated ranking, and the ranking size
+SEGMENT_COLUMNS = ['seat_type', 'type_of_traveller']
+RANKING_TOP_N = 50
+RANKING_MIN_REVIEWS = 5
+
+# Segments with their own review-content index
+CONTENT_SEGMENTS = ['route', 'seat_type']
+
+# Statistics of the Exploratory Data Analysis page, accumulated across runs, and the artifact the page renders
+EDA_STATE_FILE = 'eda_state.json'
+PENDING_EDA_STATE_FILE = 'eda_state_pending.json'
+EDA_STATS_FILE = 'eda_stats.json'
+
+# Ratings tables and the columns they are grouped by
+RATING_GROUPS = {'rating_table': ['airline_name'],
+                 **{'rating_table_' + column: [column, 'airline_name'] for column in SEGMENT_COLUMNS}}
+
+# Tables written partition by partition in every run
+PARTITIONED_TABLES = (['airline_reviews_prepared', 'airline_reviews_clean', 'review_duplicates']
+                      + [name + '_sums' for name in RATING_GROUPS])
+
+# Aggregate tables merged across incremental runs
+AGGREGATE_TABLES = (['rating_table'] + ['rating_table_' + column for column in SEGMENT_COLUMNS]
+                    + ['content_table'] + ['content_table_' + column for column in CONTENT_SEGMENTS])
+
+# Prometheus textfiles written by every task, one per task instance, for the node exporter textfile collector
+METRICS_DIR = 'metrics'
+
+# Rating columns aggregated per airline for the recommendation system
+RATING_COLUMNS = ['seat_comfort', 'cabin_staff_service', 'food_beverages', 'ground_service',
+                  'inflight_entertainment', 'wifi_connectivity', 'value_for_money']
+
+def instrumented(task):
+    '''Times every run of a task and writes its metrics to a Prometheus textfile, also when the task fails.
     
+    Parameters:
+        task (function): Task function, optionally taking a partition.
+        
+    Returns:
+        function: The timed task, with the same signature so Airflow passes the same op_kwargs.
+
+    Usage example:
+        PythonOperator(task_id = 'GetData', python_callable = instrumented(get_data))
+    '''
+    @functools.wraps(task)
+    def run(*args, **kwargs):
+        partition = kwargs.get('partition')
+        labels = {} if partition is None else {'partition': partition}
+        try:
+            with timer(task.__name__, **labels):
+                return task(*args, **kwargs)
+        finally:
+            suffix = '' if partition is None else f'_part{partition}'
+            write_prometheus(os.path.join(METRICS_DIR, task.__name__ + suffix + '.prom'))
+    return run
+
+def read_state():
+    '''Reads the ingestion state holding the committed and pending watermarks.
+
     Parameters:
         None
-    
+
+    Returns:
+        dict: Ingestion state with 'watermark' and 'pending' keys.
+
+    Usage example:
+        state = read_state()
+    '''
+    if not os.path.exists(STATE_FILE):
+        return {'watermark': 0, 'pending': None}
+    with open(STATE_FILE) as f:
+        return json.load(f)
+
+def write_state(state):
+    '''Atomically writes the ingestion state.
+
+    Parameters:
+        state (dict): Ingestion state with 'watermark' and 'pending' keys.
+
     Returns:
         None
+
     Usage example:
-        df = get_data()
+        write_state({'watermark': 120, 'pending': None})
+    '''
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, STATE_FILE)
+
+def connect_db():
+    '''Opens a connection to the PostgreSQL database holding the airline_reviews table.
+
+    Parameters:
+        None
+
+    Returns:
+        connection: Open psycopg2 connection.
+
+    Usage example:
+        connection = connect_db()
     '''
-    
     db_name = 'finpro'
     db_user = 'airflow'
     db_password = 'airflow'
@@ -55,23 +212,64 @@ def get_data():
     db_port = '5432'
     
     # PostgreSQL connection string
-    connection = db.connect(
+    return db.connect(
         database = db_name,
         user = db_user,
         password = db_password,
         host = db_host,
         port = db_port)
 
-    # Fetch data from the table 'table_m3'
-    data = pd.read_sql("SELECT * FROM airline_reviews", connection)
+def get_data():
+    '''Streams new rows from PostgreSQL into the 'airline_reviews.parquet' file.
+    
+    Parameters:
+        None
+    
+    Returns:
+        None
+    Usage example:
+        df = get_data()
+    '''
+    connection = connect_db()
+
+    # Only fetch rows above the committed watermark, so reruns of the same batch see the same rows
+    state = read_state()
+    watermark = state['watermark'] if LOAD_MODE == 'incremental' else 0
+    query = f"SELECT * FROM airline_reviews WHERE {WATERMARK_COLUMN} > %(watermark)s ORDER BY {WATERMARK_COLUMN}"
+
+    # Stream the rows straight to a compressed Parquet file instead of materialising the table
+    stats = stream_query_to_parquet(connection, query, 'airline_reviews.parquet',
+                                    params={'watermark': watermark},
+                                    fetch_size=EXTRACT_FETCH_SIZE)
     connection.close()
+    record(rows_read=stats['rows'], bytes_written=os.path.getsize('airline_reviews.parquet'))
+    log_event('fetched', rows=stats['rows'], watermark=watermark)
+
+    # Remember the highest row in this batch until it has been indexed
+    batch_max = pd.read_parquet('airline_reviews.parquet', columns=[WATERMARK_COLUMN])[WATERMARK_COLUMN].max()
+    state['pending'] = int(batch_max) if stats['rows'] else watermark
+    write_state(state)
+
+
+def airline_partition(chunk):
+    '''Assigns every review to an airline hash bucket, so all reviews of an airline land in the same partition.
     
-    # Save the data to CSV file
-    data.to_csv('airline_reviews.csv')
+    Parameters:
+        chunk (DataFrame): Reviews with an airline_name column.
+        
+    Returns:
+        ndarray: Partition number of every review.
 
+    Usage example:
+        partitions = airline_partition(data)
+    '''
+    # CRC32 is stable across processes and runs, unlike hash()
+    names = chunk['airline_name'].astype(str)
+    buckets = {name: zlib.crc32(name.encode()) % PARTITIONS for name in names.unique()}
+    return names.map(buckets).to_numpy()
 
-def clean_data():
-    '''Cleans data by dropping duplicates, standardizing column names, and handling missing values.
+def partition_data():
+    '''Drops duplicates, standardizes column names, fits the imputation statistics and splits the batch by airline hash bucket.
     
     Parameters:
         None
@@ -80,47 +278,125 @@ def clean_data():
         None
 
     Usage example:
-        df = clean_data()
+        partition_data()
     '''
-    # Read data
-    data = pd.read_csv('airline_reviews.csv')
-    
-    # Remove duplicate rows
-    data = data.drop_duplicates()
+    # Partitions of the previous run must not be read as part of this one, nor its uncommitted signatures
+    for name in PARTITIONED_TABLES:
+        remove_table(name)
+    for partition in range(PARTITIONS):
+        remove_index(partition_name(DEDUP_INDEX_PREFIX, partition) + '_pending')
 
-    # Renaming column names
-    data.columns = (data.columns
-                    .str.lower()
-                    .str.replace(' ', '_')
-                    .str.replace('&', 'and'))
+    # Function to remove duplicate rows and standardize column names
+    def prepare(data):
+        data = data.drop_duplicates()
+        data.columns = (data.columns
+                        .str.lower()
+                        .str.replace(' ', '_')
+                        .str.replace('&', 'and'))
+        return data
 
-    # Function to impute missing values
-    def impute_missing_values(data):
-        for column in data.columns:
-            # Numerical columns
-            if data[column].dtype in ['float64', 'int64']:
-                if data[column].skew() > 0.5 or data[column].skew() < -0.5:
-                    # Highly skewed
-                    median_value = data[column].median()
-                    data[column] = data[column].fillna(median_value)
-                else:
-                    # Normally distributed
-                    mean_value = data[column].mean()
-                    data[column] = data[column].fillna(mean_value)
+    # Nothing new to clean in this run
+    if not len(read_table('airline_reviews', columns=[WATERMARK_COLUMN])):
+        for partition in range(PARTITIONS):
+            write_table(prepare(read_table('airline_reviews')), partition_name('airline_reviews_prepared', partition))
+        return
 
-            # Categorical columns
-            elif data[column].dtype == 'object':
-                mode_value = data[column].mode()[0]
-                data[column] = data[column].fillna(mode_value)
+    # Reuse the statistics fitted by previous runs and update them with this batch while it is being split
+    if LOAD_MODE == 'incremental' and os.path.exists(IMPUTER_FILE):
+        imputer = Imputer.load(IMPUTER_FILE)
+    else:
+        imputer = Imputer()
+    def prepared(chunks):
+        for chunk in chunks:
+            chunk = prepare(chunk)
+            imputer.partial_fit(chunk)
+            yield chunk
+    write_table_partitions(prepared(iter_table('airline_reviews', chunk_rows=CLEAN_CHUNK_ROWS)),
+                           'airline_reviews_prepared', airline_partition, PARTITIONS)
+    imputer.save(PENDING_IMPUTER_FILE)
 
-    # Impute missing values
-    impute_missing_values(data)
+def clean_data(partition=None):
+    '''Handles the missing values and removes the near-duplicate reviews of one partition of the batch, or of every partition when None.
     
-    # Save the cleaned data to a new CSV file
-    data.to_csv('airline_reviews_clean.csv', index=False)
+    Parameters:
+        partition (int): Airline hash bucket to clean.
+        
+    Returns:
+        None
+
+    Usage example:
+        clean_data(partition=3)
+    '''
+    for partition in range(PARTITIONS) if partition is None else [partition]:
+        source = partition_name('airline_reviews_prepared', partition)
+        target = partition_name('airline_reviews_clean', partition)
+
+        # Nothing new to clean in this partition
+        if not len(read_table(source, columns=[WATERMARK_COLUMN])):
+            write_table(read_table(source), target)
+            continue
+
+        # Compare the batch with the reviews kept by the committed runs, airlines never span partitions
+        index_prefix = partition_name(DEDUP_INDEX_PREFIX, partition)
+        if LOAD_MODE == 'incremental' and index_exists(index_prefix):
+            duplicates = NearDuplicateIndex.load(index_prefix)
+        else:
+            duplicates = NearDuplicateIndex()
+        removed = []
+        pool = get_context('spawn').Pool(DEDUP_WORKERS) if DEDUP_WORKERS > 1 else None
+        def deduplicated(chunks):
+            for chunk in chunks:
+                keep, chunk_removed = duplicates.deduplicate(chunk, pool, WATERMARK_COLUMN)
+                removed.extend(chunk_removed)
+                yield chunk[keep]
+
+        # Impute missing values chunk by chunk with the statistics of the whole batch, drop the near-duplicates and save the cleaned data with explicit dtypes
+        imputer = Imputer.load(PENDING_IMPUTER_FILE)
+        chunks = (imputer.transform(chunk) for chunk in iter_table(source, chunk_rows=CLEAN_CHUNK_ROWS))
+        try:
+            write_table_chunks(deduplicated(chunks), target)
+        finally:
+            if pool:
+                pool.terminate()
+        duplicates.save(index_prefix + '_pending')
+
+        # Report the removed reviews with the review they duplicate, and how many were removed per airline
+        report = pd.DataFrame(removed, columns=[WATERMARK_COLUMN, 'airline_name', 'duplicate_of', 'similarity'])
+        write_table(report, partition_name('review_duplicates', partition))
+        record(duplicates_removed=len(report))
+        log_event('duplicates', partition=partition, removed=len(report),
+                  per_airline=report['airline_name'].value_counts().to_dict())
+
+def convert_data(partition=None):
+    '''Sums the ratings of one partition of the cleaned data per airline, and per airline within every segment.
     
-def convert_data():
-    '''Converts the cleaned data into a new CSV file containing rating columns only for recommendation system.
+    Parameters:
+        partition (int): Airline hash bucket to aggregate, every partition when None.
+        
+    Returns:
+        None
+
+    Usage example:
+        convert_data(partition=3)
+    '''
+    for partition in range(PARTITIONS) if partition is None else [partition]:
+        # Read only the airline, segment and rating columns of the cleaned data
+        data = read_table(partition_name('airline_reviews_clean', partition),
+                          columns=['airline_name'] + SEGMENT_COLUMNS + RATING_COLUMNS)
+        data = data.astype({column: str for column in ['airline_name'] + SEGMENT_COLUMNS})
+
+        # Sums, sums of squares and counts per group. Airlines never span partitions, so neither do the groups
+        for name, keys in RATING_GROUPS.items():
+            grouped = data.groupby(keys)
+            squares = (data[RATING_COLUMNS] ** 2).groupby([data[key] for key in keys])
+            sums = pd.concat([grouped[RATING_COLUMNS].sum().add_prefix('sum_'),
+                              squares.sum().add_prefix('sumsq_'),
+                              grouped[RATING_COLUMNS].count().add_prefix('count_')], axis=1)
+            sums['review_count'] = grouped.size()
+            write_table(sums.reset_index(), partition_name(name + '_sums', partition))
+
+def merge_ratings():
+    '''Merges the rating sums of every partition into the ratings tables, the neighbour index and the ranking.
     
     Parameters:
         None
@@ -129,38 +405,188 @@ def convert_data():
         None
 
     Usage example:
-        convert_data()
+        merge_ratings()
     '''
-    # Read cleaned data
-    data = pd.read_csv('airline_reviews_clean.csv')
+    # Function to add the sums of the batch to the running sums, sums of squares and counts per group committed by previous runs
+    def aggregate_ratings(keys, name):
+        sums = read_table(name + '_sums').astype({key: str for key in keys}).set_index(keys)
+
+        # Sums add up, so only this batch and one row per group have to be read
+        committed_name = name + '_committed'
+        if LOAD_MODE == 'incremental' and os.path.exists(table_path(committed_name)):
+            committed = read_table(committed_name).astype({key: str for key in keys}).set_index(keys)
+
+            # Tables committed before the running sums only hold means, whose variance is unknown and counted as 0
+            for column in RATING_COLUMNS:
+                if 'sum_' + column not in committed.columns:
+                    committed['count_' + column] = committed['review_count']
+                    committed['sum_' + column] = committed['avg_' + column] * committed['review_count']
+                    committed['sumsq_' + column] = committed['avg_' + column] ** 2 * committed['review_count']
+            sums = pd.concat([committed[sums.columns], sums]).groupby(level=keys).sum()
+
+        # Means and population variances of every rating column
+        avg_ratings = pd.DataFrame(index=sums.index)
+        for column in RATING_COLUMNS:
+            count = sums['count_' + column].where(sums['count_' + column] > 0)
+            avg_ratings['avg_' + column] = sums['sum_' + column] / count
+            avg_ratings['var_' + column] = (sums['sumsq_' + column] / count - avg_ratings['avg_' + column] ** 2).clip(lower=0)
+        avg_ratings = pd.concat([avg_ratings, sums], axis=1).reset_index()
+        avg_ratings['review_count'] = avg_ratings['review_count'].astype(int)
+        write_table(avg_ratings, name)
+        return avg_ratings
+
+    # Average ratings per airline, and per airline within every segment
+    avg_ratings = aggregate_ratings(['airline_name'], 'rating_table')
+    segments = {column: aggregate_ratings([column, 'airline_name'], 'rating_table_' + column) for column in SEGMENT_COLUMNS}
+
+    # Precompute the most similar airlines for recommendation_positive next to the ratings table.
+    # Incremental runs keep the standardization of the last full build, so only the airlines of this batch move
+    names = avg_ratings['airline_name']
+    if LOAD_MODE == 'incremental' and os.path.exists(RATING_SCALING_FILE) and os.path.exists('rating_neighbors_neighbors.npy'):
+        with open(RATING_SCALING_FILE) as f:
+            scaling = json.load(f)
+        changed = read_table('rating_table_sums', columns=['airline_name'])['airline_name'].astype(str).unique()
+        index = NeighborIndex.load('rating_neighbors').update(names, scale_ratings(avg_ratings, **scaling),
+                                                              changed, k=NEIGHBORS_K)
+    else:
+        values = avg_ratings[['avg_' + column for column in RATING_COLUMNS]]
+        scaling = {'mean': values.mean().tolist(), 'std': values.std(ddof=0).tolist()}
+        with open(RATING_SCALING_FILE, 'w') as f:
+            json.dump(scaling, f)
+        index = NeighborIndex.build(names, scale_ratings(avg_ratings, **scaling), k=NEIGHBORS_K)
+    index.save('rating_neighbors')
+
+    # Precompute the top-rated airlines for recommendation_negative, overall and per segment
+    ranking = build_ranking(avg_ratings, segments, top_n=RANKING_TOP_N, min_reviews=RANKING_MIN_REVIEWS)
+    write_table(ranking, 'airline_ranking')
     
-    # Group by airline_name and calculate the average ratings
-    avg_ratings = data.groupby('airline_name').agg({
-        'seat_comfort': 'mean',
-        'cabin_staff_service': 'mean',
-        'food_beverages': 'mean',
-        'ground_service': 'mean',
-        'inflight_entertainment': 'mean',
-        'wifi_connectivity': 'mean',
-        'value_for_money': 'mean'
-    }).reset_index()
+def predict_sentiment():
+    '''Scores the sentiment of the cleaned reviews in batches and backfills predicted_sentiment in PostgreSQL.
     
-    # Rename columns to match the required output
-    avg_ratings.columns = [
-        'airline_name', 
-        'avg_seat_comfort', 
-        'avg_cabin_staff_service', 
-        'avg_food_beverages', 
-        'avg_ground_service', 
-        'avg_inflight_entertainment', 
-        'avg_wifi_connectivity', 
-        'avg_value_for_money']
+    Parameters:
+        None
+        
+    Returns:
+        None
+
+    Usage example:
+        predict_sentiment()
+    '''
+    # Nothing new to score in this run
+    if not len(read_table('airline_reviews_clean', columns=['id'])):
+        return
+
+    # Reposted and duplicate reviews are answered from the cache shared with the app
+    model = CachedModel(load_sentiment_model(MODEL_PATH),
+                        PredictionCache(PREDICTION_CACHE_FILE, namespace=model_namespace(MODEL_PATH)))
+    chunks = score_reviews(model, iter_table_reviews('airline_reviews_clean'),
+                           batch_size=SCORE_BATCH_SIZE,
+                           workers=SCORE_WORKERS)
+
+    # Write every scored chunk back to PostgreSQL and to the predictions table
+    connection = connect_db()
+    def backfill(chunks):
+        for chunk in chunks:
+            write_predictions_postgres(connection, [chunk])
+            yield chunk
+    write_table_chunks(backfill(chunks), 'review_predictions')
+    connection.close()
+
+def build_content_index():
+    '''Sums the review embeddings per airline, and per airline within every content segment, into nearest-neighbour indexes.
     
-    # Save the average ratings to a new CSV file
-    avg_ratings.to_csv('rating_table.csv', index=False)
+    Parameters:
+        None
+        
+    Returns:
+        None
+
+    Usage example:
+        build_content_index()
+    '''
+    data = read_table('airline_reviews_clean', columns=['id', 'review', 'airline_name'] + CONTENT_SEGMENTS)
+    data = data.astype({column: str for column in ['airline_name'] + CONTENT_SEGMENTS})
+    groupings = {'content_table': ['airline_name'],
+                 **{'content_table_' + column: [column, 'airline_name'] for column in CONTENT_SEGMENTS}}
+
+    # Group of every review, so the embeddings are summed batch by batch instead of being kept in memory
+    groups = {name: (data.groupby(keys, sort=False).ngroup().to_numpy(), data[keys].drop_duplicates().reset_index(drop=True))
+              for name, keys in groupings.items()}
+    sums = {}
+    if len(data):
+        model = CachedModel(load_sentiment_model(MODEL_PATH),
+                            PredictionCache(PREDICTION_CACHE_FILE, namespace=model_namespace(MODEL_PATH)))
+        offset = 0
+        for ids, vectors in embed_reviews(model, zip(data['id'], data['review']),
+                                          batch_size=SCORE_BATCH_SIZE,
+                                          workers=SCORE_WORKERS):
+            for name, (codes, uniques) in groups.items():
+                batch_sums = sums.setdefault(name, np.zeros((len(uniques), vectors.shape[1])))
+                np.add.at(batch_sums, codes[offset:offset + len(ids)], vectors)
+            offset += len(ids)
+
+    for name, keys in groupings.items():
+        codes, uniques = groups[name]
+        embeddings = sums.get(name, np.zeros((len(uniques), 0)))
+        table = uniques.copy()
+        table[['embedding_' + str(column) for column in range(embeddings.shape[1])]] = embeddings
+        table['review_count'] = np.bincount(codes, minlength=len(uniques))
+
+        # Embedding sums add up across runs, so only this batch has to be embedded
+        committed_name = name + '_committed'
+        if LOAD_MODE == 'incremental' and os.path.exists(table_path(committed_name)):
+            committed = read_table(committed_name).astype({key: str for key in keys})
+            table = pd.concat([committed, table], ignore_index=True).groupby(keys, as_index=False).sum()
+        write_table(table, name)
+
+        # Unit-length mean embeddings, indexed per airline or per airline and segment value
+        vectors = table.filter(like='embedding_').to_numpy(dtype='float32')
+        if not len(vectors) or not vectors.shape[1]:
+            continue
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        if len(keys) == 1:
+            items = table['airline_name']
+        else:
+            items = [segment_item(airline, segment) for segment, airline in zip(table[keys[0]], table['airline_name'])]
+        ContentIndex.build(items, vectors).save(name.replace('content_table', 'content_neighbors'))
+
+def train_model():
+    '''Embeds the labelled reviews of the batch into a pending store and retrains the sentiment model head on every embedding.
     
-def insert_data():
-    '''Inserts the cleaned data into Elasticsearch.
+    Parameters:
+        None
+        
+    Returns:
+        None
+
+    Usage example:
+        train_model()
+    '''
+    # Embeddings computed by the content index task are answered from the shared cache
+    data = read_table('airline_reviews_clean', columns=['id', 'review', 'recommended'])
+    model = CachedModel(load_sentiment_model(MODEL_PATH),
+                        PredictionCache(PREDICTION_CACHE_FILE, namespace=model_namespace(MODEL_PATH)))
+
+    # The committed store only grows once the watermark advances, so a retried or failed batch never adds its reviews twice
+    remove_embeddings(PENDING_EMBEDDING_STORE)
+    added = store_embeddings(model, zip(data['id'], data['review'], data['recommended'].astype(str) == 'yes'),
+                             EMBEDDING_STORE,
+                             batch_size=SCORE_BATCH_SIZE,
+                             workers=SCORE_WORKERS,
+                             output=PENDING_EMBEDDING_STORE)
+    log_event('embedded', reviews=added)
+
+    # Retrain only when there are new reviews, or no retrained model yet
+    _, vectors, labels = load_embeddings(PENDING_EMBEDDING_STORE if added else EMBEDDING_STORE)
+    if len(labels) < TRAIN_MIN_REVIEWS or (not added and os.path.exists(TRAINED_MODEL_PATH)):
+        return
+    head, report = train_head(vectors, labels, TRAIN_KIND)
+    save_trained_model(head, report, TRAINED_MODEL_PATH, MODEL_PATH)
+    log_event('trained', kind=TRAIN_KIND, reviews=len(labels), test_accuracy=report['test']['accuracy'])
+
+def build_eda_stats():
+    '''Adds the cleaned batch to the statistics of the Exploratory Data Analysis page and writes the artifact it renders.
     
     Parameters:
         None
@@ -169,20 +595,119 @@ def insert_data():
         None
 
     Usage example:
-        insert_data()
+        build_eda_stats()
     '''
 
-    # Read data
-    data = pd.read_csv('airline_reviews_clean.csv')
+    # Statistics only ever add up, so an incremental run only reads its own batch
+    if LOAD_MODE == 'incremental' and os.path.exists(EDA_STATE_FILE):
+        stats = EdaStats.load(EDA_STATE_FILE)
+    else:
+        stats = EdaStats()
+    for chunk in iter_table('airline_reviews_clean', chunk_rows=CLEAN_CHUNK_ROWS):
+        stats.partial_fit(chunk)
+    stats.save(PENDING_EDA_STATE_FILE)
+    stats.write(EDA_STATS_FILE)
+
+def prepare_index():
+    '''Creates the Elasticsearch index ahead of the partitioned load and pauses its refreshes until the load is over.
     
+    Parameters:
+        None
+        
+    Returns:
+        None
+
+    Usage example:
+        prepare_index()
+    '''
+
     # Define Elasticsearch
     es = Elasticsearch('http://elasticsearch:9200')
     print('Connection status: ', es.ping())
 
-    for i, r in data.iterrows():
-        doc = r.to_json()
-        res = es.index(index="finpro", doc_type="doc", body=doc)
-        print(res)
+    # Create the index with its explicit mapping, from scratch when the whole table is reloaded, migrating an index with another mapping
+    create_review_index(es, INDEX, recreate=LOAD_MODE == 'full')
+    pause_refresh(es, INDEX)
+
+def insert_data(partition=None):
+    '''Inserts one partition of the cleaned data into Elasticsearch, or every partition when None.
+    
+    Parameters:
+        partition (int): Airline hash bucket to index.
+        
+    Returns:
+        None
+
+    Usage example:
+        insert_data(partition=3)
+    '''
+    # A single call prepares and finishes the index itself
+    if partition is None:
+        prepare_index()
+        try:
+            for partition in range(PARTITIONS):
+                insert_data(partition)
+        finally:
+            finish_index()
+        return
+
+    # Stream the cleaned data into the index through the bulk API, keyed by row ID so retries overwrite
+    es = Elasticsearch('http://elasticsearch:9200')
+    stats = bulk_load(es, iter_table(partition_name('airline_reviews_clean', partition), chunk_rows=ES_CHUNK_ROWS), index=INDEX,
+                      id_column=WATERMARK_COLUMN,
+                      batch_size=ES_BATCH_SIZE,
+                      workers=ES_WORKERS)
+    record(documents_indexed=stats['docs'], documents_failed=stats['failed'])
+
+def finish_index():
+    '''Restores the default refreshes of the Elasticsearch index once every partition has been loaded.
+    
+    Parameters:
+        None
+        
+    Returns:
+        None
+
+    Usage example:
+        finish_index()
+    '''
+    es = Elasticsearch('http://elasticsearch:9200')
+    resume_refresh(es, INDEX)
+
+def commit_watermark():
+    '''Advances the watermark once the batch has been cleaned, aggregated and indexed.
+    
+    Parameters:
+        None
+        
+    Returns:
+        None
+
+    Usage example:
+        commit_watermark()
+    '''
+    state = read_state()
+
+    # Keep the merged ratings, imputation and EDA statistics, the review signatures and embeddings as the base for the next incremental run
+    for name in AGGREGATE_TABLES:
+        shutil.copyfile(table_path(name), table_path(name + '_committed'))
+    if os.path.exists(PENDING_IMPUTER_FILE):
+        os.replace(PENDING_IMPUTER_FILE, IMPUTER_FILE)
+    if os.path.exists(PENDING_EDA_STATE_FILE):
+        os.replace(PENDING_EDA_STATE_FILE, EDA_STATE_FILE)
+    for partition in range(PARTITIONS):
+        index_prefix = partition_name(DEDUP_INDEX_PREFIX, partition)
+        if index_exists(index_prefix + '_pending'):
+            promote_index(index_prefix + '_pending', index_prefix)
+    if embeddings_exist(PENDING_EMBEDDING_STORE):
+        promote_embeddings(PENDING_EMBEDDING_STORE, EMBEDDING_STORE)
+
+    # Only move forward, so a stale rerun can never rewind the watermark
+    if state['pending'] is not None:
+        state['watermark'] = max(state['watermark'], state['pending'])
+    state['pending'] = None
+    write_state(state)
+    log_event('committed', watermark=state['watermark'])
 
 # Define default arguments for the DAG
 default_args = {'owner': 'group2',
@@ -197,19 +722,64 @@ with DAG ('flightBuddy',
     
           # First task : calling 'get_data' function
           getData = PythonOperator(task_id = 'GetData',
-                                   python_callable = get_data)
+                                   python_callable = instrumented(get_data))
+
+          # Partition task : calling 'partition_data' function
+          partitionData = PythonOperator(task_id = 'PartitionData',
+                                         python_callable = instrumented(partition_data))
           
-          # Second task : calling 'clean_data' function
-          cleanData = PythonOperator(task_id = 'CleanData',
-                                     python_callable = clean_data)
+          # Second task : calling 'clean_data' function, one mapped instance per partition
+          cleanData = PythonOperator.partial(task_id = 'CleanData',
+                                             python_callable = instrumented(clean_data)).expand(op_kwargs = PARTITION_KWARGS)
           
-          # Third task : calling 'rating_table' function
-          convertData = PythonOperator(task_id = 'convertData',
-                                     python_callable = convert_data)
+          # Third task : calling 'convert_data' function, one mapped instance per partition
+          convertData = PythonOperator.partial(task_id = 'convertData',
+                                               python_callable = instrumented(convert_data)).expand(op_kwargs = PARTITION_KWARGS)
+
+          # Reduce task : calling 'merge_ratings' function
+          mergeRatings = PythonOperator(task_id = 'MergeRatings',
+                                        python_callable = instrumented(merge_ratings))
+
+          # Index task : calling 'prepare_index' function
+          prepareIndex = PythonOperator(task_id = 'PrepareIndex',
+                                        python_callable = instrumented(prepare_index))
+
+          # Fourth task : calling 'insert_data' function, one mapped instance per partition
+          insertData = PythonOperator.partial(task_id = 'InsertData',
+                                              python_callable = instrumented(insert_data)).expand(op_kwargs = PARTITION_KWARGS)
+
+          # Index task : calling 'finish_index' function, even when a partition failed so refreshes are never left off. It does not gate the watermark
+          finishIndex = PythonOperator(task_id = 'FinishIndex',
+                                       python_callable = instrumented(finish_index),
+                                       trigger_rule = 'all_done')
 
-          # Third task : calling 'insert_data' function
-          insertData = PythonOperator(task_id = 'InsertData',
-                                      python_callable = insert_data)
+          # Scoring task : calling 'predict_sentiment' function
+          predictSentiment = PythonOperator(task_id = 'PredictSentiment',
+                                            python_callable = instrumented(predict_sentiment))
+
+          # Content task : calling 'build_content_index' function
+          buildContentIndex = PythonOperator(task_id = 'BuildContentIndex',
+                                             python_callable = instrumented(build_content_index))
+
+          # Training task : calling 'train_model' function
+          trainModel = PythonOperator(task_id = 'TrainModel',
+                                      python_callable = instrumented(train_model))
+
+          # EDA task : calling 'build_eda_stats' function
+          buildEdaStats = PythonOperator(task_id = 'BuildEdaStats',
+                                         python_callable = instrumented(build_eda_stats))
+
+          # Fifth task : calling 'commit_watermark' function
+          commitWatermark = PythonOperator(task_id = 'CommitWatermark',
+                                           python_callable = instrumented(commit_watermark))
 
 # Set up the task dependencies
-getData >> cleanData >> convertData >> insertData
\ No newline at end of file
+getData >> partitionData >> cleanData >> convertData >> mergeRatings >> commitWatermark
+partitionData >> prepareIndex >> insertData
+cleanData >> insertData >> finishIndex >> commitWatermark
+
+# FinishIndex restores the refreshes even after a failed partition, the watermark only advances once every partition is indexed
+insertData >> commitWatermark
+cleanData >> predictSentiment >> commitWatermark
+cleanData >> buildContentIndex >> trainModel >> commitWatermark
+cleanData >> buildEdaStats >> commitWatermark
\ No newline at end of file
@@ -21,40 +21,139 @@ CREATE TABLE airline_reviews (
     value_for_money FLOAT,
     recommended VARCHAR(10));
 
+-- Running sums, sums of squares and counts of the ratings per airline, updated from every inserted batch
+CREATE TABLE airline_rating_sums (
+    airline_name VARCHAR(255) PRIMARY KEY,
+    review_count BIGINT NOT NULL DEFAULT 0,
+    sum_seat_comfort FLOAT NOT NULL DEFAULT 0,
+    sumsq_seat_comfort FLOAT NOT NULL DEFAULT 0,
+    count_seat_comfort BIGINT NOT NULL DEFAULT 0,
+    sum_cabin_staff_service FLOAT NOT NULL DEFAULT 0,
+    sumsq_cabin_staff_service FLOAT NOT NULL DEFAULT 0,
+    count_cabin_staff_service BIGINT NOT NULL DEFAULT 0,
+    sum_food_beverages FLOAT NOT NULL DEFAULT 0,
+    sumsq_food_beverages FLOAT NOT NULL DEFAULT 0,
+    count_food_beverages BIGINT NOT NULL DEFAULT 0,
+    sum_ground_service FLOAT NOT NULL DEFAULT 0,
+    sumsq_ground_service FLOAT NOT NULL DEFAULT 0,
+    count_ground_service BIGINT NOT NULL DEFAULT 0,
+    sum_inflight_entertainment FLOAT NOT NULL DEFAULT 0,
+    sumsq_inflight_entertainment FLOAT NOT NULL DEFAULT 0,
+    count_inflight_entertainment BIGINT NOT NULL DEFAULT 0,
+    sum_wifi_connectivity FLOAT NOT NULL DEFAULT 0,
+    sumsq_wifi_connectivity FLOAT NOT NULL DEFAULT 0,
+    count_wifi_connectivity BIGINT NOT NULL DEFAULT 0,
+    sum_value_for_money FLOAT NOT NULL DEFAULT 0,
+    sumsq_value_for_money FLOAT NOT NULL DEFAULT 0,
+    count_value_for_money BIGINT NOT NULL DEFAULT 0);
+
+-- Create new table for recommender system, kept up to date from the running sums
+CREATE TABLE avg_ratings_per_airline (
+    id SERIAL PRIMARY KEY,
+    airline_name VARCHAR(255) UNIQUE,
+    avg_seat_comfort FLOAT,
+    avg_cabin_staff_service FLOAT,
+    avg_food_beverages FLOAT,
+    avg_ground_service FLOAT,
+    avg_inflight_entertainment FLOAT,
+    avg_wifi_connectivity FLOAT,
+    avg_value_for_money FLOAT);
+
+-- Add the rows of an insert to the running sums and refresh the averages of the airlines they belong to,
+-- reading only the inserted rows instead of the whole reviews table
+CREATE OR REPLACE FUNCTION update_airline_ratings() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO airline_rating_sums AS s
+    SELECT
+        airline_name,
+        COUNT(*),
+        COALESCE(SUM(seat_comfort), 0), COALESCE(SUM(seat_comfort ^ 2), 0), COUNT(seat_comfort),
+        COALESCE(SUM(cabin_staff_service), 0), COALESCE(SUM(cabin_staff_service ^ 2), 0), COUNT(cabin_staff_service),
+        COALESCE(SUM(food_beverages), 0), COALESCE(SUM(food_beverages ^ 2), 0), COUNT(food_beverages),
+        COALESCE(SUM(ground_service), 0), COALESCE(SUM(ground_service ^ 2), 0), COUNT(ground_service),
+        COALESCE(SUM(inflight_entertainment), 0), COALESCE(SUM(inflight_entertainment ^ 2), 0), COUNT(inflight_entertainment),
+        COALESCE(SUM(wifi_connectivity), 0), COALESCE(SUM(wifi_connectivity ^ 2), 0), COUNT(wifi_connectivity),
+        COALESCE(SUM(value_for_money), 0), COALESCE(SUM(value_for_money ^ 2), 0), COUNT(value_for_money)
+    FROM new_reviews
+    GROUP BY airline_name
+    ON CONFLICT (airline_name) DO UPDATE SET
+        review_count = s.review_count + EXCLUDED.review_count,
+        sum_seat_comfort = s.sum_seat_comfort + EXCLUDED.sum_seat_comfort,
+        sumsq_seat_comfort = s.sumsq_seat_comfort + EXCLUDED.sumsq_seat_comfort,
+        count_seat_comfort = s.count_seat_comfort + EXCLUDED.count_seat_comfort,
+        sum_cabin_staff_service = s.sum_cabin_staff_service + EXCLUDED.sum_cabin_staff_service,
+        sumsq_cabin_staff_service = s.sumsq_cabin_staff_service + EXCLUDED.sumsq_cabin_staff_service,
+        count_cabin_staff_service = s.count_cabin_staff_service + EXCLUDED.count_cabin_staff_service,
+        sum_food_beverages = s.sum_food_beverages + EXCLUDED.sum_food_beverages,
+        sumsq_food_beverages = s.sumsq_food_beverages + EXCLUDED.sumsq_food_beverages,
+        count_food_beverages = s.count_food_beverages + EXCLUDED.count_food_beverages,
+        sum_ground_service = s.sum_ground_service + EXCLUDED.sum_ground_service,
+        sumsq_ground_service = s.sumsq_ground_service + EXCLUDED.sumsq_ground_service,
+        count_ground_service = s.count_ground_service + EXCLUDED.count_ground_service,
+        sum_inflight_entertainment = s.sum_inflight_entertainment + EXCLUDED.sum_inflight_entertainment,
+        sumsq_inflight_entertainment = s.sumsq_inflight_entertainment + EXCLUDED.sumsq_inflight_entertainment,
+        count_inflight_entertainment = s.count_inflight_entertainment + EXCLUDED.count_inflight_entertainment,
+        sum_wifi_connectivity = s.sum_wifi_connectivity + EXCLUDED.sum_wifi_connectivity,
+        sumsq_wifi_connectivity = s.sumsq_wifi_connectivity + EXCLUDED.sumsq_wifi_connectivity,
+        count_wifi_connectivity = s.count_wifi_connectivity + EXCLUDED.count_wifi_connectivity,
+        sum_value_for_money = s.sum_value_for_money + EXCLUDED.sum_value_for_money,
+        sumsq_value_for_money = s.sumsq_value_for_money + EXCLUDED.sumsq_value_for_money,
+        count_value_for_money = s.count_value_for_money + EXCLUDED.count_value_for_money;
+
+    INSERT INTO avg_ratings_per_airline (airline_name, avg_seat_comfort, avg_cabin_staff_service, avg_food_beverages, avg_ground_service, avg_inflight_entertainment, avg_wifi_connectivity, avg_value_for_money)
+    SELECT
+        airline_name,
+        sum_seat_comfort / NULLIF(count_seat_comfort, 0),
+        sum_cabin_staff_service / NULLIF(count_cabin_staff_service, 0),
+        sum_food_beverages / NULLIF(count_food_beverages, 0),
+        sum_ground_service / NULLIF(count_ground_service, 0),
+        sum_inflight_entertainment / NULLIF(count_inflight_entertainment, 0),
+        sum_wifi_connectivity / NULLIF(count_wifi_connectivity, 0),
+        sum_value_for_money / NULLIF(count_value_for_money, 0)
+    FROM airline_rating_sums
+    WHERE airline_name IN (SELECT airline_name FROM new_reviews)
+    ON CONFLICT (airline_name) DO UPDATE SET
+        avg_seat_comfort = EXCLUDED.avg_seat_comfort,
+        avg_cabin_staff_service = EXCLUDED.avg_cabin_staff_service,
+        avg_food_beverages = EXCLUDED.avg_food_beverages,
+        avg_ground_service = EXCLUDED.avg_ground_service,
+        avg_inflight_entertainment = EXCLUDED.avg_inflight_entertainment,
+        avg_wifi_connectivity = EXCLUDED.avg_wifi_connectivity,
+        avg_value_for_money = EXCLUDED.avg_value_for_money;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER airline_reviews_ratings
+AFTER INSERT ON airline_reviews
+REFERENCING NEW TABLE AS new_reviews
+FOR EACH STATEMENT EXECUTE FUNCTION update_airline_ratings();
+
 -- Insert data to the table
 COPY airline_reviews
 FROM '/tmp/airline_review_cleaned.csv'
 WITH DELIMITER ','
 CSV HEADER;
 
+-- Add the column backfilled by the batch sentiment scoring (1 positive, 0 negative)
+ALTER TABLE airline_reviews ADD COLUMN IF NOT EXISTS predicted_sentiment SMALLINT;
+
 -- Check the table
-SELECT * FROM airline_reviews
+SELECT * FROM airline_reviews;
 
--- Select only airline and columns of rating
+-- Export the airline and average rating columns, maintained by the trigger without scanning the reviews
 COPY (
     SELECT 
         airline_name,
-        AVG(seat_comfort) AS avg_seat_comfort,
-        AVG(cabin_staff_service) AS avg_cabin_staff_service,
-        AVG(food_beverages) AS avg_food_beverages,
-        AVG(ground_service) AS avg_ground_service,
-        AVG(inflight_entertainment) AS avg_inflight_entertainment,
-        AVG(wifi_connectivity) AS avg_wifi_connectivity,
-        AVG(value_for_money) AS 
+        avg_seat_comfort,
+        avg_cabin_staff_service,
+        avg_food_beverages,
+        avg_ground_service,
+        avg_inflight_entertainment,
+        avg_wifi_connectivity,
+        avg_value_for_money
     FROM 
-        airline_reviews
-    GROUP BY 
+        avg_ratings_per_airline
+    ORDER BY 
         airline_name
 ) TO '/tmp/avg_ratings_per_airline.csv' WITH CSV HEADER;
-
--- Create new table for recommender system
-CREATE TABLE avg_ratings_per_airline (
-    id SERIAL PRIMARY KEY,
-    airline_name VARCHAR(255),
-    avg_seat_comfort FLOAT,
-    avg_cabin_staff_service FLOAT,
-    avg_food_beverages FLOAT,
-    avg_ground_service FLOAT,
-    avg_inflight_entertainment FLOAT,
-    avg_wifi_connectivity FLOAT,
-    avg_value_for_money FLOAT);
\ No newline at end of file
@@ -0,0 +1,225 @@
+# Import libraries
+import os
+import json
+import heapq
+import numpy as np
+import pandas as pd
+
+class Imputer:
+    '''Fits missing-value statistics over chunks of data in a single pass and fills them in.
+
+    Numerical columns are filled with the median when their skewness is beyond the threshold and with the
+    mean otherwise, and categorical and boolean columns with their mode, as in the original
+    impute_missing_values. Categorical counts are exact up to max_values distinct values, beyond which a
+    Misra-Gries summary of max_values counters keeps the frequent values, so the state stays bounded and the
+    mode is still found whenever it holds more than a 1 / (max_values + 1) share of the rows. Free-text
+    columns are never scanned for a mode and are filled with an empty string instead.
+
+    Usage example:
+        imputer = Imputer()
+        for chunk in chunks:
+            imputer.partial_fit(chunk)
+        chunk = imputer.transform(chunk)
+        imputer.save('imputer.json')
+    '''
+
+    def __init__(self, text_columns=('review', 'review_title'), max_values=1000, skew_threshold=0.5):
+        self.text_columns = list(text_columns)
+        self.max_values = max_values
+        self.skew_threshold = skew_threshold
+
+        # Running power sums per numerical column: count, sum, sum of squares and sum of cubes
+        self.moments = {}
+
+        # Running value counts per numerical and categorical column, used for exact medians and modes
+        self.numeric_counts = {}
+        self.category_counts = {}
+
+        # Numerical columns with too many distinct values for an exact median
+        self.untracked = []
+
+    def partial_fit(self, chunk):
+        '''Updates the statistics with one chunk of rows.
+
+        Parameters:
+            chunk (DataFrame): Rows to learn from.
+
+        Returns:
+            Imputer: The updated imputer.
+
+        Usage example:
+            imputer.partial_fit(data)
+        '''
+        # Power sums for every numerical column at once
+        numeric = chunk.select_dtypes(include=['float64', 'int64']).astype('float64')
+        sums = pd.DataFrame({'n': numeric.count(),
+                             's1': numeric.sum(),
+                             's2': (numeric ** 2).sum(),
+                             's3': (numeric ** 3).sum()})
+        for column, row in sums.iterrows():
+            previous = self.moments.get(column, [0.0, 0.0, 0.0, 0.0])
+            self.moments[column] = [a + b for a, b in zip(previous, row.tolist())]
+
+        # Value counts of the low-cardinality numerical columns in one stacked pass
+        tracked = [column for column in numeric.columns if column not in self.untracked]
+        self._update_counts(numeric[tracked], self.numeric_counts, self.max_values)
+
+        # Value counts of the categorical and boolean columns, skipping free text, reduced to the frequent values beyond max_values
+        categorical = [column for column in chunk.select_dtypes(include=['object', 'category', 'bool', 'boolean']).columns
+                       if column not in self.text_columns]
+        self._update_counts(chunk[categorical].astype(object), self.category_counts, None)
+        if self.max_values is not None:
+            for column in categorical:
+                if len(self.category_counts.get(column, {})) > self.max_values:
+                    self.category_counts[column] = self._heavy_hitters(self.category_counts[column], self.max_values)
+        return self
+
+    @staticmethod
+    def _heavy_hitters(column_counts, max_values):
+        # Misra-Gries merge: the max_values most frequent values are kept, their counts lowered by the next count.
+        # Counters at zero are kept too, so a column of distinct values still has a mode, the smallest value
+        kept = heapq.nsmallest(max_values + 1, column_counts.items(), key=lambda item: (-item[1], item[0]))
+        return {value: count - kept[-1][1] for value, count in kept[:-1]}
+
+    def _update_counts(self, data, counts, max_values):
+        # Numerical columns with too many distinct values are dropped from tracking for good
+        if max_values is not None:
+            distinct = data.nunique()
+            for column in distinct[distinct > max_values].index:
+                counts.pop(column, None)
+                self.untracked.append(column)
+            data = data.drop(columns=distinct[distinct > max_values].index)
+        if data.empty:
+            return
+
+        stacked = data.melt().dropna().value_counts(['variable', 'value'])
+        for (column, value), count in stacked.items():
+            column_counts = counts.setdefault(column, {})
+            column_counts[value] = column_counts.get(value, 0) + int(count)
+        if max_values is not None:
+            for column in data.columns:
+                if len(counts.get(column, {})) > max_values:
+                    counts.pop(column)
+                    self.untracked.append(column)
+
+    def fill_values(self):
+        '''Computes the value used to fill each column.
+
+        Parameters:
+            None
+
+        Returns:
+            dict: Fill value per column.
+
+        Usage example:
+            values = imputer.fill_values()
+        '''
+        values = {}
+        for column, (n, s1, s2, s3) in self.moments.items():
+            if n == 0:
+                continue
+            mean = s1 / n
+            skew = self._skew(n, mean, s2, s3)
+            if skew is not None and abs(skew) > self.skew_threshold and column in self.numeric_counts:
+                # Highly skewed
+                values[column] = self._median(self.numeric_counts[column])
+            else:
+                # Normally distributed, or too many distinct values for an exact median
+                values[column] = mean
+
+        for column, column_counts in self.category_counts.items():
+            if column_counts:
+                # Highest count wins, ties go to the smallest value like Series.mode()[0]
+                values[column] = min(column_counts.items(), key=lambda item: (-item[1], item[0]))[0]
+
+        for column in self.text_columns:
+            values.setdefault(column, '')
+        return values
+
+    @staticmethod
+    def _skew(n, mean, s2, s3):
+        # Adjusted Fisher-Pearson coefficient, as computed by Series.skew()
+        if n < 3:
+            return None
+        m2 = s2 / n - mean ** 2
+        m3 = s3 / n - 3 * mean * s2 / n + 2 * mean ** 3
+        if m2 <= 0:
+            return None
+        return np.sqrt(n * (n - 1)) / (n - 2) * m3 / m2 ** 1.5
+
+    @staticmethod
+    def _median(column_counts):
+        values = np.array(sorted(column_counts))
+        cumulative = np.cumsum([column_counts[value] for value in values])
+        total = cumulative[-1]
+        lower = values[np.searchsorted(cumulative, (total - 1) // 2 + 1)]
+        upper = values[np.searchsorted(cumulative, total // 2 + 1)]
+        return (lower + upper) / 2
+
+    def transform(self, chunk):
+        '''Fills the missing values of a chunk with the fitted statistics.
+
+        Parameters:
+            chunk (DataFrame): Rows to fill.
+
+        Returns:
+            DataFrame: Rows with missing values filled.
+
+        Usage example:
+            data = imputer.transform(data)
+        '''
+        values = {column: value for column, value in self.fill_values().items() if column in chunk.columns}
+
+        # Categorical columns only accept a fill value among their categories
+        chunk = chunk.copy()
+        for column, value in values.items():
+            if isinstance(chunk[column].dtype, pd.CategoricalDtype) and value not in chunk[column].cat.categories:
+                chunk[column] = chunk[column].cat.add_categories([value])
+        return chunk.fillna(values)
+
+    def save(self, path):
+        '''Persists the fitted statistics to a JSON file.
+
+        Parameters:
+            path (str): JSON file to write.
+
+        Returns:
+            None
+
+        Usage example:
+            imputer.save('imputer.json')
+        '''
+        state = {'text_columns': self.text_columns,
+                 'max_values': self.max_values,
+                 'skew_threshold': self.skew_threshold,
+                 'moments': self.moments,
+                 'numeric_counts': {column: list(counts.items()) for column, counts in self.numeric_counts.items()},
+                 'category_counts': {column: list(counts.items()) for column, counts in self.category_counts.items()},
+                 'untracked': self.untracked}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, default=str)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        '''Loads fitted statistics saved with save.
+
+        Parameters:
+            path (str): JSON file to read.
+
+        Returns:
+            Imputer: The fitted imputer.
+
+        Usage example:
+            imputer = Imputer.load('imputer.json')
+        '''
+        with open(path) as f:
+            state = json.load(f)
+        imputer = cls(state['text_columns'], state.get('max_values', state.get('max_categories')), state['skew_threshold'])
+        imputer.moments = state['moments']
+        imputer.numeric_counts = {column: dict((float(value), count) for value, count in counts)
+                                  for column, counts in state['numeric_counts'].items()}
+        imputer.category_counts = {column: dict(counts) for column, counts in state['category_counts'].items()}
+        imputer.untracked = state['untracked']
+        return imputer
@@ -0,0 +1,9 @@
+# Import libraries
+import os
+import sys
+
+# The scripts import each other by module name, from the repository root and from the deployment folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [ROOT, os.path.join(ROOT, 'deployment')]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
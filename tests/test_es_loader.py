@@ -0,0 +1,80 @@
+# Import libraries
+import json
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer
+import pandas as pd
+import pytest
+
+pytest.importorskip('elasticsearch')
+from elasticsearch import Elasticsearch
+from benchmark import FakeElasticsearchHandler
+from es_loader import build_actions, bulk_load
+
+class BulkHandler(FakeElasticsearchHandler):
+    '''Fake _bulk endpoint that rejects documents by their review text and counts every attempt per document ID.
+
+    'busy' documents are rejected with a 429 on their first attempt only, 'always busy' ones on every attempt
+    and 'bad' ones fail mapping with a 400, which is never worth resending.
+    '''
+
+    attempts = Counter()
+    lock = threading.Lock()
+
+    def _outcome(self, doc_id, source):
+        with self.lock:
+            self.attempts[doc_id] += 1
+            attempt = self.attempts[doc_id]
+        review = source.get('review')
+        if review == 'bad':
+            return {'status': 400, 'error': {'type': 'mapper_parsing_exception', 'reason': 'failed to parse'}}
+        if review == 'always busy' or (review == 'busy' and attempt == 1):
+            return {'status': 429, 'error': {'type': 'es_rejected_execution_exception', 'reason': 'queue full'}}
+        return {'status': 201, 'result': 'created'}
+
+    def do_POST(self):
+        lines = [line for line in self.rfile.read(int(self.headers.get('Content-Length', 0))).splitlines() if line.strip()]
+        items = []
+        for meta_line, source_line in zip(lines[::2], lines[1::2]):
+            (action_type, meta), = json.loads(meta_line).items()
+            outcome = self._outcome(meta.get('_id'), json.loads(source_line))
+            items.append({action_type: {'_index': meta.get('_index'), '_id': meta.get('_id'), **outcome}})
+        self._send({'took': 1, 'errors': any(item['index']['status'] >= 300 for item in items), 'items': items})
+
+@pytest.fixture
+def es():
+    BulkHandler.attempts = Counter()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BulkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield Elasticsearch(f'http://127.0.0.1:{server.server_address[1]}')
+    server.shutdown()
+
+def chunks():
+    reviews = ['fine'] * 30 + ['busy'] * 5 + ['bad'] * 3 + ['always busy'] * 2
+    data = pd.DataFrame({'id': range(len(reviews)), 'review': reviews, 'seat_comfort': [None, 4.0] * (len(reviews) // 2)})
+    return [data.iloc[start:start + 15] for start in range(0, len(data), 15)]
+
+def test_build_actions_keys_documents_by_id():
+    actions = build_actions(chunks()[0], 'finpro', id_column='id')
+    assert [action['_id'] for action in actions] == [str(i) for i in range(15)]
+    assert actions[0]['_source']['seat_comfort'] is None
+    assert all('_id' not in action for action in build_actions(chunks()[0], 'finpro'))
+
+def test_only_rejected_documents_are_resent(es):
+    stats = bulk_load(es, chunks(), 'finpro', id_column='id', batch_size=7, workers=2, max_retries=3, backoff=0)
+
+    # Accepted and permanently failed documents are sent once, retryable ones until accepted or out of retries
+    attempts = BulkHandler.attempts
+    assert all(attempts[str(i)] == 1 for i in range(30))
+    assert all(attempts[str(i)] == 2 for i in range(30, 35))
+    assert all(attempts[str(i)] == 1 for i in range(35, 38))
+    assert all(attempts[str(i)] == 4 for i in range(38, 40))
+
+    assert stats['docs'] == 35
+    assert stats['failed'] == 5
+    assert stats['docs_per_sec'] > 0
+
+def test_nothing_is_resent_without_rejections(es):
+    stats = bulk_load(es, [chunk[chunk['review'] == 'fine'] for chunk in chunks()], 'finpro', id_column='id', backoff=0)
+    assert stats['docs'] == 30 and stats['failed'] == 0
+    assert sum(BulkHandler.attempts.values()) == 30
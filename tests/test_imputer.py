@@ -0,0 +1,78 @@
+# Import libraries
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from imputer import Imputer
+
+@pytest.fixture
+def data():
+    rng = np.random.RandomState(20)
+    n = 2000
+    data = pd.DataFrame({'overall_rating': rng.randint(1, 11, size=n).astype('float64'),
+                         'seat_comfort': rng.exponential(1.0, size=n).round(1),
+                         'value_for_money': rng.normal(3, 1, size=n).round(1),
+                         'airline_name': pd.Categorical(rng.choice(['Qatar Airways', 'Emirates', 'Etihad'], size=n, p=[0.5, 0.3, 0.2])),
+                         'route': rng.choice([f'route {i}' for i in range(1500)], size=n).astype(object),
+                         'verified': pd.array(rng.rand(n) < 0.7, dtype='boolean'),
+                         'review': ['text'] * n})
+    for column in data.columns:
+        data.loc[rng.rand(n) < 0.1, column] = None
+    return data
+
+def fit(data, chunk_rows=300, **kwargs):
+    imputer = Imputer(**kwargs)
+    for start in range(0, len(data), chunk_rows):
+        imputer.partial_fit(data.iloc[start:start + chunk_rows])
+    return imputer
+
+def test_moments_match_pandas(data):
+    imputer = fit(data)
+    for column in ['overall_rating', 'seat_comfort', 'value_for_money']:
+        n, s1, s2, s3 = imputer.moments[column]
+        values = data[column].dropna()
+        assert n == len(values)
+        assert s1 / n == pytest.approx(values.mean())
+        assert imputer._skew(n, s1 / n, s2, s3) == pytest.approx(values.skew())
+        assert imputer._median(imputer.numeric_counts[column]) == pytest.approx(values.median())
+
+def test_fill_values_match_pandas(data):
+    values = fit(data, max_values=2000).fill_values()
+    for column in ['overall_rating', 'seat_comfort', 'value_for_money']:
+        series = data[column].dropna()
+        expected = series.median() if abs(series.skew()) > 0.5 else series.mean()
+        assert values[column] == pytest.approx(expected)
+
+    # Every categorical and boolean column within max_values distinct values gets its exact mode
+    for column in ['airline_name', 'route', 'verified']:
+        assert values[column] == data[column].mode()[0]
+    assert values['review'] == ''
+
+def test_untracked_median_falls_back_to_mean(data):
+    imputer = fit(data, max_values=5)
+    assert 'seat_comfort' in imputer.untracked
+    assert imputer.fill_values()['seat_comfort'] == pytest.approx(data['seat_comfort'].mean())
+
+def test_category_counts_stay_bounded(tmp_path):
+    rng = np.random.RandomState(20)
+    imputer = Imputer(max_values=50)
+    for chunk in range(200):
+        rows = np.arange(chunk * 500, (chunk + 1) * 500)
+        aircraft = np.where(rng.rand(500) < 0.3, 'A320', [f'aircraft {row}' for row in rows]).astype(object)
+        imputer.partial_fit(pd.DataFrame({'review_date': [f'day {row}' for row in rows], 'aircraft': aircraft}))
+        assert max(len(counts) for counts in imputer.category_counts.values()) <= 50
+
+    # A value on 30% of the rows is still the mode, and a column of distinct values still gets a fill value
+    values = imputer.fill_values()
+    assert values['aircraft'] == 'A320'
+    assert values['review_date'] in {f'day {row}' for row in range(100000)}
+    imputer.save(str(tmp_path / 'imputer.json'))
+    assert os.path.getsize(tmp_path / 'imputer.json') < 10000
+
+def test_transform_and_save_load(data, tmp_path):
+    imputer = fit(data)
+    imputer.save(str(tmp_path / 'imputer.json'))
+    loaded = Imputer.load(str(tmp_path / 'imputer.json'))
+    filled = loaded.transform(data)
+    assert not filled.isna().any().any()
+    pd.testing.assert_frame_equal(filled, imputer.transform(data))
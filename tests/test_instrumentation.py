@@ -0,0 +1,13 @@
+# Import libraries
+import json
+import logging
+from instrumentation import timer
+
+def test_labels_and_amounts_sharing_a_name_are_both_logged(caplog):
+    with caplog.at_level(logging.INFO, logger='flightbuddy.metrics'):
+        with timer('load_rows', rows='all', time='peak') as span:
+            span.record(rows=5, stage=2)
+    event = json.loads(caplog.records[-1].getMessage())
+    assert (event['event'], event['stage'], event['error']) == ('stage', 'load_rows', False)
+    assert (event['rows'], event['label_rows']) == (5, 'all')
+    assert (event['amount_stage'], event['label_time']) == (2, 'peak')
@@ -0,0 +1,130 @@
+# Import libraries
+import os
+import sys
+import subprocess
+import numpy as np
+import pytest
+from fingerprint import fingerprint64
+from lite_model import LiteSentimentModel, verify
+
+# Largest accepted probability difference between the exported and the source model
+TOLERANCE = 1e-5
+
+VOCABULARY = ['halo', 'pesawat', 'nyaman', 'kursi', 'makanan', 'enak', 'pramugari', 'ramah', 'terlambat', 'bagasi']
+HELD_OUT = ['pesawat nyaman, pramugari ramah!', 'kursi sempit makanan dingin', 'Terlambat lagi...',
+            'bagasi  hilang', 'penerbangan ünïcödé', '', ' ']
+
+def reference_embed(embeddings, oov_buckets, texts):
+    # The hub module's embedding, spelled out: strip punctuation, split on spaces, bucket unknown words, sum / sqrt(n)
+    vectors = []
+    for text in texts:
+        text = ''.join(char for char in text if char not in ',.!\'')
+        tokens = [token for token in text.split(' ') if token] or ['']
+        rows = [VOCABULARY.index(token) if token in VOCABULARY else
+                len(VOCABULARY) + fingerprint64(token.encode('utf-8')) % oov_buckets for token in tokens]
+        vectors.append(embeddings[rows].sum(axis=0) / np.sqrt(len(rows)))
+    return np.array(vectors, dtype='float32')
+
+@pytest.fixture
+def lite():
+    rng = np.random.RandomState(0)
+    embeddings = rng.normal(size=(len(VOCABULARY) + 5, 8)).astype('float32')
+    return LiteSentimentModel(VOCABULARY, embeddings, rng.normal(size=(8, 2)).astype('float32'),
+                              rng.normal(size=2).astype('float32'), 5, strip_punctuation=True)
+
+def test_fingerprint_matches_farmhash():
+    # Reference values of farmhash.fingerprint64, covering every input length branch
+    assert fingerprint64(b'') == 0x9ae16a3b2f90404f
+    assert fingerprint64(b'a') == 0xb3454265b6df75e3
+    assert fingerprint64(b'pesawat terlambat') == 0x695c4b38d6cc3dea
+    assert fingerprint64('ünïcödé'.encode('utf-8')) == 0xd268bb272664e272
+    assert fingerprint64(b'x' * 40) == 0xebf8e8aeac993c94
+    assert fingerprint64(b'y' * 100) == 0xed9bc2d00a124603
+
+def test_unknown_words_use_their_buckets(lite):
+    assert lite.tokenize('bagasi  hilang!') == ['bagasi', 'hilang']
+    assert lite.tokenize(' ') == ['']
+    np.testing.assert_allclose(lite.embed(HELD_OUT), reference_embed(lite.embeddings, 5, HELD_OUT), rtol=1e-6, atol=1e-6)
+
+def test_save_load_memory_maps_embeddings(lite, tmp_path):
+    path = str(tmp_path / 'lite.npz')
+    lite.save(path)
+    loaded = LiteSentimentModel.load(path)
+    assert isinstance(loaded.embeddings, np.memmap)
+    assert (loaded.tokens, loaded.oov_buckets, loaded.strip_punctuation, loaded.skip_empty) == (VOCABULARY, 5, True, True)
+    np.testing.assert_array_equal(loaded.predict(HELD_OUT), lite.predict(HELD_OUT))
+
+def test_unknown_words_without_buckets_raise(lite):
+    lite.oov_buckets = 0
+    lite.embed(['pesawat nyaman'])
+    with pytest.raises(ValueError, match='outside the exported vocabulary'):
+        lite.embed(['pesawat sempit'])
+
+def build_hub_model(directory):
+    # Text embedding module built like TF-Hub's NNLM export: vocabulary file, OOV buckets and a sqrtn combiner
+    import tensorflow as tf
+    import tensorflow_hub as hub
+    vocabulary_path = os.path.join(directory, 'tokens.txt')
+    with open(vocabulary_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(VOCABULARY) + '\n')
+
+    class TextEmbedding(tf.train.Checkpoint):
+        def __init__(self):
+            super().__init__()
+            self.vocabulary_file = tf.saved_model.Asset(vocabulary_path)
+            initializer = tf.lookup.TextFileInitializer(self.vocabulary_file, tf.string, tf.lookup.TextFileIndex.WHOLE_LINE,
+                                                        tf.int64, tf.lookup.TextFileIndex.LINE_NUMBER)
+            self.table = tf.lookup.StaticVocabularyTable(initializer, 5)
+            self.embeddings = tf.Variable(np.random.RandomState(0).normal(size=(len(VOCABULARY) + 5, 8)).astype('float32'))
+            self.__call__ = tf.function(self.embed, input_signature=[tf.TensorSpec([None], tf.string)])
+
+        def embed(self, sentences):
+            tokens = tf.strings.split(tf.strings.regex_replace(sentences, r'\pP', ''), ' ').to_sparse()
+            tokens, _ = tf.sparse.fill_empty_rows(tokens, tf.constant(''))
+            ids = tf.SparseTensor(tokens.indices, self.table.lookup(tokens.values), tokens.dense_shape)
+            return tf.nn.safe_embedding_lookup_sparse(self.embeddings, ids, None, combiner='sqrtn')
+
+    tf.saved_model.save(TextEmbedding(), os.path.join(directory, 'hub'))
+    model = tf.keras.Sequential([hub.KerasLayer(os.path.join(directory, 'hub'), output_shape=[8], input_shape=[], dtype=tf.string),
+                                 tf.keras.layers.Dense(2, activation='sigmoid')])
+    model_path = os.path.join(directory, 'model')
+    model.save(model_path, save_format='tf')
+    return model_path
+
+def test_export_matches_hub_module_without_tensorflow(tmp_path):
+    pytest.importorskip('tensorflow')
+    pytest.importorskip('tensorflow_hub')
+    from batch_predict import load_sentiment_model
+    model_path = build_hub_model(str(tmp_path))
+    keras_model = load_sentiment_model(model_path)
+
+    lite = LiteSentimentModel.export(keras_model, model_path, ['pesawat nyaman'])
+    assert (lite.tokens, lite.oov_buckets, lite.strip_punctuation, lite.skip_empty) == (VOCABULARY, 5, True, False)
+    report = verify(keras_model, lite, HELD_OUT)
+    assert report['max_abs_diff'] < TOLERANCE
+    assert report['label_agreement'] == 1.0
+
+    # The saved model predicts the same in a process that never imports TensorFlow
+    path = str(tmp_path / 'lite.npz')
+    lite.save(path)
+    script = ('import sys, numpy as np; from lite_model import LiteSentimentModel; '
+              f'np.save(sys.argv[2], LiteSentimentModel.load(sys.argv[1]).predict({HELD_OUT!r})); '
+              "assert 'tensorflow' not in sys.modules")
+    deployment = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'deployment')
+    subprocess.run([sys.executable, '-c', script, path, str(tmp_path / 'predictions.npy')],
+                   check=True, cwd=deployment, env={**os.environ, 'PYTHONPATH': deployment})
+    np.testing.assert_allclose(np.load(tmp_path / 'predictions.npy'), keras_model.predict(np.array(HELD_OUT, dtype=object), verbose=0),
+                               atol=TOLERANCE)
+
+def test_keras_model_held_out_parity():
+    pytest.importorskip('tensorflow')
+    pytest.importorskip('tensorflow_hub')
+    from batch_predict import MODEL_PATH, load_sentiment_model
+    model_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'deployment', MODEL_PATH)
+    if not os.path.exists(model_path):
+        pytest.skip('The saved Keras model is not unzipped')
+
+    keras_model = load_sentiment_model(model_path)
+    lite = LiteSentimentModel.export(keras_model, model_path)
+    report = verify(keras_model, lite, HELD_OUT)
+    assert report['max_abs_diff'] < 1e-4
@@ -0,0 +1,87 @@
+# Import libraries
+import random
+import numpy as np
+import pandas as pd
+import pytest
+from near_duplicates import BANDS, NearDuplicateIndex, index_exists, minhash, promote_index, shingles
+
+WORDS = ['seat', 'crew', 'meal', 'delay', 'lounge', 'legroom', 'boarding', 'cabin', 'window', 'luggage', 'pilot',
+         'landing', 'blanket', 'pillow', 'coffee', 'wine', 'movie', 'screen', 'gate', 'terminal', 'upgrade', 'refund',
+         'aisle', 'toilet', 'baby', 'queue', 'transfer', 'visa', 'passport', 'smile', 'noise', 'engine']
+
+def review(seed, words=25):
+    rng = random.Random(seed)
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def near_copy(text):
+    # Same review with its last word changed, like an edited resubmission
+    words = text.split()
+    return ' '.join(words[:-1] + ['turbulence'])
+
+def frame(rows):
+    return pd.DataFrame({'id': np.arange(len(rows)), 'airline_name': 'Qatar Airways', 'review': rows})
+
+@pytest.fixture
+def batch():
+    originals = [review(seed) for seed in range(40)]
+    rows = originals + [near_copy(text) for text in originals[:10]] + [originals[20].upper() + '!!']
+    airlines = ['Qatar Airways'] * len(rows)
+
+    # The same review under another airline is not a duplicate
+    rows.append(originals[0])
+    airlines.append('Emirates')
+    return pd.DataFrame({'id': np.arange(len(rows)), 'airline_name': airlines, 'review': rows})
+
+def test_signature_estimates_jaccard():
+    first, second = review(1, 200), review(2, 200)
+    actual = len(shingles(first) & shingles(second)) / len(shingles(first) | shingles(second))
+    estimate = np.mean(minhash(first) == minhash(second))
+    assert abs(estimate - actual) < 0.15
+    assert np.mean(minhash(first) == minhash(near_copy(first))) > 0.8
+
+def test_near_identical_reviews_are_removed(batch):
+    keep, removed = NearDuplicateIndex().deduplicate(batch)
+    assert keep[:40].all()
+    assert not keep[40:51].any()
+    assert keep[51]
+    assert {row[0]: row[2] for row in removed} == {**{40 + i: i for i in range(10)}, 50: 20}
+
+def test_later_batches_are_compared_with_stored_reviews(batch, tmp_path):
+    prefix = str(tmp_path / 'review_minhash')
+    index = NearDuplicateIndex()
+    keep, _ = index.deduplicate(batch.iloc[:40])
+    assert keep.all()
+    index.save(prefix + '_pending')
+    assert not index_exists(prefix)
+    promote_index(prefix + '_pending', prefix)
+
+    keep, removed = NearDuplicateIndex.load(prefix).deduplicate(batch.iloc[40:])
+    assert keep.tolist() == [False] * 11 + [True]
+    assert [row[2] for row in removed] == list(range(10)) + [20]
+
+def test_three_mutual_near_duplicates_keep_the_first():
+    original = review(7)
+    words = original.split()
+    rows = [original, near_copy(original), ' '.join(['runway'] + words[1:-1] + ['turbulence'])]
+    keep, removed = NearDuplicateIndex().deduplicate(frame(rows))
+    assert keep.tolist() == [True, False, False]
+    assert [row[2] for row in removed] == [0, 0]
+
+@pytest.fixture
+def colliding_bands(monkeypatch):
+    # Every review lands in the same bucket of every band, so each band key holds several reviews
+    monkeypatch.setattr(NearDuplicateIndex, 'band_keys',
+                        staticmethod(lambda signatures, airlines: np.zeros((len(signatures), BANDS), dtype='uint64')))
+
+def test_every_review_sharing_a_band_is_compared(colliding_bands, tmp_path):
+    other, original = review(1), review(2)
+    index = NearDuplicateIndex()
+    keep, removed = index.deduplicate(frame([other, original, near_copy(original)]))
+    assert keep.tolist() == [True, True, False]
+    assert removed[0][2] == 1
+
+    # The stored reviews behind one band key are all compared too
+    index.save(str(tmp_path / 'review_minhash'))
+    keep, removed = NearDuplicateIndex.load(str(tmp_path / 'review_minhash')).deduplicate(frame([near_copy(original)]))
+    assert not keep.any()
+    assert removed[0][2] == 1
@@ -0,0 +1,47 @@
+# Import libraries
+import sqlite3
+import itertools
+import types
+import numpy as np
+import pytest
+import prediction_cache
+from prediction_cache import PredictionCache
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Every access gets a later time, so the eviction order does not depend on the clock resolution
+    ticks = itertools.count(1)
+    monkeypatch.setattr(prediction_cache, 'time', types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+def rows(path):
+    with sqlite3.connect(path) as connection:
+        return connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+def test_least_recently_accessed_rows_are_evicted(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = PredictionCache(path, max_entries=0, max_rows=10)
+    texts = [f'review {number}' for number in range(17)]
+    cache.put_many(texts[:10], np.eye(10)[:, :2])
+
+    # Reading the first reviews back keeps them, the unread ones make room for the new reviews
+    assert all(value is not None for value in cache.get_many(texts[:3]))
+    for text in texts[10:]:
+        cache.put_many([text], [[0.0, 1.0]])
+    assert rows(path) == 10
+    assert cache.metrics()['evicted'] == 7
+
+    values = PredictionCache(path).get_many(texts)
+    assert [value is not None for value in values] == [True] * 3 + [False] * 7 + [True] * 7
+    np.testing.assert_array_equal(values[1], [0.0, 1.0])
+
+def test_caches_without_last_access_are_migrated(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with sqlite3.connect(path) as connection:
+        connection.execute('CREATE TABLE cache (key BLOB PRIMARY KEY, value BLOB)')
+        connection.executemany('INSERT INTO cache VALUES (?, ?)',
+                               [(bytes([number]) * 16, np.zeros(2, dtype='float32').tobytes()) for number in range(5)])
+
+    cache = PredictionCache(path, max_rows=3)
+    cache.put_many(['great seat'], [[0.1, 0.9]])
+    assert rows(path) == 3
+    np.testing.assert_allclose(cache.get_many(['great seat'])[0], [0.1, 0.9])
@@ -0,0 +1,81 @@
+# Import libraries
+import numpy as np
+import pandas as pd
+import pytest
+from recommenders import NeighborIndex, RatingMatcher, RATING_COLUMNS, scale_ratings
+
+def brute_force(vectors, k):
+    # Every pair scored, the item itself left out, best first
+    similarity = NeighborIndex._similarity(vectors, vectors)
+    np.fill_diagonal(similarity, -np.inf)
+    order = np.argsort(-similarity, axis=1, kind='stable')[:, :k]
+    return order, np.take_along_axis(similarity, order, axis=1)
+
+@pytest.fixture
+def ratings():
+    rng = np.random.RandomState(20)
+    data = pd.DataFrame(rng.uniform(0, 5, size=(300, len(RATING_COLUMNS))), columns=RATING_COLUMNS)
+    data.insert(0, 'airline_name', [f'airline {i}' for i in range(len(data))])
+    return data
+
+@pytest.mark.parametrize('k, block_size', [(20, 1024), (5, 7), (1000, 64)])
+def test_build_matches_brute_force(ratings, k, block_size):
+    vectors = scale_ratings(ratings)
+    index = NeighborIndex.build(ratings['airline_name'], vectors, k, block_size)
+    neighbors, scores = brute_force(vectors, min(k, len(vectors) - 1))
+    np.testing.assert_array_equal(index.neighbors, neighbors)
+    np.testing.assert_allclose(index.scores, scores, rtol=1e-6)
+
+def test_update_matches_build(ratings):
+    mean = ratings[RATING_COLUMNS].mean().to_numpy()
+    std = ratings[RATING_COLUMNS].std(ddof=0).to_numpy()
+    index = NeighborIndex.build(ratings['airline_name'], scale_ratings(ratings, mean, std), 10)
+
+    # Move some airlines, remove one and add two copies of existing airlines, which tie with them
+    updated = ratings.drop(index=[3]).copy()
+    updated.loc[[10, 50, 120], RATING_COLUMNS] = np.random.RandomState(1).uniform(0, 5, size=(3, len(RATING_COLUMNS)))
+    added = ratings.iloc[:2].copy()
+    added['airline_name'] = ['new airline 1', 'new airline 2']
+    updated = pd.concat([updated, added], ignore_index=True)
+    vectors = scale_ratings(updated, mean, std)
+
+    refreshed = index.update(updated['airline_name'], vectors, ['airline 10', 'airline 50', 'airline 120'], 10)
+    neighbors, scores = brute_force(vectors, 10)
+    np.testing.assert_array_equal(refreshed.neighbors, neighbors)
+    np.testing.assert_allclose(refreshed.scores, scores, rtol=1e-6)
+
+def test_ties_go_to_the_lowest_row(ratings):
+    # Every airline has two exact copies, so most neighbour lists hold ties across the k-th place
+    tied = pd.concat([ratings.iloc[:60]] * 3, ignore_index=True)
+    tied['airline_name'] = [f'airline {i}' for i in range(len(tied))]
+    vectors = scale_ratings(tied)
+    neighbors, scores = brute_force(vectors, 7)
+    for block_size in [1024, 13]:
+        index = NeighborIndex.build(tied['airline_name'], vectors, 7, block_size)
+        np.testing.assert_array_equal(index.neighbors, neighbors)
+
+    # Changed airlines are merged in after the old neighbours, ties are still decided by row
+    changed = tied.copy()
+    changed.loc[[5, 65], RATING_COLUMNS] = changed.loc[[70, 70], RATING_COLUMNS].to_numpy()
+    mean, std = tied[RATING_COLUMNS].mean().to_numpy(), tied[RATING_COLUMNS].std(ddof=0).to_numpy()
+    index = NeighborIndex.build(tied['airline_name'], scale_ratings(tied, mean, std), 7)
+    vectors = scale_ratings(changed, mean, std)
+    refreshed = index.update(changed['airline_name'], vectors, ['airline 5', 'airline 65'], 7)
+    np.testing.assert_array_equal(refreshed.neighbors, brute_force(vectors, 7)[0])
+
+def test_similar_and_save_load(ratings, tmp_path):
+    vectors = scale_ratings(ratings)
+    index = NeighborIndex.build(ratings['airline_name'], vectors, 10)
+    index.save(str(tmp_path / 'rating_neighbors'))
+    loaded = NeighborIndex.load(str(tmp_path / 'rating_neighbors'))
+    neighbors, scores = brute_force(vectors, 5)
+
+    similar = loaded.similar('airline 7', 5)
+    assert similar['Airline'].tolist() == [f'airline {i}' for i in neighbors[7]]
+    np.testing.assert_allclose(similar['Similarity Score'], scores[7], rtol=1e-6)
+
+def test_rating_matcher_without_candidates():
+    matcher = RatingMatcher(['Qatar Airways'], np.zeros(7), np.ones(7), np.ones((1, 7)))
+    assert matcher.top([4, 5, 3, 2, 1, 0, 4], 5, exclude='Qatar Airways').empty
+    positions, scores = matcher.top_batch(np.ones((3, 7)), 0)
+    assert positions.shape == scores.shape == (3, 0)
@@ -0,0 +1,73 @@
+# Import libraries
+import numpy as np
+import pandas as pd
+import pytest
+from storage import (FORMATS, apply_schema, iter_table, list_partitions, read_table, write_table,
+                     write_table_chunks, write_table_partitions)
+
+# Concatenating the all-missing first chunk warns about its dtypes in recent pandas
+pytestmark = pytest.mark.filterwarnings('ignore::FutureWarning')
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Tables are written next to the working directory
+    monkeypatch.chdir(tmp_path)
+
+def reviews(start, rows, seed=0):
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame({'id': np.arange(start, start + rows),
+                         'airline_name': rng.choice(['Qatar Airways', 'Emirates', 'Etihad'], size=rows),
+                         'seat_type': rng.choice(['Economy Class', 'Business Class'], size=rows),
+                         'verified': rng.rand(rows) < 0.5,
+                         'seat_comfort': rng.randint(1, 6, size=rows).astype('float64'),
+                         'aircraft': rng.choice(['A350', 'B777'], size=rows),
+                         'review': [f'review {i}' for i in range(start, start + rows)]})
+
+def null_first_chunks():
+    # Every value of the first chunk is missing, so it alone cannot tell the column types
+    first = reviews(0, 5)
+    for column in first.columns.drop('id'):
+        first[column] = None
+    return [first, reviews(5, 50, seed=1), reviews(55, 50, seed=2)]
+
+def assert_same(actual, expected):
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_categorical=False, check_dtype=False)
+    for column in expected.columns.intersection(['id', 'verified', 'seat_comfort', 'airline_name']):
+        assert actual[column].dtype == expected[column].dtype
+
+@pytest.mark.parametrize('fmt', list(FORMATS))
+def test_write_table_round_trip(fmt):
+    data = reviews(0, 100)
+    write_table(data, 'airline_reviews', fmt)
+    assert_same(read_table('airline_reviews', fmt=fmt), apply_schema(data))
+    assert_same(read_table('airline_reviews', columns=['id', 'airline_name'], fmt=fmt),
+                apply_schema(data[['id', 'airline_name']]))
+
+@pytest.mark.parametrize('fmt', list(FORMATS))
+def test_chunked_round_trip_with_null_first_chunk(fmt):
+    chunks = null_first_chunks()
+    write_table_chunks(iter(chunks), 'airline_reviews', fmt)
+    expected = apply_schema(pd.concat(chunks, ignore_index=True))
+    assert_same(read_table('airline_reviews', fmt=fmt), expected)
+    assert_same(pd.concat(iter_table('airline_reviews', chunk_rows=20, fmt=fmt), ignore_index=True), expected)
+
+@pytest.mark.parametrize('fmt', list(FORMATS))
+def test_partitions_round_trip(fmt):
+    chunks = null_first_chunks()
+    names = write_table_partitions(iter(chunks), 'airline_reviews', lambda chunk: chunk['id'] % 3, 3, fmt)
+    assert list_partitions('airline_reviews') == names
+    expected = apply_schema(pd.concat(chunks, ignore_index=True))
+    actual = read_table('airline_reviews', fmt=fmt)
+    assert_same(actual.sort_values('id'), expected.sort_values('id'))
+    for partition, name in enumerate(names):
+        assert (read_table(name, fmt=fmt)['id'] % 3 == partition).all()
+
+def test_legacy_csv_boolean_strings():
+    # A hand-edited export whose verified column pandas cannot parse as booleans, so it is read back as text
+    with open('airline_reviews.csv', 'w') as f:
+        f.write('id,verified,review\n1,True,great\n2,False,late\n3,,lost bag\n4, true,fine\n5,FALSE ,rude\n')
+    expected = pd.array([True, False, None, True, False], dtype='boolean')
+    pd.testing.assert_extension_array_equal(read_table('airline_reviews', fmt='csv')['verified'].array, expected)
+    chunks = list(iter_table('airline_reviews', chunk_rows=2, fmt='csv'))
+    pd.testing.assert_extension_array_equal(pd.concat(chunks)['verified'].array, expected)